@@ -1,5 +1,6 @@
 from wrappers import *
 from lock import *
+from models import *
 from parsers import *
 from gitautodeploy import *
 from cli import *
\ No newline at end of file
@@ -0,0 +1,271 @@
+import asyncore
+import asynchat
+from StringIO import StringIO
+
+
+class ResponseBuffer(StringIO):
+    """In-memory replacement for a request handler's wfile. Closing it keeps
+    the written data available."""
+
+    def close(self):
+        pass
+
+
+class BufferedRequestHandlerMixIn:
+    """Mix-in for BaseHTTPRequestHandler subclasses that reads the request
+    from a string received by the event loop instead of from a socket, and
+    collects the response in memory."""
+
+    def setup(self):
+        self.rfile = StringIO(self.request)
+        self.wfile = ResponseBuffer()
+
+    def finish(self):
+        pass
+
+
+class Trigger(asyncore.file_dispatcher):
+    """Wakes up the event loop from other threads and runs callbacks in the
+    event loop thread."""
+
+    def __init__(self, map):
+        import os
+        import threading
+
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._read_fd, self._write_fd = os.pipe()
+        asyncore.file_dispatcher.__init__(self, self._read_fd, map)
+
+        # file_dispatcher duplicates the descriptor
+        os.close(self._read_fd)
+
+    def writable(self):
+        return False
+
+    def call(self, callback):
+        """Schedule callback to be run in the event loop thread."""
+        import os
+
+        with self._lock:
+            self._callbacks.append(callback)
+
+        try:
+            os.write(self._write_fd, 'x')
+        except (OSError, TypeError):
+            # The event loop has been closed
+            pass
+
+    def handle_read(self):
+        self.recv(8192)
+
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        import os
+
+        asyncore.file_dispatcher.close(self)
+
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+
+class WebhookChannel(asynchat.async_chat):
+    """Reads one HTTP request from a client connection without blocking and
+    hands it over to the server once it is complete."""
+
+    def __init__(self, server, sock, client_address):
+        asynchat.async_chat.__init__(self, sock, server._map)
+        self.server = server
+        self.client_address = client_address
+        self._buffer = []
+        self._headers_read = False
+        self.set_terminator('\r\n\r\n')
+
+    def collect_incoming_data(self, data):
+        self._buffer.append(data)
+
+    def found_terminator(self):
+        import re
+
+        if self._headers_read:
+            self.request_received()
+            return
+
+        self._buffer.append('\r\n\r\n')
+        self._headers_read = True
+
+        match = re.search(r'\r\ncontent-length:\s*(\d+)', ''.join(self._buffer), re.IGNORECASE)
+        content_length = int(match.group(1)) if match else 0
+
+        if content_length > 0:
+            self.set_terminator(content_length)
+        else:
+            self.request_received()
+
+    def request_received(self):
+        # Stop reading, a connection only carries one request
+        self.set_terminator(None)
+        self.server.handle_complete_request(self, ''.join(self._buffer))
+        self._buffer = []
+
+    def send_response_data(self, data):
+        self.push(data)
+        self.close_when_done()
+
+    def close(self):
+        import socket
+
+        # Explicitly shut down the connection, as the socket might have been
+        # inherited by a subprocess started in the meantime
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        asynchat.async_chat.close(self)
+
+
+class AsyncWebhookServer(asyncore.dispatcher):
+    """HTTP server running on an event loop. A single thread accepts
+    connections and reads and writes request and response data, so slow or
+    idle clients don't tie up a thread each. Complete requests are handled
+    directly in the event loop thread, which is quick when deploys are run as
+    background jobs (detailed-response disabled). Otherwise requests are
+    handled by a pool of worker threads, as the response has to await the
+    git pull and deploy commands."""
+
+    def __init__(self, server_address, RequestHandlerClass, backlog=5, workers=0, reuse_port=False):
+        import socket
+        import threading
+
+        class RequestHandler(BufferedRequestHandlerMixIn, RequestHandlerClass):
+            pass
+
+        self.RequestHandlerClass = RequestHandler
+        self.workers = workers
+        self.requests_handled = 0
+
+        self._map = {}
+        self._queue = None
+        self._threads = []
+        self._shutdown_request = False
+        self._shutdown_done = threading.Event()
+
+        asyncore.dispatcher.__init__(self, map=self._map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        self.bind(server_address)
+        self.listen(backlog)
+
+        self._trigger = Trigger(self._map)
+
+    def handle_accept(self):
+        pair = self.accept()
+
+        if pair is None:
+            return
+
+        sock, client_address = pair
+        WebhookChannel(self, sock, client_address)
+
+    def handle_complete_request(self, channel, data):
+        """Invoked by a channel once a complete request has been read."""
+        if self.workers > 0:
+            if not self._threads:
+                self.start_workers()
+
+            self._queue.put((channel, data))
+            return
+
+        self.respond(channel, self.process_request(data, channel.client_address))
+
+    def process_request(self, data, client_address):
+        """Run the request handler for a request and return the response."""
+        import logging
+        logger = logging.getLogger()
+
+        try:
+            handler = self.RequestHandlerClass(data, client_address, self)
+            return handler.wfile.getvalue()
+
+        except Exception as e:
+            logger.error("Error while handling request from %s:%s: %s" % (client_address[0], client_address[1], e))
+            return 'HTTP/1.0 500 Internal Server Error\r\nContent-Type: text/plain\r\n\r\n'
+
+    def respond(self, channel, response):
+        channel.send_response_data(response)
+        self.requests_handled += 1
+
+    def start_workers(self):
+        from Queue import Queue
+        import threading
+
+        self._queue = Queue()
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.process_request_worker,
+                                      name='gad-worker-%s' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def process_request_worker(self):
+        """Worker thread main loop."""
+        while True:
+            item = self._queue.get()
+
+            # Sentinel value used to stop the worker
+            if item is None:
+                return
+
+            channel, data = item
+            response = self.process_request(data, channel.client_address)
+
+            # The response needs to be sent from the event loop thread
+            self._trigger.call(lambda channel=channel, response=response: self.respond(channel, response))
+
+    def serve_forever(self):
+        """Run the event loop until shutdown() is called."""
+        self._shutdown_done.clear()
+
+        try:
+            while not self._shutdown_request:
+                asyncore.loop(timeout=30, use_poll=True, map=self._map, count=1)
+        finally:
+            self._shutdown_request = False
+            self._shutdown_done.set()
+
+    def handle_request(self):
+        """Run the event loop until one request has been handled and its
+        response sent."""
+        handled = self.requests_handled
+
+        while self.requests_handled == handled or len(self._map) > 2:
+            asyncore.loop(timeout=30, use_poll=True, map=self._map, count=1)
+
+    def shutdown(self):
+        """Stop serve_forever() and wait for it to return."""
+        self._shutdown_request = True
+        self._trigger.call(lambda: None)
+        self._shutdown_done.wait()
+
+    def server_close(self):
+        """Close the listening socket, open connections and stop any worker
+        threads."""
+        for dispatcher in self._map.values():
+            dispatcher.close()
+
+        for thread in self._threads:
+            self._queue.put(None)
+
+        self._threads = []
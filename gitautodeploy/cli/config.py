@@ -15,6 +15,20 @@ def get_config_defaults():
     config['port'] = 8001
     config['intercept-stdout'] = True
 
+    # How connections are handled; 'threaded' (one connection at a time per
+    # worker thread) or 'event' (all connections on one event loop)
+    config['server-engine'] = 'threaded'
+
+    # Number of worker threads handling incoming requests. When set to 0, all
+    # requests are handled one at a time by the listener thread.
+    config['server-workers'] = 0
+
+    # Maximum number of connections waiting to be handled
+    config['server-backlog'] = 5
+
+    # Number of processes accepting connections on the configured port
+    config['server-processes'] = 1
+
     # Record all log levels by default
     config['log-level'] = 'NOTSET'
 
@@ -23,6 +37,63 @@ def get_config_defaults():
     # response.
     config['detailed-response'] = True
 
+    # Number of background threads executing deploy jobs when
+    # detailed-response is disabled
+    config['job-workers'] = 1
+
+    # Number of finished jobs whose status can be queried on /jobs/<id>
+    config['job-history'] = 100
+
+    # Max number of seconds a request waits for another request to finish
+    # processing the same repository (None waits indefinitely)
+    config['lock-timeout'] = None
+
+    # Max number of pull and deploy operations running at the same time (0 is
+    # unlimited), and per group of repositories (group name -> max number)
+    config['max-concurrent-deploys'] = 0
+    config['deploy-groups'] = {}
+
+    # Process repositories with different paths matching the same webhook
+    # request in parallel
+    config['parallel-repositories'] = True
+
+    # Directory keeping a shared bare mirror of each repository, with the
+    # repository paths as worktrees (None clones each repository separately)
+    config['mirror-dir'] = None
+
+    # Number of repositories cloned in parallel at startup
+    config['clone-workers'] = 4
+
+    # Interval (in seconds) of periodic background fetches of each
+    # repository, randomly varied by a fraction of up to prefetch-jitter, with
+    # at most prefetch-workers fetches at a time (0 disables background fetches)
+    config['prefetch-interval'] = 0
+    config['prefetch-jitter'] = 0.1
+    config['prefetch-workers'] = 2
+
+    # Number of bytes of the output of each deploy command included in the
+    # results (0 doesn't include the output)
+    config['deploy-output-size'] = 0
+
+    # Number of deploy steps (structured deploy commands, see the
+    # documentation) executed at the same time
+    config['deploy-jobs'] = 4
+
+    # Seconds after which a git or deploy command is killed, and after which
+    # the whole pull and deploy of a repository is aborted (None for no limit)
+    config['command-timeout'] = None
+    config['deploy-timeout'] = None
+
+    # Resource limits ('cpu', 'address-space', 'open-files'), niceness
+    # increment and I/O scheduling class of git and deploy commands
+    config['deploy-limits'] = {}
+    config['deploy-nice'] = 0
+    config['deploy-ionice'] = None
+
+    # Implementation of the git operations of the minimal pull mode, 'shell'
+    # (git command line client) or 'dulwich' (in-process)
+    config['git-backend'] = 'shell'
+
     # Log incoming webhook requests in a way they can be used as test cases
     config['log-test-case'] = False
     config['log-test-case-dir'] = None
@@ -68,6 +139,18 @@ def get_config_from_environment():
     if 'GAD_PORT' in os.environ:
         config['port'] = int(os.environ['GAD_PORT'])
 
+    if 'GAD_SERVER_ENGINE' in os.environ:
+        config['server-engine'] = os.environ['GAD_SERVER_ENGINE']
+
+    if 'GAD_SERVER_WORKERS' in os.environ:
+        config['server-workers'] = int(os.environ['GAD_SERVER_WORKERS'])
+
+    if 'GAD_SERVER_BACKLOG' in os.environ:
+        config['server-backlog'] = int(os.environ['GAD_SERVER_BACKLOG'])
+
+    if 'GAD_SERVER_PROCESSES' in os.environ:
+        config['server-processes'] = int(os.environ['GAD_SERVER_PROCESSES'])
+
     return config
 
 def get_config_from_argv(argv):
@@ -125,6 +208,26 @@ def get_config_from_argv(argv):
                         dest="port",
                         type=int)
 
+    parser.add_argument("--server-engine",
+                        help="connection handling; threaded or event",
+                        dest="server-engine",
+                        choices=['threaded', 'event'])
+
+    parser.add_argument("--server-workers",
+                        help="number of threads handling requests",
+                        dest="server-workers",
+                        type=int)
+
+    parser.add_argument("--server-backlog",
+                        help="max number of queued connections",
+                        dest="server-backlog",
+                        type=int)
+
+    parser.add_argument("--server-processes",
+                        help="number of processes handling requests",
+                        dest="server-processes",
+                        type=int)
+
     parser.add_argument("--ssl",
                         help="use ssl",
                         dest="ssl",
@@ -230,10 +333,19 @@ def init_config(config):
     """Initialize config by filling out missing values etc."""
 
     import os
-    import re
     import logging
     logger = logging.getLogger()
 
+    try:
+        from gitautodeploy.parsers.common import build_repository_index, get_repo_identity
+        from gitautodeploy.filters import CompiledFilters
+        from gitautodeploy.deploysteps import parse_deploy_steps
+    except ImportError:
+        # Started from within the package directory (python gitautodeploy)
+        from parsers.common import build_repository_index, get_repo_identity
+        from filters import CompiledFilters
+        from deploysteps import parse_deploy_steps
+
     # Translate any ~ in the path into /home/<user>
     if 'pidfilepath' in config and config['pidfilepath']:
         config['pidfilepath'] = os.path.expanduser(config['pidfilepath'])
@@ -241,6 +353,9 @@ def init_config(config):
     if 'logfilepath' in config and config['logfilepath']:
         config['logfilepath'] = os.path.expanduser(config['logfilepath'])
 
+    if config.get('mirror-dir'):
+        config['mirror-dir'] = os.path.expanduser(config['mirror-dir'])
+
     if 'repositories' not in config:
         config['repositories'] = []
 
@@ -262,26 +377,61 @@ def init_config(config):
         if 'global_deploy' in config and len(config['global_deploy']) > 0 and len(config['global_deploy'][0]) is not 0:
             repo_config['deploy_commands'].insert(0, config['global_deploy'][0])
 
-        # Check if any repo specific deploy command is specified
-        if 'deploy' in repo_config:
-            repo_config['deploy_commands'].append(repo_config['deploy'])
+        # Deploy steps with dependencies (structured form)
+        if isinstance(repo_config.get('deploy'), list):
+            pre_deploy = None
+            post_deploy = None
+
+            if 'global_deploy' in config and len(config['global_deploy']) > 0 and len(config['global_deploy'][0]) is not 0:
+                pre_deploy = config['global_deploy'][0]
 
-        # Check if any global post deploy command is specified
-        if 'global_deploy' in config and len(config['global_deploy']) > 1 and len(config['global_deploy'][1]) is not 0:
-            repo_config['deploy_commands'].append(config['global_deploy'][1])
+            if 'global_deploy' in config and len(config['global_deploy']) > 1 and len(config['global_deploy'][1]) is not 0:
+                post_deploy = config['global_deploy'][1]
 
-        # If a repository is configured with embedded credentials, we create an alternate URL
-        # without these credentials that cen be used when comparing the URL with URLs referenced
-        # in incoming web hook requests.
-        if 'url' in repo_config:
-            regexp = re.search(r"^(https?://)([^@]+)@(.+)$", repo_config['url'])
-            if regexp:
-                repo_config['url_without_usernme'] = regexp.group(1) + regexp.group(3)
+            try:
+                repo_config['deploy_steps'] = parse_deploy_steps(repo_config['deploy'], pre_deploy, post_deploy)
+            except ValueError, e:
+                logger.critical("Invalid deploy steps for repository %s: %s" % (repo_config.get('url'), e))
+                raise e
+
+            repo_config['deploy_commands'] = [step['command'] for step in repo_config['deploy_steps']]
+
+        else:
+
+            # Check if any repo specific deploy command is specified
+            if 'deploy' in repo_config:
+                repo_config['deploy_commands'].append(repo_config['deploy'])
+
+            # Check if any global post deploy command is specified
+            if 'global_deploy' in config and len(config['global_deploy']) > 1 and len(config['global_deploy'][1]) is not 0:
+                repo_config['deploy_commands'].append(config['global_deploy'][1])
 
         # Translate any ~ in the path into /home/<user>
         if 'path' in repo_config:
             repo_config['path'] = os.path.expanduser(repo_config['path'])
 
+        # Use the global values of options that can be set per repository,
+        # unless overridden
+        for key in ['git-backend', 'deploy-output-size', 'deploy-jobs', 'command-timeout', 'deploy-timeout',
+                    'deploy-limits', 'deploy-nice', 'deploy-ionice']:
+            if key not in repo_config:
+                repo_config[key] = config.get(key)
+
+        # At least one deploy step has to run at a time
+        deploy_jobs = repo_config['deploy-jobs']
+        if deploy_jobs is not None and (not isinstance(deploy_jobs, int) or deploy_jobs < 1):
+            logger.critical("Invalid deploy-jobs for repository %s: %s" % (repo_config.get('url'), deploy_jobs))
+            raise ValueError("deploy-jobs must be a positive number, not %s" % deploy_jobs)
+
+        # Repositories with the same URL share a bare mirror, and their paths
+        # are worktrees of it
+        if config.get('mirror-dir') and 'path' in repo_config and 'url' in repo_config:
+            identity = get_repo_identity(repo_config['url'])
+
+            if identity:
+                host, owner, name = identity
+                repo_config['mirror_path'] = os.path.join(config['mirror-dir'], host or 'local', owner, name + '.git')
+
         if 'filters' not in repo_config:
             repo_config['filters'] = []
 
@@ -301,6 +451,14 @@ def init_config(config):
 
                 filter['pull_request'] = True
 
+        # Compile the filters once, rather than interpreting them on each request
+        repo_config['compiled_filters'] = CompiledFilters(repo_config['filters'], repo_config.get('path'))
+
+    # Index the repositories by identity (host, owner and name), so that
+    # incoming webhooks can be matched against the config without scanning
+    # all repositories
+    config['repository_index'] = build_repository_index(config['repositories'])
+
     return config
 
 def get_repo_config_from_environment():
@@ -0,0 +1,225 @@
+class RepositoryCloner(object):
+    """Clones missing repositories in a bounded pool of background threads,
+    so that the server can accept webhooks while they are cloned. Requests
+    for a repository that is still being cloned wait for its clone to
+    finish.
+
+    If a state directory is specified, the clone progress is also written to
+    it, so that other processes sharing the directory (e.g. forked before the
+    clones are started, see add()) can wait for the clones as well."""
+
+    # Interval used when waiting for a clone of another process
+    poll_interval = 0.05
+    max_poll_interval = 1
+
+    def __init__(self, clone, workers=4, state_dir=None):
+        import threading
+
+        self.workers = max(1, workers)
+        self.state_dir = state_dir
+
+        # Function cloning a repository config, returning True on success
+        self._clone = clone
+
+        self._lock = threading.Lock()
+        self._states = {}
+        self._events = {}
+        self._order = []
+        self._queue = []
+        self._threads = []
+
+        # Set in the process cloning the repositories
+        self._cloning = False
+
+    def start(self, repo_configs):
+        """Start cloning the specified repository configs."""
+        self.add(repo_configs)
+        self.start_workers()
+
+    def add(self, repo_configs):
+        """Queue the specified repository configs, without starting to clone
+        them yet."""
+        import threading
+
+        with self._lock:
+            for repo_config in repo_configs:
+                path = repo_config['path']
+
+                if path in self._states:
+                    continue
+
+                # The URL is left out, since it may include credentials
+                self._states[path] = {'path': path, 'state': 'queued', 'started_at': None, 'finished_at': None}
+                self._events[path] = threading.Event()
+                self._order.append(path)
+                self._queue.append(repo_config)
+
+                # Keep the progress recorded by other processes
+                if not self.load_state(path):
+                    self.save_state(self._states[path])
+
+    def start_workers(self):
+        """Start cloning the queued repository configs, except those another
+        process sharing the state directory has cloned already (e.g. before
+        it was restarted)."""
+        import threading
+
+        with self._lock:
+            self._cloning = True
+
+            for repo_config in list(self._queue):
+                state = self.load_state(repo_config['path'])
+
+                if state and state['state'] in ['cloned', 'failed']:
+                    self._states[repo_config['path']] = state
+                    self._events[repo_config['path']].set()
+                    self._queue.remove(repo_config)
+
+            for i in range(min(self.workers, len(self._queue))):
+                thread = threading.Thread(target=self.worker, name='gad-clone-worker-%s' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def worker(self):
+        """Worker thread main loop. Exits when there is nothing left to
+        clone."""
+        import time
+        import logging
+        logger = logging.getLogger()
+
+        while True:
+            with self._lock:
+                if not self._queue:
+                    return
+
+                repo_config = self._queue.pop(0)
+                state = self._states[repo_config['path']]
+                state['state'] = 'cloning'
+                state['started_at'] = time.time()
+                self.save_state(state)
+
+            try:
+                success = self._clone(repo_config)
+            except Exception as e:
+                logger.error("Unable to clone %s: %s" % (repo_config['url'], e))
+                success = False
+
+            with self._lock:
+                state['state'] = 'cloned' if success else 'failed'
+                state['finished_at'] = time.time()
+                self.save_state(state)
+
+            self._events[repo_config['path']].set()
+
+    def wait(self, repo_config, timeout=None):
+        """Wait for the clone of a repository config to finish, if it is
+        queued or being cloned. Returns False if the clone failed or didn't
+        finish in time."""
+        event = self._events.get(repo_config.get('path'))
+
+        if event is None:
+            return True
+
+        if self.state_dir and not self._cloning:
+            return self.wait_shared(repo_config['path'], timeout)
+
+        # Event.wait() returns None in Python < 2.7
+        event.wait(timeout)
+
+        if not event.is_set():
+            return False
+
+        return self._states[repo_config['path']]['state'] == 'cloned'
+
+    def wait_shared(self, path, timeout=None):
+        """Wait for a clone of another process to finish, by polling its
+        state in the state directory."""
+        import time
+
+        deadline = None if timeout is None else time.time() + timeout
+        interval = self.poll_interval
+
+        while True:
+            state = self.load_state(path)
+
+            if state and state['state'] in ['cloned', 'failed']:
+                return state['state'] == 'cloned'
+
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+            if deadline is not None:
+                interval = min(interval, deadline - time.time())
+
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def get_state_path(self, path):
+        import os
+        import hashlib
+
+        return os.path.join(self.state_dir, '%s.json' % hashlib.sha1(path).hexdigest())
+
+    def save_state(self, state):
+        """Write the clone state of a repository to the state directory (if
+        any)."""
+        import os
+        import json
+
+        if not self.state_dir:
+            return
+
+        state_path = self.get_state_path(state['path'])
+
+        # Write to a temporary file first, so that readers never see a
+        # partially written file
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+
+        os.rename(state_path + '.tmp', state_path)
+
+    def load_state(self, path):
+        """Read the clone state of a repository from the state directory.
+        Returns None if unknown."""
+        import json
+
+        if not self.state_dir:
+            return None
+
+        try:
+            with open(self.get_state_path(path)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def join(self):
+        """Wait for all clones to finish."""
+        for thread in list(self._threads):
+            thread.join()
+
+    def is_ready(self):
+        """Check if all clones have finished (successfully or not)."""
+        return self.get_status()['ready']
+
+    def get_status(self):
+        """Clone progress, used by the readiness endpoint."""
+        with self._lock:
+            states = [dict(self._states[path]) for path in self._order]
+
+        if self.state_dir and not self._cloning:
+            states = [self.load_state(state['path']) or state for state in states]
+
+        counts = {}
+        for state in states:
+            counts[state['state']] = counts.get(state['state'], 0) + 1
+
+        return {
+            'ready': all(state['state'] in ['cloned', 'failed'] for state in states),
+            'total': len(states),
+            'queued': counts.get('queued', 0),
+            'cloning': counts.get('cloning', 0),
+            'cloned': counts.get('cloned', 0),
+            'failed': counts.get('failed', 0),
+            'repositories': states
+        }
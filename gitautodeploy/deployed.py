@@ -0,0 +1,61 @@
+def get_config_key(repo_config):
+    """Identify what a repository config deploys, by its URL, deploy
+    commands and release link. Configs sharing a path but deploying
+    differently (e.g. depending on filters) have different keys."""
+    import json
+    import hashlib
+
+    return hashlib.sha1(json.dumps([repo_config.get('url'),
+                                    repo_config.get('deploy_commands'),
+                                    repo_config.get('release-link')])).hexdigest()
+
+
+class DeployedCommit(object):
+    """The last commit successfully deployed by a repository config. It is
+    kept in a file (status_deployed) in the repository path, next to the
+    status_running lock, so that it is shared between server processes and
+    survives restarts. The file holds the commits of all repository configs
+    using the path, keyed by their URL, deploy commands and release link,
+    and is only written while the status_running lock is held."""
+
+    file_name = 'status_deployed'
+
+    def __init__(self, repo_config):
+        import os
+
+        self.path = os.path.join(repo_config['path'], self.file_name)
+        self.key = get_config_key(repo_config)
+
+    def read(self):
+        import json
+
+        try:
+            with open(self.path) as f:
+                commits = json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+        return commits if isinstance(commits, dict) else {}
+
+    def get(self):
+        """The id of the deployed commit, or None if unknown."""
+        return self.read().get(self.key)
+
+    def set(self, commit):
+        """Record the deployed commit (None if unknown)."""
+        import os
+        import json
+
+        commits = self.read()
+
+        if commit:
+            commits[self.key] = commit
+        else:
+            commits.pop(self.key, None)
+
+        # Write to a temporary file first, so that readers never see a
+        # partially written file
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(commits, f)
+
+        os.rename(self.path + '.tmp', self.path)
@@ -0,0 +1,72 @@
+class DeployQueueState(object):
+    """Queue state of a single repository config and branch."""
+
+    def __init__(self, condition):
+        self.condition = condition
+        self.running = False
+        self.pending = None
+        self.coalesced = 0
+
+
+class DeployQueue(object):
+    """Serializes the deploys of each repository config and branch, and
+    coalesces events that arrive while a deploy is running. At most one event
+    waits for the running deploy to finish, and an event arriving while
+    another one is waiting replaces (supersedes) it. A burst of events therefore results
+    in at most two deploys, the last of which handles the newest event."""
+
+    def __init__(self):
+        import threading
+
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def run(self, key, target, *args, **kwargs):
+        """Run target(*args, **kwargs) once no other deploy is running for
+        key. Returns a tuple (result, coalesced), where coalesced is the
+        number of superseded events handled by this deploy, or (None, None)
+        if this event was superseded by a newer one before it could run."""
+        import threading
+
+        with self._lock:
+            if key not in self._states:
+                self._states[key] = DeployQueueState(threading.Condition(self._lock))
+            state = self._states[key]
+
+            coalesced = 0
+
+            # Wait for the running deploy (or a previously waiting event) to
+            # finish, unless a newer event supersedes this one first
+            if state.running or state.pending:
+                ticket = object()
+
+                if state.pending:
+                    state.coalesced += 1
+
+                state.pending = ticket
+                state.condition.notify_all()
+
+                while state.running and state.pending is ticket:
+                    state.condition.wait()
+
+                if state.pending is not ticket:
+                    return None, None
+
+                state.pending = None
+                coalesced = state.coalesced
+                state.coalesced = 0
+
+            state.running = True
+
+        try:
+            return target(*args, **kwargs), coalesced
+
+        finally:
+            with self._lock:
+                state.running = False
+
+                if state.pending:
+                    state.condition.notify_all()
+                else:
+                    del self._states[key]
+
@@ -0,0 +1,131 @@
+# Names of the steps running the global pre- and post-deploy commands, which
+# can't be used by other steps
+PRE_DEPLOY_STEP = 'global pre-deploy'
+POST_DEPLOY_STEP = 'global post-deploy'
+
+
+def parse_deploy_steps(steps_config, pre_deploy=None, post_deploy=None):
+    """Parse the structured form of the deploy commands of a repository
+    config, a list of steps like {"name": "assets", "command": "make assets",
+    "depends": ["install"]}. A global pre-deploy command becomes a step all
+    other steps depend on, and a global post-deploy command a step depending
+    on all other steps. Raises ValueError if the steps are invalid."""
+
+    steps = []
+
+    for index, step_config in enumerate(steps_config):
+        if not isinstance(step_config, dict) or not step_config.get('command'):
+            raise ValueError("Deploy step %s has no command" % (index + 1))
+
+        depends = step_config.get('depends', [])
+        if not isinstance(depends, list):
+            depends = [depends]
+
+        steps.append({'name': step_config.get('name') or step_config['command'],
+                      'command': step_config['command'],
+                      'depends': depends})
+
+    names = [step['name'] for step in steps]
+
+    for step in steps:
+        if step['name'] in [PRE_DEPLOY_STEP, POST_DEPLOY_STEP]:
+            raise ValueError("Deploy step name '%s' is reserved" % step['name'])
+
+        if names.count(step['name']) > 1:
+            raise ValueError("Deploy step name '%s' is not unique" % step['name'])
+
+        for name in step['depends']:
+            if name not in names:
+                raise ValueError("Deploy step '%s' depends on unknown step '%s'" % (step['name'], name))
+
+    # Detect dependency cycles by resolving the steps in dependency order
+    resolved = set()
+    while len(resolved) < len(steps):
+        ready = [step['name'] for step in steps if step['name'] not in resolved and set(step['depends']) <= resolved]
+
+        if not ready:
+            raise ValueError("Deploy steps %s have circular dependencies" % ', '.join(sorted(set(names) - resolved)))
+
+        resolved.update(ready)
+
+    if pre_deploy:
+        for step in steps:
+            step['depends'].insert(0, PRE_DEPLOY_STEP)
+        steps.insert(0, {'name': PRE_DEPLOY_STEP, 'command': pre_deploy, 'depends': []})
+
+    if post_deploy:
+        steps.append({'name': POST_DEPLOY_STEP, 'command': post_deploy, 'depends': [step['name'] for step in steps]})
+
+    return steps
+
+
+class DeployStepsExecutor(object):
+    """Executes deploy steps once the steps they depend on have succeeded,
+    up to jobs steps at the same time. Steps depending on a step that failed
+    (or was skipped) are skipped."""
+
+    def __init__(self, steps, jobs=4):
+        self.steps = steps
+        self.jobs = max(1, jobs)
+
+    def run(self, execute):
+        """Execute the steps by calling execute(step), which returns an exit
+        code. Returns the result of each step, in the order of the steps."""
+        import time
+        import threading
+        import logging
+        logger = logging.getLogger()
+
+        condition = threading.Condition(threading.Lock())
+        started = time.time()
+        results = dict((step['name'], {'name': step['name'], 'status': 'pending', 'exit_code': None,
+                                       'started': None, 'duration': None}) for step in self.steps)
+        pending = list(self.steps)
+        running = [0]
+
+        def worker(step):
+            result = results[step['name']]
+            step_started = time.time()
+
+            try:
+                exit_code = execute(step)
+            except Exception as e:
+                logger.error("Deploy step '%s' failed: %s" % (step['name'], e))
+                exit_code = None
+
+            with condition:
+                result['exit_code'] = exit_code
+                result['status'] = 'succeeded' if exit_code == 0 else 'failed'
+                result['duration'] = time.time() - step_started
+                running[0] -= 1
+                condition.notify_all()
+
+            logger.info("Deploy step '%s' %s in %.2f s" % (step['name'], result['status'], result['duration']))
+
+        with condition:
+            while pending or running[0]:
+                progress = False
+
+                for step in list(pending):
+                    states = [results[name]['status'] for name in step['depends']]
+
+                    if 'failed' in states or 'skipped' in states:
+                        logger.warning("Skipping deploy step '%s', since a step it depends on failed" % step['name'])
+                        results[step['name']]['status'] = 'skipped'
+                        pending.remove(step)
+                        progress = True
+
+                    elif all(state == 'succeeded' for state in states) and running[0] < self.jobs:
+                        results[step['name']]['status'] = 'running'
+                        results[step['name']]['started'] = time.time() - started
+                        pending.remove(step)
+                        running[0] += 1
+                        progress = True
+
+                        thread = threading.Thread(target=worker, args=(step,))
+                        thread.start()
+
+                if not progress:
+                    condition.wait()
+
+        return [results[step['name']] for step in self.steps]
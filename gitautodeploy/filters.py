@@ -0,0 +1,208 @@
+class CompiledFilters(object):
+    """The filters of a repository config, compiled once when the config is
+    loaded. All filters must match a request, and all options within a
+    filter must match, so the filters are flattened into one list of
+    conditions (duplicates removed) with pre-split payload paths. Matching a
+    request then only walks the payload and compares values, and stops at the
+    first condition that does not match.
+
+    Options with value None are ignored, options with value True only require
+    the payload path to exist, and an 'action' option also matches the action
+    reported by the service parser (legacy behaviour).
+
+    The 'changed-paths' option is not looked up in the payload. It holds glob
+    patterns which at least one file changed by the push must match. Its
+    patterns are compiled into a single regular expression, and it is
+    evaluated after all payload conditions. Only the files listed in the
+    payload are known when a request is matched. If they aren't listed, the
+    option is evaluated again once the pushed commits are fetched (see
+    match_changed_paths())."""
+
+    def __init__(self, filter_configs, path=None):
+        self.conditions = []
+        self.changed_paths = []
+
+        # Local repository path, used to look up changed files when the
+        # payload doesn't list them
+        self.path = path
+
+        added = set()
+        for filter_config in filter_configs:
+            for key, value in filter_config.iteritems():
+
+                # Ignore filters with value None (let them pass)
+                if value == None:
+                    continue
+
+                # Skip conditions already required by another filter
+                try:
+                    if (key, value) in added:
+                        continue
+                    added.add((key, value))
+                except TypeError:
+                    # Unhashable (list or dict) value
+                    pass
+
+                if key == 'changed-paths':
+                    patterns = [value] if isinstance(value, basestring) else value
+                    self.changed_paths.append((patterns, compile_globs(patterns)))
+                    continue
+
+                self.conditions.append((key,
+                                        tuple(key.split('.')),
+                                        value,
+                                        value == True,
+                                        key == 'action'))
+
+    def match(self, request, action):
+        """Returns True if the request matches all conditions."""
+        payload = request.payload
+
+        for key, path, value, any_value, is_action in self.conditions:
+
+            # Support for earlier version so it's non-breaking functionality
+            if is_action and value == action:
+                continue
+
+            # If the path is not valid the filter does not match
+            node_value = payload
+            for node_key in path:
+                try:
+                    node_value = node_value[node_key]
+                except (KeyError, TypeError, IndexError):
+                    return False
+
+            if any_value or value == node_value:
+                continue
+
+            return False
+
+        return self.match_changed_paths(request)
+
+    def match_changed_paths(self, request, fetched=False):
+        """Returns True if the files changed by the push match all
+        'changed-paths' conditions. With fetched set to True, files not
+        listed in the payload are looked up in the local repository."""
+        if not self.changed_paths:
+            return True
+
+        files = request.get_changed_files(self.path if fetched else None)
+
+        # Let the filter pass if the changed files can't be determined
+        if files is None:
+            return True
+
+        for patterns, regex in self.changed_paths:
+            for name in files:
+                if regex.match(name):
+                    break
+            else:
+                return False
+
+        return True
+
+    def explain(self, request, action):
+        """Describe why a request does not match. Only used for logging, so
+        that matching itself doesn't need to build any strings."""
+        payload = request.payload
+
+        for key, path, value, any_value, is_action in self.conditions:
+
+            if is_action and value == action:
+                continue
+
+            node_value = payload
+            for node_key in path:
+                try:
+                    node_value = node_value[node_key]
+                except (KeyError, TypeError, IndexError):
+                    return "Filter '%s' does not match since the path is invalid" % key
+
+            if any_value or value == node_value:
+                continue
+
+            node_value = str(node_value)
+            return "Filter '%s' does not match ('%s' != '%s')" % (key, value, (node_value[:75] + '..') if len(node_value) > 75 else node_value)
+
+        return self.explain_changed_paths(request)
+
+    def explain_changed_paths(self, request, fetched=False):
+        """Describe why the files changed by the push do not match (see
+        match_changed_paths())."""
+        if not self.changed_paths:
+            return
+
+        files = request.get_changed_files(self.path if fetched else None)
+
+        for patterns, regex in self.changed_paths:
+            if files is None or any(regex.match(name) for name in files):
+                continue
+
+            return "Filter 'changed-paths' does not match (none of the %s changed files match %s)" % (len(files), ', '.join(patterns))
+
+
+def compile_globs(patterns):
+    """Compile glob patterns into one regular expression matching paths
+    relative to the repository root. '*' and '?' don't match '/', while '**'
+    matches any number of directories. A pattern ending with '/' matches
+    everything below that directory."""
+    import re
+
+    expressions = []
+
+    for pattern in patterns:
+        pattern = pattern.lstrip('/')
+
+        if pattern.endswith('/'):
+            pattern += '**'
+
+        i, n = 0, len(pattern)
+        expression = ''
+
+        while i < n:
+            c = pattern[i]
+
+            if pattern.startswith('**/', i):
+                expression += '(?:.*/)?'
+                i += 3
+                continue
+
+            if pattern.startswith('**', i):
+                expression += '.*'
+                i += 2
+                continue
+
+            if c == '*':
+                expression += '[^/]*'
+
+            elif c == '?':
+                expression += '[^/]'
+
+            elif c == '[' and pattern.find(']', i + 1) != -1:
+                j = pattern.find(']', i + 1)
+                chars = pattern[i + 1:j]
+
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+
+                expression += '[' + chars.replace('\\', '\\\\') + ']'
+                i = j
+
+            else:
+                expression += re.escape(c)
+
+            i += 1
+
+        expressions.append(expression)
+
+    return re.compile('(?:%s)\\Z' % '|'.join(expressions))
+
+
+def get_compiled_filters(repo_config):
+    """Get the compiled filters of a repository config."""
+
+    # Filters are normally compiled when the config is initialized
+    if 'compiled_filters' not in repo_config:
+        repo_config['compiled_filters'] = CompiledFilters(repo_config.get('filters', []), repo_config.get('path'))
+
+    return repo_config['compiled_filters']
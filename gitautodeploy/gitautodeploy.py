@@ -18,6 +18,29 @@ class GitAutoDeploy(object):
     _config = {}
     _port = None
     _pid = None
+    _job_queue = None
+    _deploy_queue = None
+    _scheduler = None
+    _cloner = None
+    _prefetcher = None
+    _job_state_dir = None
+    _slot_dir = None
+    _clone_state_dir = None
+
+    # Worker processes (PID -> worker id) when using multiple server processes
+    _workers = {}
+
+    # Set in worker processes
+    _worker_id = None
+
+    # Delay before restarting a worker process that exited, doubled after
+    # each restart up to the maximum. A worker that keeps exiting within
+    # worker_stable_time seconds is restarted at most max_worker_restarts
+    # times in a row.
+    worker_restart_delay = 1
+    max_worker_restart_delay = 60
+    worker_stable_time = 60
+    max_worker_restarts = 10
 
     def __new__(cls, *args, **kwargs):
         """Overload constructor to enable singleton access"""
@@ -83,17 +106,22 @@ class GitAutoDeploy(object):
         return mpid
 
     def clone_all_repos(self):
-        """Iterates over all configured repositories and clones them to their
-        configured paths."""
+        """Iterates over all configured repositories and clones the missing
+        ones to their configured paths, in a pool of background threads.
+        With multiple server processes, the missing repositories are only
+        queued, and cloned by the first worker process."""
         import os
-        import re
+        import shutil
+        import tempfile
         import logging
-        from wrappers import GitWrapper
+        from cloner import RepositoryCloner
         logger = logging.getLogger()
 
         if not 'repositories' in self._config:
             return
 
+        missing = []
+
         # Iterate over all configured repositories
         for repo_config in self._config['repositories']:
 
@@ -111,17 +139,108 @@ class GitAutoDeploy(object):
 
             if os.path.isdir(repo_config['path']) and os.path.isdir(repo_config['path']+'/.git'):
                 logger.debug("Repository %s already present" % repo_config['url'])
+
+                # Keep using a separate clone made before enabling mirrors
+                if 'mirror_path' in repo_config:
+                    logger.warning("Repository %s is not a worktree of %s, it will not use the shared mirror" % (repo_config['path'], repo_config['mirror_path']))
+                    del repo_config['mirror_path']
+
+                continue
+
+            # Worktrees have a .git file rather than a directory
+            if os.path.isdir(repo_config['path']) and os.path.isfile(repo_config['path']+'/.git'):
+                logger.debug("Repository %s already present" % repo_config['url'])
                 continue
 
             logger.info("Repository %s not present and needs to be cloned" % repo_config['url'])
+            missing.append(repo_config)
 
-            # Clone repository
-            ret = GitWrapper.clone(url=repo_config['url'], branch=repo_config['branch'], path=repo_config['path'])
+        if not missing:
+            return
 
-            if ret == 0 and os.path.isdir(repo_config['path']):
-                logger.info("Repository %s successfully cloned" % repo_config['url'])
+        if self._config['server-processes'] <= 1:
+            self._cloner = RepositoryCloner(self.clone_repo, workers=self._config['clone-workers'])
+            self._cloner.start(missing)
+            return
+
+        # Let all worker processes wait for the clones. States left from
+        # before a restart don't apply anymore.
+        if self._clone_state_dir:
+            shutil.rmtree(self._clone_state_dir, ignore_errors=True)
+
+        self._clone_state_dir = tempfile.mkdtemp(prefix='gad-clones-')
+        self._cloner = RepositoryCloner(self.clone_repo, workers=self._config['clone-workers'],
+                                        state_dir=self._clone_state_dir)
+        self._cloner.add(missing)
+
+    def clone_repo(self, repo_config):
+        """Clones a single repository. Returns True on success."""
+        import os
+        import logging
+        from wrappers import GitWrapper, ProcessWrapper
+        logger = logging.getLogger()
+
+        # Clone repository, with the limits of its pull and deploy, so that
+        # a hung clone doesn't keep the requests waiting for it forever
+        with ProcessWrapper.get_repo_limits(repo_config):
+            if 'mirror_path' in repo_config:
+                ret = GitWrapper.clone_worktree(repo_config)
             else:
-                logger.error("Unable to clone %s branch of repository %s" % (repo_config['branch'], repo_config['url']))
+                ret = GitWrapper.clone(url=repo_config['url'], branch=repo_config['branch'], path=repo_config['path'])
+
+        if ret == 0 and os.path.isdir(repo_config['path']):
+            logger.info("Repository %s successfully cloned" % repo_config['url'])
+            return True
+
+        logger.error("Unable to clone %s branch of repository %s" % (repo_config['branch'], repo_config['url']))
+        return False
+
+    def start_prefetcher(self):
+        """Start fetching the configured repositories periodically in the
+        background, if enabled."""
+        from prefetcher import RepositoryPrefetcher
+        from httpserver import WebhookRequestHandler
+
+        repo_configs = [repo_config for repo_config in self._config.get('repositories', [])
+                        if 'path' in repo_config and 'url' in repo_config]
+
+        if not self._config['prefetch-interval'] and not any(repo_config.get('prefetch-interval') for repo_config in repo_configs):
+            return
+
+        if not self._prefetcher:
+            self._prefetcher = RepositoryPrefetcher(self.prefetch_repo,
+                                                    interval=self._config['prefetch-interval'],
+                                                    jitter=self._config['prefetch-jitter'],
+                                                    workers=self._config['prefetch-workers'])
+
+        self._prefetcher.start(repo_configs)
+        WebhookRequestHandler._prefetcher = self._prefetcher
+
+    def prefetch_repo(self, repo_config):
+        """Fetches a single repository in the background. Returns the exit
+        code, or None if the repository is still being cloned or deployed."""
+        import os
+        from wrappers import GitWrapper, ProcessWrapper
+        from lock import Lock
+
+        if self._cloner and not self._cloner.wait(repo_config, 0):
+            return None
+
+        if not os.path.exists(os.path.join(repo_config['path'], '.git')):
+            return None
+
+        # Don't fetch while a deploy of the repository is running
+        running_lock = Lock(os.path.join(repo_config['path'], 'status_running'))
+
+        if not running_lock.obtain():
+            return None
+
+        try:
+            with ProcessWrapper.get_repo_limits(repo_config):
+                return GitWrapper.prefetch(repo_config)
+
+        finally:
+            running_lock.release()
 
     def ssh_key_scan(self):
         import re
@@ -194,7 +313,22 @@ class GitAutoDeploy(object):
         import logging
         logger = logging.getLogger()
         logger.info('Goodbye')
-        self.remove_pid_file()
+
+        # Only the main process owns the pid file and job state
+        if self._worker_id is None:
+            self.remove_pid_file()
+
+            import shutil
+
+            if self._job_state_dir:
+                shutil.rmtree(self._job_state_dir, ignore_errors=True)
+
+            if self._slot_dir:
+                shutil.rmtree(self._slot_dir, ignore_errors=True)
+
+            if self._clone_state_dir:
+                shutil.rmtree(self._clone_state_dir, ignore_errors=True)
+
         if 'intercept-stdout' in self._config and self._config['intercept-stdout']:
             sys.stdout = self._default_stdout
             sys.stderr = self._default_stderr
@@ -239,12 +373,15 @@ class GitAutoDeploy(object):
     def setup(self, config):
         """Setup an instance of GAD based on the provided config object."""
         import sys
-        from BaseHTTPServer import HTTPServer
         import socket
         import os
         import logging
+        import tempfile
         from lock import Lock
         from httpserver import WebhookRequestHandler
+        from jobs import JobQueue
+        from deployqueue import DeployQueue
+        from scheduler import DeployScheduler
 
         # Attatch config values to this instance
         self._config = config
@@ -281,6 +418,10 @@ class GitAutoDeploy(object):
             fileHandler.setFormatter(logFormatter)
             logger.addHandler(fileHandler)
 
+        if self._config['server-processes'] > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            logger.error('Multiple server processes are not supported on this platform (SO_REUSEPORT is missing)')
+            self._config['server-processes'] = 1
+
         if 'ssh-keyscan' in self._config and self._config['ssh-keyscan']:
             logger.info('Scanning repository hosts for ssh keys...')
             self.ssh_key_scan()
@@ -289,9 +430,6 @@ class GitAutoDeploy(object):
             logger.info('Attempting to kill any other process currently occupying port %s' % self._config['port'])
             self.kill_conflicting_processes()
 
-        # Clone all repos once initially
-        self.clone_all_repos()
-
         # Set default stdout and stderr to our logging interface (that writes
         # to file and console depending on user preference)
         if 'intercept-stdout' in self._config and self._config['intercept-stdout']:
@@ -315,26 +453,54 @@ class GitAutoDeploy(object):
             # Do we have a physical repository?
             if 'path' in repo_config:
                 Lock(os.path.join(repo_config['path'], 'status_running')).clear()
-                Lock(os.path.join(repo_config['path'], 'status_waiting')).clear()
 
         try:
+            # Jobs (and their history) are kept when the server is restarted
+            if not self._job_queue:
+
+                # Share the job status between all processes
+                if self._config['server-processes'] > 1:
+                    self._job_state_dir = tempfile.mkdtemp(prefix='gad-jobs-')
+
+                self._job_queue = JobQueue(workers=self._config['job-workers'],
+                                           history=self._config['job-history'],
+                                           state_dir=self._job_state_dir)
+
+            if not self._deploy_queue:
+                self._deploy_queue = DeployQueue()
+
+            if not self._scheduler:
+
+                # Apply the deploy limits across all processes
+                if self._config['server-processes'] > 1:
+                    self._slot_dir = tempfile.mkdtemp(prefix='gad-slots-')
+
+                self._scheduler = DeployScheduler(max_deploys=self._config['max-concurrent-deploys'],
+                                                  group_limits=self._config['deploy-groups'],
+                                                  slot_dir=self._slot_dir)
+
             WebhookRequestHandler._config = self._config
-            self._server = HTTPServer((self._config['host'],
-                                       self._config['port']),
-                                      WebhookRequestHandler)
-
-            if 'ssl' in self._config and self._config['ssl']:
-                import ssl
-                logger.info("enabling ssl")
-                self._server.socket = ssl.wrap_socket(self._server.socket,
-                                                      certfile=os.path.expanduser(self._config['ssl-pem']),
-                                                      server_side=True)
+            WebhookRequestHandler._job_queue = self._job_queue
+            WebhookRequestHandler._deploy_queue = self._deploy_queue
+            WebhookRequestHandler._scheduler = self._scheduler
+
+            self._server = self.create_server(self._config['port'], reuse_port=self._config['server-processes'] > 1)
+
             sa = self._server.socket.getsockname()
             logger.info("Listening on %s port %s", sa[0], sa[1])
 
             # Actual port bound to (nessecary when OS picks randomly free port)
             self._port = sa[1]
 
+            # Clone all missing repos once initially, while accepting webhooks
+            self.clone_all_repos()
+            WebhookRequestHandler._cloner = self._cloner
+
+            # With multiple server processes, the first worker process fetches
+            # in the background
+            if self._config['server-processes'] <= 1:
+                self.start_prefetcher()
+
         except socket.error, e:
 
             logger.critical("Error on socket: %s" % e)
@@ -342,6 +508,170 @@ class GitAutoDeploy(object):
 
             sys.exit(1)
 
+    def create_server(self, port, reuse_port=False):
+        """Create a server bound to the configured host and the specified
+        port, using the configured server engine."""
+        import os
+        import sys
+        import logging
+        from httpserver import WebhookRequestHandler, WebhookHTTPServer, ThreadPoolHTTPServer
+        logger = logging.getLogger()
+
+        server_address = (self._config['host'], port)
+
+        # Handle connections on an event loop?
+        if self._config['server-engine'] == 'event':
+            from asyncserver import AsyncWebhookServer
+
+            # Awaiting the pull and deploy commands on the event loop thread
+            # would stall all other connections
+            if self._config.get('detailed-response') and not self._config.get('server-workers'):
+                logger.critical("The event server engine requires server-workers to be set when detailed-response is enabled")
+                sys.exit(1)
+
+            logger.info("Handling requests using an event loop")
+            server = AsyncWebhookServer(server_address,
+                                        WebhookRequestHandler,
+                                        backlog=self._config['server-backlog'],
+                                        workers=self._config['server-workers'],
+                                        reuse_port=reuse_port)
+
+        # Handle requests concurrently in a pool of worker threads?
+        elif 'server-workers' in self._config and self._config['server-workers'] > 0:
+            logger.info("Handling requests using %s worker threads" % self._config['server-workers'])
+            server = ThreadPoolHTTPServer(server_address,
+                                          WebhookRequestHandler,
+                                          backlog=self._config['server-backlog'],
+                                          workers=self._config['server-workers'],
+                                          reuse_port=reuse_port)
+        else:
+            server = WebhookHTTPServer(server_address,
+                                       WebhookRequestHandler,
+                                       backlog=self._config['server-backlog'],
+                                       reuse_port=reuse_port)
+
+        if 'ssl' in self._config and self._config['ssl'] and self._config['server-engine'] == 'event':
+            logger.critical("SSL is not supported by the event server engine")
+            sys.exit(1)
+
+        if 'ssl' in self._config and self._config['ssl']:
+            import ssl
+            logger.info("enabling ssl")
+            server.socket = ssl.wrap_socket(server.socket,
+                                            certfile=os.path.expanduser(self._config['ssl-pem']),
+                                            server_side=True)
+
+        return server
+
+    def start_worker_process(self, worker_id, inherit_server=False):
+        """Fork a worker process handling requests on the server port. All
+        workers listen on their own socket bound to the same port
+        (SO_REUSEPORT), which lets the kernel distribute incoming connections
+        between them. The first worker inherits the socket of the parent
+        process."""
+        import os
+        import socket
+        import logging
+        logger = logging.getLogger()
+
+        pid = os.fork()
+
+        if pid != 0:
+            self._workers[pid] = worker_id
+            return pid
+
+        # Worker process
+        self._worker_id = worker_id
+        self._workers = {}
+
+        # The worker process must never return into the code of the parent
+        status = 1
+
+        try:
+            if not inherit_server:
+                self._server.server_close()
+                self._server = self.create_server(self._port, reuse_port=True)
+
+            logger.info("Worker process %s (PID %s) started" % (worker_id, os.getpid()))
+
+            # The first worker process clones the missing repositories, and
+            # fetches in the background
+            if worker_id == 0:
+                if self._cloner:
+                    self._cloner.start_workers()
+
+                self.start_prefetcher()
+
+            self._server.serve_forever()
+            status = 0
+
+        except socket.error, e:
+            logger.critical("Error on socket: %s" % e)
+
+        except KeyboardInterrupt, e:
+            self.stop()
+            status = 0
+
+        except Exception, e:
+            logger.critical("Worker process %s failed: %s" % (worker_id, e))
+
+        finally:
+            os._exit(status)
+
+    def serve_forever_prefork(self):
+        """Start the configured number of worker processes and restart any
+        of them that exits unexpectedly, with an increasing delay. Gives up
+        (and stops all workers) if a worker keeps exiting right after being
+        started."""
+        import os
+        import sys
+        import time
+        import errno
+        import logging
+        logger = logging.getLogger()
+
+        started = {}
+        restarts = {}
+
+        for worker_id in range(self._config['server-processes']):
+            self.start_worker_process(worker_id, inherit_server=(worker_id == 0))
+            started[worker_id] = time.time()
+
+        # Connections are accepted by the workers only
+        self._server.server_close()
+
+        while self._workers:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if pid not in self._workers:
+                continue
+
+            worker_id = self._workers.pop(pid)
+
+            # Start counting again once a worker ran for a while
+            if time.time() - started[worker_id] >= self.worker_stable_time:
+                restarts[worker_id] = 0
+
+            if restarts.get(worker_id, 0) >= self.max_worker_restarts:
+                logger.critical("Worker process %s (PID %s) exited with status %s after %s restarts, giving up" % (worker_id, pid, status, restarts[worker_id]))
+                self.stop()
+                self.close()
+                sys.exit(1)
+
+            delay = min(self.worker_restart_delay * 2 ** restarts.get(worker_id, 0), self.max_worker_restart_delay)
+            restarts[worker_id] = restarts.get(worker_id, 0) + 1
+
+            logger.error("Worker process %s (PID %s) exited with status %s, restarting it in %s seconds" % (worker_id, pid, status, delay))
+            time.sleep(delay)
+
+            self.start_worker_process(worker_id)
+            started[worker_id] = time.time()
+
     def serve_forever(self):
         """Start listening for incoming requests."""
         import sys
@@ -352,7 +682,10 @@ class GitAutoDeploy(object):
         logger = logging.getLogger()
 
         try:
-            self._server.serve_forever()
+            if self._config['server-processes'] > 1:
+                self.serve_forever_prefork()
+            else:
+                self._server.serve_forever()
 
         except socket.error, e:
             logger.critical("Error on socket: %s" % e)
@@ -385,9 +718,20 @@ class GitAutoDeploy(object):
             self.exit()
 
     def stop(self):
+        import os
+        import signal
+
+        # Stop any worker processes
+        for pid in self._workers.keys():
+            del self._workers[pid]
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
         if self._server is None:
             return
-        self._server.socket.close()
+        self._server.server_close()
 
     def signal_handler(self, signum, frame):
         import logging
@@ -1,44 +1,159 @@
-from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 
 
-class FilterMatchError(Exception):
-    """Used to describe when a filter does not match a request."""
-    pass
+class WebhookHTTPServer(HTTPServer):
+    """HTTP server that handles one request at a time in the listener thread,
+    with a configurable listen backlog. Optionally allows other sockets to be
+    bound to the same port (SO_REUSEPORT)."""
+
+    def __init__(self, server_address, RequestHandlerClass, backlog=5, reuse_port=False):
+        self.request_queue_size = backlog
+        self.reuse_port = reuse_port
+        HTTPServer.__init__(self, server_address, RequestHandlerClass)
+
+    def server_bind(self):
+        import socket
+
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        HTTPServer.server_bind(self)
+
+
+class ThreadPoolHTTPServer(WebhookHTTPServer):
+    """HTTP server that hands each accepted connection over to a fixed pool
+    of worker threads, so that a long running git pull or deploy does not keep
+    other webhooks waiting in the accept backlog. Connections accepted while
+    all workers are busy are queued, up to the size of the backlog. Once the
+    queue is full, further connections are answered with 503 Service
+    Unavailable right away, instead of timing out in the accept backlog."""
+
+    def __init__(self, server_address, RequestHandlerClass, backlog=5, workers=4, reuse_port=False):
+        self.workers = workers
+        self._queue = None
+        self._threads = []
+        WebhookHTTPServer.__init__(self, server_address, RequestHandlerClass, backlog, reuse_port)
+
+    def start_workers(self):
+        """Start the worker threads. Invoked automatically on the first
+        incoming request."""
+        from Queue import Queue
+        import threading
+
+        self._queue = Queue(self.request_queue_size)
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.process_request_worker,
+                                      name='gad-worker-%s' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop_workers(self):
+        """Ask all worker threads to exit once the queued requests are
+        handled."""
+        for thread in self._threads:
+            self._queue.put(None)
+
+        self._threads = []
+
+    def process_request_worker(self):
+        """Worker thread main loop."""
+        while True:
+            item = self._queue.get()
+
+            # Sentinel value used to stop the worker
+            if item is None:
+                return
+
+            request, client_address = item
+
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        """Queue the request for the next available worker thread, or reject
+        it if the queue is full."""
+        from Queue import Full
+
+        if not self._threads:
+            self.start_workers()
+
+        try:
+            self._queue.put_nowait((request, client_address))
+        except Full:
+            self.reject_request(request, client_address)
+
+    def reject_request(self, request, client_address):
+        """Answer a request with 503 Service Unavailable without reading it,
+        and close the connection."""
+        import socket
+        import logging
+        logger = logging.getLogger()
+
+        logger.warning("All %s workers are busy and %s requests are queued, rejecting request from %s:%s" % (self.workers, self.request_queue_size, client_address[0], client_address[1]))
+
+        try:
+            request.sendall('HTTP/1.0 503 Service Unavailable\r\nContent-Type: text/plain\r\n'
+                            'Retry-After: 1\r\nConnection: close\r\n\r\nServer busy\n')
+        except socket.error:
+            pass
+
+        self.shutdown_request(request)
+
+    def server_close(self):
+        WebhookHTTPServer.server_close(self)
+
+        if self._threads:
+            self.stop_workers()
 
 
 class WebhookRequestHandler(BaseHTTPRequestHandler):
     """Extends the BaseHTTPRequestHandler class and handles the incoming
     HTTP requests."""
 
+    _config = {}
+    _job_queue = None
+    _deploy_queue = None
+    _scheduler = None
+    _cloner = None
+    _prefetcher = None
+
     def do_POST(self):
         """Invoked on incoming POST requests"""
-        from threading import Timer
+        import re
         import logging
-        import json
+        from models import WebhookRequest
 
         logger = logging.getLogger()
         logger.info('Incoming request from %s:%s' % (self.client_address[0], self.client_address[1]))
 
-        content_type = self.headers.getheader('content-type')
+        if re.match(r'^/rollback/?(\?.*)?$', self.path):
+            self.handle_rollback()
+            return
+
         content_length = int(self.headers.getheader('content-length'))
-        request_body = self.rfile.read(content_length)
+        request = WebhookRequest(dict(self.headers), self.rfile.read(content_length), self.path)
 
         # Test case debug data
         test_case = {
             'headers': dict(self.headers),
-            'payload': json.loads(request_body),
+            'payload': None,
             'config': {},
             'expected': {'status': 200, 'data': [{'deploy': 0}]}
         }
 
-        # Extract request headers and make all keys to lowercase (makes them easier to compare)
-        request_headers = dict(self.headers)
-        request_headers = dict((k.lower(), v) for k, v in request_headers.iteritems())
-
         try:
 
+            # Will raise a ValueError exception if the payload is not valid JSON
+            test_case['payload'] = request.payload
+
             # Will raise a ValueError exception if it fails
-            ServiceRequestParser = self.figure_out_service_from_request(request_headers, request_body)
+            ServiceRequestParser = self.figure_out_service_from_request(request)
 
             # Unable to identify the source of the request
             if not ServiceRequestParser:
@@ -47,16 +162,10 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
                 test_case['expected']['status'] = 400
                 return
 
-            # Send HTTP response before the git pull and/or deploy commands?
-            if not 'detailed-response' in self._config or not self._config['detailed-response']:
-                self.send_response(200, 'OK')
-                self.send_header('Content-type', 'text/plain')
-                self.end_headers()
-
             logger.info('Handling the request with %s' % ServiceRequestParser.__name__)
 
             # Could be GitHubParser, GitLabParser or other
-            repo_configs, ref, action, webhook_urls = ServiceRequestParser(self._config).get_repo_params_from_request(request_headers, request_body)
+            repo_configs, ref, action, webhook_urls = ServiceRequestParser(self._config).get_repo_params_from_request(request)
             logger.debug("Event details - ref: %s; action: %s" % (ref or "master", action))
 
             if len(repo_configs) == 0:
@@ -65,15 +174,20 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
                 test_case['expected']['status'] = 400
                 return
 
-            # Make git pulls and trigger deploy commands
-            res = self.process_repositories(repo_configs, ref, action, request_body)
-
+            # Await the git pull and deploy commands and include their results
+            # in the response?
             if 'detailed-response' in self._config and self._config['detailed-response']:
-                self.send_response(200, 'OK')
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(res))
-                self.wfile.close()
+                res = self.process_repositories(repo_configs, ref, action, request)
+                self.send_json_response(200, res)
+
+            # Otherwise, make git pulls and trigger deploy commands in the
+            # background and respond right away
+            else:
+                keys = self.get_job_keys(repo_configs, ref, action, request)
+                job = self._job_queue.submit_coalesced(keys, self.process_repositories, repo_configs, ref, action, request)
+                logger.info('Queued job %s' % job.id)
+                self.send_json_response(202, {'job': job.id, 'status_url': '/jobs/%s' % job.id})
+                test_case['expected'] = {'status': 202}
 
             # Add additional test case data
             test_case['config'] = {
@@ -90,9 +204,7 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
             return
 
         except Exception, e:
-
-            if 'detailed-response' in self._config and self._config['detailed-response']:
-                self.send_error(500, 'Unable to process request')
+            self.send_error(500, 'Unable to process request')
 
             test_case['expected']['status'] = 500
 
@@ -104,6 +216,119 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
             if 'log-test-case' in self._config and self._config['log-test-case']:
                 self.save_test_case(test_case)
 
+    def get_release_configs(self):
+        """Repository configs using release mode."""
+        return [repo_config for repo_config in self._config.get('repositories', [])
+                if repo_config.get('release-link') and 'path' in repo_config]
+
+    def handle_rollback(self):
+        """Switch the release symlink of a repository config back to the
+        previous (or a specified) release. The repository config is selected
+        with the 'link' (its release-link) query parameter, and the release
+        with the optional 'release' query parameter."""
+        import os
+        import logging
+        from urlparse import urlparse, parse_qs
+        from wrappers import GitWrapper
+        from lock import Lock
+        from releases import Releases
+        from deployed import DeployedCommit
+
+        logger = logging.getLogger()
+
+        params = dict((key, values[-1]) for key, values in parse_qs(urlparse(self.path).query).items())
+        matches = [repo_config for repo_config in self.get_release_configs()
+                   if os.path.abspath(repo_config['release-link']) == os.path.abspath(params.get('link', ''))]
+
+        if not matches:
+            self.send_error(404, 'Unknown release link')
+            return
+
+        repo_config = matches[0]
+
+        # The secret token of the repository is required in the X-Gad-Token
+        # header, so rollbacks are refused for repositories without one
+        if not repo_config.get('secret-token'):
+            logger.warning("Rollback of %s refused, no secret token configured" % repo_config['release-link'])
+            self.send_error(403, 'Forbidden')
+            return
+
+        if self.headers.getheader('x-gad-token') != repo_config['secret-token']:
+            logger.warning("Rollback of %s refused, invalid token" % repo_config['release-link'])
+            self.send_error(403, 'Forbidden')
+            return
+
+        releases = Releases(repo_config)
+
+        # Don't switch in the middle of a deploy, and don't keep the request
+        # waiting for it either
+        running_lock = Lock(os.path.join(repo_config['path'], 'status_running'))
+
+        if not running_lock.obtain(blocking=False):
+            self.send_error(409, 'A deploy is running')
+            return
+
+        try:
+            previous = releases.get_current()
+            release = releases.rollback(params.get('release'))
+
+            # Pushing the commit rolled back from deploys it again
+            DeployedCommit(repo_config).set(GitWrapper.resolve(repo_config['path'], releases.get_commit(release)))
+
+        except ValueError, e:
+            self.send_json_response(400, {'error': str(e)})
+            return
+
+        finally:
+            running_lock.release()
+
+        logger.info("Rolled back %s from release %s to %s" % (repo_config['release-link'], previous, release))
+        self.send_json_response(200, {'previous': previous, 'current': release})
+
+    def do_GET(self):
+        """Invoked on incoming GET requests. Reports the status of deploy
+        jobs on /jobs/<id>, the deploy scheduler status on /scheduler, the
+        background fetch status on /prefetch, the releases on /releases and
+        the progress of the initial clones on /ready."""
+        import re
+
+        if re.match(r'^/ready/?$', self.path):
+            status = self._cloner.get_status() if self._cloner else {'ready': True}
+            self.send_json_response(200 if status['ready'] else 503, status)
+            return
+
+        if re.match(r'^/scheduler/?$', self.path) and self._scheduler:
+            self.send_json_response(200, self._scheduler.get_status())
+            return
+
+        if re.match(r'^/releases/?$', self.path):
+            from releases import Releases
+            self.send_json_response(200, [Releases(repo_config).get_status() for repo_config in self.get_release_configs()])
+            return
+
+        if re.match(r'^/prefetch/?$', self.path) and self._prefetcher:
+            self.send_json_response(200, self._prefetcher.get_status())
+            return
+
+        match = re.match(r'^/jobs/([0-9a-f]+)/?$', self.path)
+        status = match and self._job_queue and self._job_queue.get_status(match.group(1))
+
+        if not status:
+            self.send_error(404, 'Not found')
+            return
+
+        self.send_json_response(200, status)
+
+    def send_json_response(self, code, data):
+        """Send a complete response with a JSON encoded body."""
+        import json
+
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data))
+        self.wfile.close()
+
     def log_message(self, format, *args):
         """Overloads the default message logging method to allow messages to
         go through our custom logger instead."""
@@ -112,29 +337,29 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
         logger.info("%s - %s" % (self.client_address[0],
                                           format%args))
 
-    def figure_out_service_from_request(self, request_headers, request_body):
+    @staticmethod
+    def figure_out_service_from_request(request):
         """Parses the incoming request and attempts to determine whether
         it originates from GitHub, GitLab or any other known service."""
-        import json
         import logging
         import parsers
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
+        data = request.payload
 
         if not isinstance(data, dict):
             raise ValueError("Invalid JSON object")
 
-        user_agent = 'user-agent' in request_headers and request_headers['user-agent']
-        content_type = 'content-type' in request_headers and request_headers['content-type']
+        user_agent = 'user-agent' in request.headers and request.headers['user-agent']
+        content_type = 'content-type' in request.headers and request.headers['content-type']
 
         # Assume GitLab if the X-Gitlab-Event HTTP header is set
-        if 'x-gitlab-event' in request_headers:
+        if 'x-gitlab-event' in request.headers:
 
             return parsers.GitLabRequestParser
 
         # Assume GitHub if the X-GitHub-Event HTTP header is set
-        elif 'x-github-event' in request_headers:
+        elif 'x-github-event' in request.headers:
 
             return parsers.GitHubRequestParser
 
@@ -158,105 +383,212 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
         logger.error("Unable to recognize request origin. Don't know how to handle the request.")
         return
 
-    def process_repositories(self, repo_configs, ref, action, request_body):
+    def get_job_keys(self, repo_configs, ref, action, request):
+        """The repository configs and branches deployed for a request, used
+        as keys of its background job. A queued job whose keys are all among
+        them is superseded by the new job, just like waiting requests in the
+        deploy queue are. Returns None if the job must not supersede other
+        jobs, or be superseded."""
+        from filters import get_compiled_filters
+        from deployed import get_config_key
+
+        # Forced requests deploy even if nothing changed
+        if request.is_forced():
+            return None
+
+        keys = []
+
+        for repo_config in repo_configs:
+            filters = get_compiled_filters(repo_config)
+
+            if not filters.match(request, action):
+                continue
+
+            # Deploys without a repository, and deploys depending on the files
+            # changed by each push, have to run for every request
+            if 'path' not in repo_config or filters.changed_paths:
+                return None
+
+            keys.append((repo_config['path'], repo_config.get('branch') or ref, get_config_key(repo_config)))
+
+        return keys
+
+    def process_repositories(self, repo_configs, ref, action, request):
         """Verify that the suggested repositories has matching settings and
-        issue git pull and/or deploy commands."""
-        import os
-        import time
+        issue git pull and/or deploy commands. Repositories with different
+        paths are processed in parallel, and the results are returned in the
+        order of the repository configs."""
         import logging
-        from wrappers import GitWrapper
-        from lock import Lock
-        import json
+        import threading
+        from filters import get_compiled_filters
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
 
-        result = []
+        # Repository configs sharing a path (or without a path) are processed
+        # in order, by the same thread
+        groups = []
+        group_paths = {}
+
+        matching = []
 
-        # Process each matching repository
         for repo_config in repo_configs:
 
-            repo_result = {}
+            # Verify that all filters matches the request (if any filters are specified)
+            filters = get_compiled_filters(repo_config)
 
-            try:
-                # Verify that all filters matches the request (if any filters are specified)
-                if 'filters' in repo_config:
+            if not filters.match(request, action):
+                logger.info(filters.explain(request, action))
 
-                    # At least one filter must match
-                    for filter in repo_config['filters']:
+                # Filter does not match, do not process this repo config
+                continue
 
-                        # All options specified in the filter must match
-                        for filter_key, filter_value in filter.iteritems():
+            path = repo_config.get('path')
 
-                            # Ignore filters with value None (let them pass)
-                            if filter_value == None:
-                                continue
+            if path not in group_paths:
+                group_paths[path] = []
+                groups.append(group_paths[path])
 
-                            # Support for earlier version so it's non-breaking functionality
-                            if filter_key == 'action' and filter_value == action:
-                                continue
+            group_paths[path].append(len(matching))
+            matching.append(repo_config)
 
-                            # Interpret dots in filter name as path notations 
-                            node_value = data
-                            for node_key in filter_key.split('.'):
+        result = [None] * len(matching)
+        errors = []
 
-                                # If the path is not valid the filter does not match
-                                if not node_key in node_value:
-                                    logger.info("Filter '%s'' does not match since the path is invalid" % (filter_key))
-                                    raise FilterMatchError()
+        def process(indexes):
+            try:
+                for i in indexes:
+                    result[i] = self.process_repository(matching[i], ref, request)
+            except Exception as e:
+                errors.append(e)
 
-                                node_value = node_value[node_key]
+        if len(groups) == 1 or not self._config.get('parallel-repositories'):
+            process(range(len(matching)))
 
-                            if filter_value == node_value:
-                                continue
+        else:
+            threads = []
 
-                            # If the filter value is set to True. the filter
-                            # will pass regardless of the actual value 
-                            if filter_value == True:
-                                continue
+            for indexes in groups:
+                thread = threading.Thread(target=process, args=(indexes,))
+                thread.start()
+                threads.append(thread)
 
-                            logger.info("Filter '%s'' does not match ('%s' != '%s')" % (filter_key, filter_value, (str(node_value)[:75] + '..') if len(str(node_value)) > 75 else str(node_value)))
+            for thread in threads:
+                thread.join()
 
-                            raise FilterMatchError()
+        if errors:
+            raise errors[0]
 
-            except FilterMatchError as e:
+        return result
 
-                # Filter does not match, do not process this repo config
-                continue
+    def process_repository(self, repo_config, ref, request):
+        """Issue git pull and/or deploy commands for a single repository.
+        Requests for the same repository path and branch are queued, and
+        requests superseded by a newer one while waiting are not processed
+        at all, since the newer request deploys the latest commit anyway.
+        Requests for the commit that is already deployed are not processed
+        either, unless forced."""
+        import logging
+        from wrappers import GitWrapper, ProcessWrapper
+        from deployed import DeployedCommit, get_config_key
 
-            # In case there is no path configured for the repository, no pull will
-            # be made.
-            if not 'path' in repo_config:
-                res = GitWrapper.deploy(repo_config)
-                repo_result['deploy'] = res
-                result.append(repo_result)
-                continue
+        logger = logging.getLogger()
+
+        # In case there is no path configured for the repository, no pull will
+        # be made.
+        if not 'path' in repo_config:
+            slot, wait_time = self._scheduler.acquire(repo_config)
+
+            output = []
+            steps = []
 
-            running_lock = Lock(os.path.join(repo_config['path'], 'status_running'))
-            waiting_lock = Lock(os.path.join(repo_config['path'], 'status_waiting'))
             try:
+                with ProcessWrapper.get_repo_limits(repo_config):
+                    repo_result = {'deploy': GitWrapper.deploy(repo_config, output=output, steps=steps)}
+            finally:
+                self._scheduler.release(slot)
 
-                # Attempt to obtain the status_running lock
-                while not running_lock.obtain():
+            if output:
+                repo_result['deploy_output'] = output
 
-                    # If we're unable, try once to obtain the status_waiting lock
-                    if not waiting_lock.has_lock() and not waiting_lock.obtain():
-                        logger.error("Unable to obtain the status_running lock nor the status_waiting lock. Another process is " +
-                                        "already waiting, so we'll ignore the request.")
+            if steps:
+                repo_result['deploy_steps'] = steps
 
-                        # If we're unable to obtain the waiting lock, ignore the request
-                        break
+            if wait_time is not None:
+                repo_result['wait_time'] = wait_time
+
+            return repo_result
+
+        # Wait for the repository to be cloned, if it is still being cloned.
+        # Like the wait for the status_running lock, the wait is bounded by
+        # lock-timeout, since it blocks a job worker.
+        if self._cloner and not self._cloner.wait(repo_config, self._config.get('lock-timeout')):
+            logger.error("Repository %s was not cloned in time or could not be cloned, so we'll ignore the request." % repo_config['path'])
+            return {'git clone': 1}
+
+        # Nothing to do if the pushed commit is already deployed
+        target = request.get_target_commit()
+        if target and target == DeployedCommit(repo_config).get() and not request.is_forced():
+            logger.info("Commit %s is already deployed to %s" % (target, repo_config['path']))
+            return {'up_to_date': True}
+
+        # Only requests for the same config supersede each other, while the
+        # status_running lock serializes all deploys to the path
+        key = (repo_config['path'], repo_config.get('branch') or ref, get_config_key(repo_config))
+        repo_result, coalesced = self._deploy_queue.run(key, self.pull_and_deploy, repo_config, request)
+
+        if coalesced is None:
+            logger.info("Request for %s superseded by a newer request" % repo_config['path'])
+            return {'superseded': True}
 
-                    # Keep on attempting to obtain the status_running lock until we succeed
-                    time.sleep(5)
+        if coalesced:
+            logger.info("Deploy of %s also handled %s superseded requests" % (repo_config['path'], coalesced))
+            repo_result['coalesced'] = coalesced
+
+        return repo_result
+
+    def pull_and_deploy(self, repo_config, request):
+        """Pull the repository and execute the deploy commands."""
+        import os
+        import logging
+        from wrappers import GitWrapper, ProcessWrapper
+        from lock import Lock
+        from releases import Releases
+        from filters import get_compiled_filters
+        from deployed import DeployedCommit
+
+        logger = logging.getLogger()
+        data = request.payload
+
+        repo_result = {}
+
+        # The deploy queue serializes deploys within this process, the lock
+        # serializes them with other processes using the same repository
+        running_lock = Lock(os.path.join(repo_config['path'], 'status_running'))
+        slot = None
+        try:
+
+            if not running_lock.obtain(blocking=True, timeout=self._config.get('lock-timeout')):
+                logger.error("Timed out waiting for the status_running lock, so we'll ignore the request.")
+                return repo_result
+
+            # Wait until the deploy limits allow another deploy to run
+            slot, wait_time = self._scheduler.acquire(repo_config)
+
+            if wait_time is not None:
+                repo_result['wait_time'] = wait_time
+
+            # Kill commands exceeding the configured timeouts, and apply the
+            # configured resource limits to them
+            with ProcessWrapper.get_repo_limits(repo_config):
+
+                # Commit checked out before the pull
+                before = GitWrapper.get_head(repo_config['path'], repo_config.get('git-backend'))
 
                 n = 4
                 res = None
                 while n > 0:
 
                     # Attempt to pull up a maximum of 4 times
-                    print repo_config
-
                     if not repo_config.get('branch'):
                         if data.get('ref_type') == "tag":
                             repo_config.update(
@@ -271,10 +603,16 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
                                 {'branch': data.get(
                                     'pull_request').get('base').get('ref')})
 
-                    print repo_config
-                    res = GitWrapper.pull(repo_config)
+                    # Skip the fetch if the commit was fetched already (e.g. in the
+                    # background)
+                    commit = request.get_target_commit()
+                    fetched = GitWrapper.is_fetched(repo_config, commit)
+
+                    if fetched and self._prefetcher:
+                        self._prefetcher.record_skipped_fetch(repo_config)
+
+                    res = GitWrapper.pull(repo_config, commit=commit, fetch=not fetched)
                     repo_result['git pull'] = res
-                    print 'pull done!'
 
                     # Return code indicating success?
                     if res == 0:
@@ -283,26 +621,89 @@ class WebhookRequestHandler(BaseHTTPRequestHandler):
                     n -= 1
 
                 if 0 < n:
-                    res = GitWrapper.deploy(repo_config)
+
+                    # Payloads not listing the changed files are matched
+                    # against the 'changed-paths' filters now that the pushed
+                    # commits are fetched
+                    filters = get_compiled_filters(repo_config)
+                    if not filters.match_changed_paths(request, fetched=True):
+                        logger.info(filters.explain_changed_paths(request, fetched=True))
+                        repo_result['filtered'] = True
+                        return repo_result
+
+                    # Skip the deploy if the pull didn't change the deployed commit
+                    deployed = DeployedCommit(repo_config)
+                    deployed_commit = deployed.get()
+                    head = GitWrapper.get_head(repo_config['path'], repo_config.get('git-backend'))
+                    if head and head == deployed_commit and not request.is_forced():
+                        logger.info("Commit %s is already deployed to %s" % (head, repo_config['path']))
+                        repo_result['up_to_date'] = True
+                        return repo_result
+
+                    # Let the deploy commands know what changed since the last
+                    # successful deploy (or the pull, if that's unknown). A forced
+                    # deploy redeploys everything.
+                    before = deployed_commit or before
+                    changed_files = None
+
+                    if before and head and not request.is_forced():
+                        changed_files = GitWrapper.get_changed_files(repo_config['path'], before, head) if before != head else []
+
+                    # In release mode, deploy into a new release directory while
+                    # the current release keeps being served
+                    releases = None
+                    release = None
+                    if repo_config.get('release-link'):
+                        releases = Releases(repo_config)
+                        release = releases.create(head)
+
+                    output = []
+                    steps = []
+
+                    try:
+                        res = GitWrapper.deploy(repo_config, before=before, after=head, changed_files=changed_files,
+                                                cwd=release and releases.get_path(release), output=output, steps=steps)
+                    except Exception:
+                        if release:
+                            releases.remove(release)
+                        raise
                     repo_result['deploy'] = res
 
-            except Exception as e:
-                logger.error('Error during \'pull\' or \'deploy\' operation on path: %s' % repo_config['path'])
-                logger.error(e.message)
+                    if output:
+                        repo_result['deploy_output'] = output
 
-            finally:
+                    if steps:
+                        repo_result['deploy_steps'] = steps
 
-                # Release the lock if it's ours
-                if running_lock.has_lock():
-                    running_lock.release()
+                    # Switch to the new release only if all deploy commands
+                    # succeeded
+                    if releases and all(code == 0 for code in res):
+                        releases.activate(release)
+                        releases.prune()
+                        repo_result['release'] = release
 
-                # Release the lock if it's ours
-                if waiting_lock.has_lock():
-                    waiting_lock.release()
+                    elif releases:
+                        logger.error("Deploy of release %s failed, keeping release %s" % (release, releases.get_current()))
+                        releases.remove(release)
 
-                result.append(repo_result)
+                    # Remember the deployed commit if all deploy commands succeeded
+                    if head and all(code == 0 for code in res):
+                        deployed.set(head)
 
-        return result
+        except Exception as e:
+            logger.error('Error during \'pull\' or \'deploy\' operation on path: %s' % repo_config['path'])
+            logger.error(e.message)
+
+        finally:
+
+            if slot:
+                self._scheduler.release(slot)
+
+            # Release the lock if it's ours
+            if running_lock.has_lock():
+                running_lock.release()
+
+        return repo_result
 
     def save_test_case(self, test_case):
         """Log request information in a way it can be used as a test case."""
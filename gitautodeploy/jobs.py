@@ -0,0 +1,262 @@
+class Job(object):
+    """A unit of work (typically git pull and deploy commands for the
+    repositories matching a webhook request) that is executed in the
+    background. Its keys (e.g. the repository paths and branches it deploys)
+    let a newer job supersede it while it is queued."""
+
+    def __init__(self, target, args=(), kwargs=None, keys=None):
+        import uuid
+        import time
+
+        self.id = uuid.uuid4().hex
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.keys = frozenset(keys or [])
+        self.superseded_by = None
+        self.coalesced = 0
+
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs or {}
+
+    def start(self):
+        """Mark the job as running."""
+        import time
+
+        self.state = 'running'
+        self.started_at = time.time()
+
+    def run(self):
+        """Execute the job and record its outcome."""
+        import time
+        import logging
+        logger = logging.getLogger()
+
+        if not self.started_at:
+            self.start()
+
+        try:
+            self.result = self._target(*self._args, **self._kwargs)
+            self.state = 'finished'
+
+        except Exception as e:
+            logger.error("Job %s failed: %s" % (self.id, e))
+            self.error = str(e)
+            self.state = 'failed'
+
+        finally:
+            self.finished_at = time.time()
+
+    def supersede(self, job):
+        """Mark the job as superseded by a newer job, which handles it as
+        well, so that it is never executed."""
+        import time
+
+        self.state = 'superseded'
+        self.superseded_by = job.id
+        self.finished_at = time.time()
+
+        job.coalesced += self.coalesced + 1
+
+    def is_done(self):
+        return self.state in ['finished', 'failed', 'superseded']
+
+    def to_dict(self):
+        """Job status representation used in HTTP responses."""
+        data = {
+            'id': self.id,
+            'state': self.state,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'wait_time': None,
+            'run_time': None,
+            'result': self.result
+        }
+
+        if self.started_at:
+            data['wait_time'] = self.started_at - self.created_at
+
+        if self.finished_at and self.started_at:
+            data['run_time'] = self.finished_at - self.started_at
+
+        if self.error:
+            data['error'] = self.error
+
+        if self.superseded_by:
+            data['superseded_by'] = self.superseded_by
+
+        if self.coalesced:
+            data['coalesced'] = self.coalesced
+
+        return data
+
+
+class JobQueue(object):
+    """Executes jobs in a fixed number of background threads and keeps a
+    bounded history of jobs so that their status can be queried after they
+    have finished. If a state directory is specified, the job status is also
+    written to it, so that it can be queried from other processes sharing the
+    same directory.
+
+    Jobs submitted with keys supersede the queued jobs whose keys they all
+    share. Like the deploy queue does for each repository, this collapses a
+    burst of requests waiting for the job workers into a single job."""
+
+    def __init__(self, workers=1, history=100, state_dir=None):
+        from Queue import Queue
+        import threading
+
+        self.workers = workers
+        self.history = history
+        self.state_dir = state_dir
+
+        self._queue = Queue()
+        self._jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, target, *args, **kwargs):
+        """Create a job running target(*args, **kwargs) and queue it for
+        execution. Returns the job instance."""
+        return self.submit_job(Job(target, args, kwargs))
+
+    def submit_coalesced(self, keys, target, *args, **kwargs):
+        """Like submit(), but the job supersedes the queued (not yet
+        started) jobs whose keys are all among keys, since it handles them as
+        well. Superseded jobs are never executed."""
+        return self.submit_job(Job(target, args, kwargs, keys))
+
+    def submit_job(self, job):
+        superseded = []
+
+        with self._lock:
+            if not self._threads:
+                self.start_workers()
+
+            if job.keys:
+                for job_id in self._order:
+                    queued = self._jobs[job_id]
+
+                    if queued.state == 'queued' and queued.keys and queued.keys <= job.keys:
+                        queued.supersede(job)
+                        superseded.append(queued)
+
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            self.prune()
+
+        for queued in superseded:
+            self.save_status(queued)
+
+        self.save_status(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """Get a job by its id, or None if unknown (or no longer kept)."""
+        return self._jobs.get(job_id)
+
+    def get_status(self, job_id):
+        """Get the status of a job, queued by this or any other process
+        sharing the state directory. Returns None if the job is unknown."""
+        import os
+        import json
+
+        job = self.get(job_id)
+
+        if job:
+            return job.to_dict()
+
+        if not self.state_dir:
+            return None
+
+        try:
+            with open(os.path.join(self.state_dir, '%s.json' % job_id)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def save_status(self, job):
+        """Write the status of a job to the state directory (if any)."""
+        import os
+        import json
+
+        if not self.state_dir:
+            return
+
+        path = os.path.join(self.state_dir, '%s.json' % job.id)
+
+        # Write to a temporary file first, so that readers never see a
+        # partially written file
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job.to_dict(), f)
+
+        os.rename(path + '.tmp', path)
+
+    def remove_status(self, job_id):
+        import os
+
+        if not self.state_dir:
+            return
+
+        try:
+            os.remove(os.path.join(self.state_dir, '%s.json' % job_id))
+        except OSError:
+            pass
+
+    def prune(self):
+        """Forget the oldest finished jobs when the history limit is
+        exceeded. Unfinished jobs are always kept."""
+        excess = len(self._order) - self.history
+
+        for job_id in list(self._order):
+            if excess <= 0:
+                break
+
+            if self._jobs[job_id].is_done():
+                self._order.remove(job_id)
+                del self._jobs[job_id]
+                self.remove_status(job_id)
+                excess -= 1
+
+    def start_workers(self):
+        import threading
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name='gad-job-worker-%s' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop_workers(self):
+        """Ask all worker threads to exit once the queued jobs are done."""
+        with self._lock:
+            for thread in self._threads:
+                self._queue.put(None)
+
+            self._threads = []
+
+    def worker(self):
+        """Worker thread main loop."""
+        while True:
+            job = self._queue.get()
+
+            # Sentinel value used to stop the worker
+            if job is None:
+                return
+
+            with self._lock:
+                if job.state == 'superseded':
+                    continue
+
+                job.start()
+
+            self.save_status(job)
+            job.run()
+            self.save_status(job)
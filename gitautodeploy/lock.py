@@ -1,36 +1,175 @@
+import threading
+
+# State shared by all Lock instances in this process for the same path
+_local_locks = {}
+_local_locks_pid = None
+_local_locks_guard = threading.Lock()
+
+
+class LocalLockState(object):
+    """The in-process side of a lock. Threads waiting for a lock held by
+    another thread in the same process wait on a condition variable, and are
+    woken up as soon as the lock is released."""
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.owner = None
+
+
+def get_local_lock_state(path):
+    import os
+    global _local_locks_pid
+
+    path = os.path.realpath(path)
+
+    with _local_locks_guard:
+
+        # Locks held by the parent are not held by a forked child process
+        if _local_locks_pid != os.getpid():
+            _local_locks.clear()
+            _local_locks_pid = os.getpid()
+
+        if path not in _local_locks:
+            _local_locks[path] = LocalLockState()
+
+        return _local_locks[path]
+
 
 class Lock():
-    """Simple implementation of a mutex lock using the file systems. Works on
-    *nix systems."""
+    """Mutex lock based on flock(2) on a lock file, which is shared between
+    processes and automatically released by the kernel if the owning process
+    dies. Threads in the same process are serialized on a condition variable
+    first, so that a waiting thread takes over the lock as soon as it is
+    released. On systems without fcntl (Windows), the lock file is created
+    exclusively instead, and removed when released."""
 
     path = None
-    lock = None
 
-    def __init__(self, path):
-        try:
-            from lockfile import LockFile
-        except ImportError:
-            from lockfile import FileLock
-            # Different naming in older versions of lockfile
-            LockFile = FileLock
+    # Interval used when waiting for a lock held by another process, with a
+    # timeout (a blocking flock can't be interrupted)
+    poll_interval = 0.001
+    max_poll_interval = 0.05
 
+    def __init__(self, path):
         self.path = path
-        self.lock = LockFile(path)
+        self.lock_path = path + '.lock'
+        self._fd = None
+        self._state = get_local_lock_state(self.lock_path)
 
-    def obtain(self):
-        import os
+    def obtain(self, blocking=False, timeout=None):
+        """Obtain the lock. Returns False if the lock is held by another
+        thread or process, and blocking is False or the timeout (in seconds)
+        expires first."""
+        import time
         import logging
-        from lockfile import AlreadyLocked
         logger = logging.getLogger()
 
-        try:
-            self.lock.acquire(0)
-            logger.debug("Successfully obtained lock: %s" % self.path)
-        except AlreadyLocked:
+        if self.has_lock():
+            return True
+
+        deadline = None
+        if blocking and timeout is not None:
+            deadline = time.time() + timeout
+
+        if not self._obtain_local(blocking, deadline):
             return False
 
+        try:
+            if not self._obtain_file(blocking, deadline):
+                self._release_local()
+                return False
+
+        except:
+            self._release_local()
+            raise
+
+        logger.debug("Successfully obtained lock: %s" % self.path)
         return True
 
+    def _obtain_local(self, blocking, deadline):
+        import time
+
+        with self._state.condition:
+            while self._state.owner is not None:
+
+                if not blocking:
+                    return False
+
+                if deadline is None:
+                    self._state.condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+
+                self._state.condition.wait(remaining)
+
+            self._state.owner = self
+
+        return True
+
+    def _release_local(self):
+        with self._state.condition:
+            if self._state.owner is self:
+                self._state.owner = None
+                self._state.condition.notify()
+
+    def _obtain_file(self, blocking, deadline):
+        import os
+        import time
+        import errno
+
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+
+        interval = self.poll_interval
+
+        while True:
+
+            if fcntl:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0644)
+
+                try:
+                    # Without a timeout, let the kernel wake us up
+                    if blocking and deadline is None:
+                        fcntl.flock(fd, fcntl.LOCK_EX)
+                    else:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+                except IOError, e:
+                    os.close(fd)
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                    fd = None
+
+            else:
+                try:
+                    fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0644)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                    fd = None
+
+            if fd is not None:
+                self._fd = fd
+
+                # Record the owner, for troubleshooting
+                os.ftruncate(fd, 0)
+                os.write(fd, '%s\n' % os.getpid())
+                return True
+
+            if not blocking:
+                return False
+
+            if deadline is not None and time.time() + interval > deadline:
+                return False
+
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
     def release(self):
         import os
         import logging
@@ -39,16 +178,42 @@ class Lock():
         if not self.has_lock():
             raise Exception("Unable to release lock that is owned by another process")
 
-        self.lock.release()
+        try:
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+
+        except ImportError:
+            os.close(self._fd)
+            os.remove(self.lock_path)
+
+        self._fd = None
+        self._release_local()
+
         logger.debug("Successfully released lock: %s" % self.path)
 
     def has_lock(self):
-        return self.lock.i_am_locking()
+        return self._fd is not None
 
     def clear(self):
+        """Clear a lock left behind by a process that no longer exists. Locks
+        based on flock are released by the kernel when the owning process
+        dies, so this is only needed on systems without fcntl, where the lock
+        file is removed."""
         import os
         import logging
         logger = logging.getLogger()
 
-        self.lock.break_lock()
+        try:
+            import fcntl
+            return
+        except ImportError:
+            pass
+
+        if self.has_lock():
+            self.release()
+
+        elif os.path.exists(self.lock_path):
+            os.remove(self.lock_path)
+
         logger.debug("Successfully cleared lock: %s" % self.path)
@@ -0,0 +1,131 @@
+class WebhookRequest(object):
+    """An incoming webhook request. Holds the raw request body, the request
+    headers (with lower case names, which makes them easier to compare), the
+    query string parameters and the decoded JSON payload. The payload is
+    decoded once, on first access, and then shared by the service parsers,
+    the filters and the deploy logic."""
+
+    def __init__(self, headers, body, path='/'):
+        from urlparse import urlparse, parse_qs
+
+        self.headers = dict((k.lower(), v) for k, v in headers.iteritems())
+        self.body = body
+        self.path = path
+        self.params = dict((k, v[-1]) for k, v in parse_qs(urlparse(path).query, keep_blank_values=True).iteritems())
+        self._payload = None
+        self._payload_decoded = False
+        self._changed_files = None
+        self._changed_files_collected = False
+        self._changed_files_by_path = {}
+
+    @property
+    def payload(self):
+        """The decoded JSON payload. Raises ValueError if the request body is
+        not valid JSON."""
+        import json
+
+        if not self._payload_decoded:
+            self._payload = json.loads(self.body)
+            self._payload_decoded = True
+
+        return self._payload
+
+    def is_forced(self):
+        """Check if the request asks to pull and deploy even if the target
+        commit is already deployed (e.g. /?force=1)."""
+        return self.params.get('force', 'false').lower() not in ['false', '0', 'no']
+
+    def get_target_commit(self):
+        """The commit id pushed to the branch, if the payload reports it
+        (GitHub, GitLab and compatible services)."""
+        try:
+            after = self.payload.get('after')
+        except (AttributeError, ValueError):
+            return None
+
+        # Deleted branches are reported with a null commit id
+        if not isinstance(after, basestring) or not after.strip('0'):
+            return None
+
+        return after
+
+    def get_changed_files(self, path=None):
+        """Get the files added, modified or removed by a push event, as a set
+        of paths relative to the repository root.
+
+        The files are read from the commits listed in the payload (GitHub,
+        GitLab and compatible services). If the payload doesn't list all
+        pushed commits, and a local repository path is specified, the files
+        are looked up using git diff between the before and after commits,
+        which requires them to be fetched already. Returns None if the
+        changed files can't be determined."""
+
+        if not self._changed_files_collected:
+            self._changed_files = self.get_changed_files_from_payload()
+            self._changed_files_collected = True
+
+        if self._changed_files is not None or not path:
+            return self._changed_files
+
+        if path not in self._changed_files_by_path:
+            self._changed_files_by_path[path] = self.get_changed_files_from_repo(path)
+
+        return self._changed_files_by_path[path]
+
+    def get_changed_files_from_payload(self):
+        """Collect the changed files from the commits in the payload. Returns
+        None if the payload has no commit list, or if the list is empty or
+        truncated."""
+
+        try:
+            commits = self.payload['commits']
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        # Some events (e.g. new branches and tags) list no commits at all,
+        # even if files changed
+        if not isinstance(commits, list) or not commits:
+            return None
+
+        # GitLab includes at most 20 commits, but reports the actual number
+        if self.payload.get('total_commits_count', 0) > len(commits):
+            return None
+
+        # GitHub includes at most 2048 commits and doesn't report the number
+        if len(commits) >= 2048:
+            return None
+
+        files = set()
+
+        for commit in commits:
+            for key in ['added', 'modified', 'removed']:
+                if not isinstance(commit, dict) or not isinstance(commit.get(key), list):
+                    return None
+                files.update(commit[key])
+
+        return files
+
+    def get_changed_files_from_repo(self, path):
+        """Look up the changed files in a local repository, using the before
+        and after commits in the payload."""
+        try:
+            from gitautodeploy.wrappers import GitWrapper
+        except ImportError:
+            from wrappers import GitWrapper
+
+        try:
+            before = self.payload['before']
+            after = self.payload['after']
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        # New and deleted branches are reported with a null commit id
+        if not before or not after or not before.strip('0') or not after.strip('0'):
+            return None
+
+        files = GitWrapper.get_changed_files(path, before, after)
+
+        if files is None:
+            return None
+
+        return set(files)
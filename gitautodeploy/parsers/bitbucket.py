@@ -2,12 +2,11 @@ from common import WebhookRequestParser
 
 class BitBucketRequestParser(WebhookRequestParser):
 
-    def get_repo_params_from_request(self, request_headers, request_body):
-        import json
+    def get_repo_params_from_request(self, request):
         import logging
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
+        data = request.payload
 
         repo_urls = []
         ref = ""
@@ -24,12 +23,10 @@ class BitBucketRequestParser(WebhookRequestParser):
             if k in data['repository']:
                 repo_urls.append(data['repository'][k])
 
+        # Repositories are matched regardless of protocol and username, so this
+        # URL matches any configured bitbucket.org URL for the repository
         if 'full_name' in data['repository']:
-            repo_urls.append('git@bitbucket.org:%s.git' % data['repository']['full_name'])
-
-            # Add a simplified version of the bitbucket HTTPS URL - without the username@bitbucket.com part. This is
-            # needed since the configured repositories might be configured using a different username.
-            repo_urls.append('https://bitbucket.org/%s.git' % (data['repository']['full_name']))
+            repo_urls.append('https://bitbucket.org/%s' % data['repository']['full_name'])
 
         # Get a list of configured repositories that matches the incoming web hook reqeust
         repo_configs = self.get_matching_repo_configs(repo_urls)
@@ -1,3 +1,74 @@
+def get_repo_identity(url):
+    """Get a key identifying the repository referenced by a URL, regardless
+    of protocol, embedded credentials, port, .git suffix and letter case.
+    Supports scp-like (git@host:owner/name.git), ssh://, git://, http(s)://
+    and file:// URLs as well as local paths and GitHub API URLs. Returns a
+    (host, owner, name) tuple, where owner may contain slashes (e.g. GitLab
+    subgroups) and host is empty for local repositories. Returns None if the
+    URL does not reference a repository."""
+    import re
+
+    if not url:
+        return None
+
+    url = url.strip()
+
+    # scheme://[user[:password]@]host[:port]/path
+    match = re.match(r'^([a-z][a-z0-9+.-]*)://(?:[^@/]*@)?([^/:]*)(?::\d*)?(/.*)?$', url, re.IGNORECASE)
+
+    if match:
+        host = match.group(2)
+        path = match.group(3) or ''
+
+    else:
+        # scp-like syntax; [user@]host:path
+        match = re.match(r'^(?:[^@/]+@)?([^/:]{2,}):(.*)$', url)
+
+        if match:
+            host = match.group(1)
+            path = match.group(2)
+
+        # Local path
+        else:
+            host = ''
+            path = url
+
+    host = host.lower()
+    path = path.lower().strip('/')
+
+    if path.endswith('.git'):
+        path = path[:-4].rstrip('/')
+
+    # GitHub (and GitHub Enterprise) API URLs
+    api_match = re.match(r'^(?:api/v3/)?repos/(.+)$', path)
+    if api_match and (host.startswith('api.') or path.startswith('api/v3/')):
+        path = api_match.group(1)
+        if host.startswith('api.'):
+            host = host[4:]
+
+    if not path:
+        return None
+
+    owner, _, name = path.rpartition('/')
+    return (host, owner, name)
+
+
+def build_repository_index(repositories):
+    """Create a lookup table mapping the identity (see get_repo_identity) of
+    each configured repository URL to the list of repository configs using
+    that repository, in configured order."""
+
+    index = {}
+    for repo_config in repositories:
+
+        if 'url' not in repo_config:
+            continue
+
+        key = get_repo_identity(repo_config['url']) or repo_config['url']
+        index.setdefault(key, []).append(repo_config)
+
+    return index
+
 
 class WebhookRequestParser(object):
     """Abstract parent class for git service parsers. Contains helper
@@ -7,18 +78,31 @@ class WebhookRequestParser(object):
         self._config = config
 
     def get_matching_repo_configs(self, urls):
-        """Iterates over the various repo URLs provided as argument (git://,
-        ssh:// and https:// for the repo) and compare them to any repo URL
-        specified in the config"""
+        """Looks up the various repo URLs provided as argument (git://,
+        ssh:// and https:// for the repo) in the index of repositories
+        specified in the config. URLs are compared by the repository they
+        reference, so a webhook only has to carry one of the URL variants."""
 
-        configs = []
+        # The index is normally created when the config is initialized
+        if 'repository_index' not in self._config:
+            self._config['repository_index'] = build_repository_index(self._config['repositories'])
+
+        index = self._config['repository_index']
+
+        # Different URL variants of the same repository share the same key
+        keys = []
         for url in urls:
-            for repo_config in self._config['repositories']:
-                if repo_config in configs:
+            key = get_repo_identity(url) or url
+            if key not in keys:
+                keys.append(key)
+
+        configs = []
+        matched = set()
+        for key in keys:
+            for repo_config in index.get(key, []):
+                if id(repo_config) in matched:
                     continue
-                if repo_config['url'] == url:
-                    configs.append(repo_config)
-                elif 'url_without_usernme' in repo_config and repo_config['url_without_usernme'] == url:
-                    configs.append(repo_config)
+                matched.add(id(repo_config))
+                configs.append(repo_config)
 
-        return configs
\ No newline at end of file
+        return configs
@@ -2,12 +2,11 @@ from common import WebhookRequestParser
 
 class GenericRequestParser(WebhookRequestParser):
 
-    def get_repo_params_from_request(self, request_headers, request_body):
-        import json
+    def get_repo_params_from_request(self, request):
         import logging
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
+        data = request.payload
 
         repo_urls = []
         ref = ""
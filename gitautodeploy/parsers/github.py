@@ -2,19 +2,17 @@ from common import WebhookRequestParser
 
 class GitHubRequestParser(WebhookRequestParser):
 
-    def get_repo_params_from_request(self, request_headers, request_body):
-        import json
+    def get_repo_params_from_request(self, request):
         import logging
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
-        print data
+        data = request.payload
 
         repo_urls = []
         ref = ""
         action = ""
 
-        github_event = 'x-github-event' in request_headers and request_headers['x-github-event']
+        github_event = 'x-github-event' in request.headers and request.headers['x-github-event']
 
         logger.debug("Received '%s' event from GitHub" % github_event)
 
@@ -47,8 +45,8 @@ class GitHubRequestParser(WebhookRequestParser):
         for repo_config in items:
 
             # Validate secret token if present
-            if 'secret-token' in repo_config and 'x-hub-signature' in request_headers:
-                if not self.verify_signature(repo_config['secret-token'], request_body, request_headers['x-hub-signature']):
+            if 'secret-token' in repo_config and 'x-hub-signature' in request.headers:
+                if not self.verify_signature(repo_config['secret-token'], request.body, request.headers['x-hub-signature']):
                     logger.warning("Request signature does not match the 'secret-token' configured for repository %s." % repo_config['url'])
                     continue
 
@@ -2,18 +2,17 @@ from common import WebhookRequestParser
 
 class GitLabRequestParser(WebhookRequestParser):
 
-    def get_repo_params_from_request(self, request_headers, request_body):
-        import json
+    def get_repo_params_from_request(self, request):
         import logging
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
+        data = request.payload
 
         repo_urls = []
         ref = ""
         action = ""
 
-        gitlab_event = 'x-gitlab-event' in request_headers and request_headers['x-gitlab-event']
+        gitlab_event = 'x-gitlab-event' in request.headers and request.headers['x-gitlab-event']
 
         logger.debug("Received '%s' event from GitLab" % gitlab_event)
 
@@ -42,12 +41,11 @@ class GitLabRequestParser(WebhookRequestParser):
 
 class GitLabCIRequestParser(WebhookRequestParser):
 
-    def get_repo_params_from_request(self, request_headers, request_body):
-        import json
+    def get_repo_params_from_request(self, request):
         import logging
 
         logger = logging.getLogger()
-        data = json.loads(request_body)
+        data = request.payload
 
         repo_urls = []
         ref = ""
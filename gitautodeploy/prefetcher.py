@@ -0,0 +1,214 @@
+class RepositoryPrefetcher(object):
+    """Periodically fetches the configured repositories in the background,
+    so that a webhook request usually finds the pushed commit fetched
+    already and the pull doesn't have to fetch it. Each repository is
+    fetched every interval seconds, randomly varied by the jitter fraction so
+    that the fetches of different repositories don't line up. At most
+    workers fetches run at the same time. A fetch that is due while the
+    previous fetch of the repository is still running, while a deploy of the
+    repository is running or while all workers are busy is skipped."""
+
+    def __init__(self, fetch, interval=60, jitter=0.1, workers=2):
+        import threading
+
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = max(1, workers)
+
+        # Function fetching a repository config, returning an exit code, or
+        # None if the repository can't be fetched right now
+        self._fetch = fetch
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._states = {}
+        self._order = []
+        self._running = 0
+        self._stopped = False
+        self._thread = None
+
+    def start(self, repo_configs):
+        """Start fetching the specified repository configs periodically."""
+        import time
+        import random
+        import threading
+
+        now = time.time()
+
+        with self._lock:
+            for repo_config in repo_configs:
+                path = repo_config['path']
+                interval = repo_config.get('prefetch-interval', self.interval)
+
+                if path in self._states or not interval:
+                    continue
+
+                # Spread the first fetches over the first interval
+                self._states[path] = {'path': path, 'interval': interval,
+                                      'repo_config': repo_config, 'fetching': False,
+                                      'next_fetch': now + random.uniform(0, interval),
+                                      'last_fetch': None, 'last_success': None, 'last_duration': None,
+                                      'fetches': 0, 'failed': 0, 'skipped': 0, 'skipped_fetches': 0}
+                self._order.append(path)
+
+            if self._thread or not self._states:
+                return
+
+            self._thread = threading.Thread(target=self.run, name='gad-prefetcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop scheduling fetches. Running fetches are not interrupted."""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+
+    def run(self):
+        """Scheduler thread main loop, starting the fetches that are due."""
+        import time
+        import logging
+        logger = logging.getLogger()
+
+        with self._lock:
+            while not self._stopped:
+                now = time.time()
+
+                for path in self._order:
+                    state = self._states[path]
+
+                    if state['next_fetch'] > now:
+                        continue
+
+                    self.schedule(state, now)
+
+                    if state['fetching'] or self._running >= self.workers:
+                        state['skipped'] += 1
+                        logger.info("Skipping background fetch of %s, %s" % (path, 'the previous fetch is still running' if state['fetching'] else 'all fetch workers are busy'))
+                        continue
+
+                    self.start_fetch(state)
+
+                self._wakeup.wait(max(0.01, min(state['next_fetch'] for state in self._states.values()) - now))
+
+    def schedule(self, state, now):
+        """Set the time of the next fetch of a repository."""
+        import random
+
+        state['next_fetch'] = now + state['interval'] * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def start_fetch(self, state):
+        """Fetch a repository in a new thread. Called with the lock held."""
+        import threading
+
+        state['fetching'] = True
+        self._running += 1
+
+        thread = threading.Thread(target=self.fetch, args=(state,), name='gad-prefetch-worker')
+        thread.daemon = True
+        thread.start()
+
+    def fetch(self, state):
+        """Fetch a repository and record the outcome."""
+        import time
+        import logging
+        logger = logging.getLogger()
+
+        started = time.time()
+
+        try:
+            res = self._fetch(state['repo_config'])
+        except Exception as e:
+            logger.error("Unable to fetch %s in the background: %s" % (state['path'], e))
+            res = 1
+
+        finished = time.time()
+
+        with self._lock:
+            state['fetching'] = False
+            self._running -= 1
+
+            if res is None:
+                state['skipped'] += 1
+                logger.info("Skipped background fetch of %s, the repository is busy or not cloned yet" % state['path'])
+                return
+
+            state['fetches'] += 1
+            state['last_fetch'] = finished
+            state['last_duration'] = finished - started
+
+            if res == 0:
+                state['last_success'] = finished
+                logger.info("Fetched %s in the background in %.2f s" % (state['path'], finished - started))
+            else:
+                state['failed'] += 1
+                logger.error("Background fetch of %s failed with exit code %s" % (state['path'], res))
+
+    def get_freshness(self, repo_config):
+        """Number of seconds since the last successful background fetch of a
+        repository config, or None if it wasn't fetched yet."""
+        import time
+
+        with self._lock:
+            state = self._states.get(repo_config.get('path'))
+
+            if not state or state['last_success'] is None:
+                return None
+
+            return time.time() - state['last_success']
+
+    def record_skipped_fetch(self, repo_config):
+        """Record that a pull of a repository config didn't need to fetch,
+        since the commit to deploy was fetched already."""
+        import logging
+        logger = logging.getLogger()
+
+        freshness = self.get_freshness(repo_config)
+
+        with self._lock:
+            state = self._states.get(repo_config.get('path'))
+
+            if state:
+                state['skipped_fetches'] += 1
+
+        if freshness is None:
+            logger.info("Commit to deploy to %s is fetched already, skipping the fetch" % repo_config['path'])
+        else:
+            logger.info("Commit to deploy to %s is fetched already (background fetch %.1f s ago), skipping the fetch" % (repo_config['path'], freshness))
+
+    def get_status(self):
+        """Background fetch status, used by the prefetch status endpoint."""
+        import time
+
+        now = time.time()
+        repositories = []
+
+        with self._lock:
+            for path in self._order:
+                state = self._states[path]
+                # The URL is left out, since it may include credentials
+                repositories.append({
+                    'path': path,
+                    'interval': state['interval'],
+                    'fetching': state['fetching'],
+                    'freshness': (now - state['last_success']) if state['last_success'] is not None else None,
+                    'last_duration': state['last_duration'],
+                    'next_fetch_in': max(0.0, state['next_fetch'] - now),
+                    'fetches': state['fetches'],
+                    'failed': state['failed'],
+                    'skipped': state['skipped'],
+                    'skipped_fetches': state['skipped_fetches']
+                })
+
+            running = self._running
+
+        return {
+            'interval': self.interval,
+            'jitter': self.jitter,
+            'workers': self.workers,
+            'running': running,
+            'fetches': sum(repo['fetches'] for repo in repositories),
+            'skipped': sum(repo['skipped'] for repo in repositories),
+            'skipped_fetches': sum(repo['skipped_fetches'] for repo in repositories),
+            'repositories': repositories
+        }
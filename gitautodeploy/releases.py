@@ -0,0 +1,172 @@
+class Releases(object):
+    """Release directories of a repository config using release mode. Each
+    deploy copies the checked out repository into a new release directory,
+    in which the deploy commands are executed while the current release
+    keeps being served. On success, the symlink configured as release-link
+    is switched to the new release (atomically, by renaming a new symlink
+    over it). Switching back to a previous release (a rollback) is just
+    another switch of the symlink.
+
+    All state is kept on disk (the release directories and the symlink), so
+    releases are shared between server processes and survive restarts."""
+
+    def __init__(self, repo_config):
+        import os
+
+        self.repo_config = repo_config
+        self.link = repo_config['release-link']
+        self.dir = repo_config.get('release-dir') or (repo_config['path'].rstrip(os.sep) + '-releases')
+        self.keep = max(1, int(repo_config.get('keep-releases', 5)))
+
+    def list(self):
+        """Names of the existing releases, oldest first."""
+        import os
+
+        if not os.path.isdir(self.dir):
+            return []
+
+        return sorted(name for name in os.listdir(self.dir)
+                      if not name.startswith('.') and os.path.isdir(os.path.join(self.dir, name)))
+
+    def get_current(self):
+        """Name of the release the symlink points to, or None."""
+        import os
+
+        if not os.path.islink(self.link):
+            return None
+
+        target = os.path.join(os.path.dirname(self.link), os.readlink(self.link))
+
+        if os.path.realpath(os.path.dirname(target)) != os.path.realpath(self.dir):
+            return None
+
+        return os.path.basename(target)
+
+    def get_path(self, name):
+        import os
+        return os.path.join(self.dir, name)
+
+    def get_commit(self, name):
+        """Abbreviated id of the commit deployed by a release."""
+        return name.rsplit('-', 1)[-1]
+
+    def create(self, commit):
+        """Create a new release directory with a copy of the checked out
+        repository (without .git). Returns the name of the release."""
+        import os
+        import time
+        import shutil
+        import logging
+        logger = logging.getLogger()
+
+        # Release names sort in the order the releases were created
+        created = time.time()
+        while True:
+            name = '%s.%06d-%s' % (time.strftime('%Y%m%d%H%M%S', time.localtime(created)),
+                                   int(created * 1000000) % 1000000, (commit or 'unknown')[:12])
+
+            if not os.path.exists(self.get_path(name)):
+                break
+
+            created += 0.000001
+
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+
+        # Copy into a hidden directory first, so that an interrupted copy is
+        # never listed as a release
+        temp_path = os.path.join(self.dir, '.' + name)
+
+        def ignore(path, names):
+            # The status files of GitAutoDeploy are not part of a release
+            if os.path.realpath(path) == os.path.realpath(self.repo_config['path']):
+                return [name for name in names if name in ['.git', 'status_running.lock', 'status_deployed']]
+
+            return [name for name in names if name == '.git']
+
+        started = time.time()
+        shutil.copytree(self.repo_config['path'], temp_path, symlinks=True, ignore=ignore)
+        os.rename(temp_path, self.get_path(name))
+
+        logger.info("Created release %s of %s in %.2f s" % (name, self.repo_config['path'], time.time() - started))
+
+        return name
+
+    def activate(self, name):
+        """Atomically switch the release symlink to a release."""
+        import os
+        import logging
+        logger = logging.getLogger()
+
+        if name not in self.list():
+            raise ValueError("Unknown release %s" % name)
+
+        if os.path.exists(self.link) and not os.path.islink(self.link):
+            raise OSError("%s exists and is not a symlink" % self.link)
+
+        parent = os.path.dirname(os.path.abspath(self.link))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        # Renaming the new symlink over the old one replaces it atomically
+        temp_link = '%s.%s.tmp' % (self.link, os.getpid())
+
+        if os.path.lexists(temp_link):
+            os.remove(temp_link)
+
+        os.symlink(os.path.abspath(self.get_path(name)), temp_link)
+        os.rename(temp_link, self.link)
+
+        logger.info("Switched %s to release %s" % (self.link, name))
+
+    def remove(self, name):
+        """Remove a release directory."""
+        import shutil
+        shutil.rmtree(self.get_path(name), ignore_errors=True)
+
+    def prune(self):
+        """Remove the oldest releases, keeping keep-releases releases (and
+        always the current one). Returns the names of the removed releases."""
+        import logging
+        logger = logging.getLogger()
+
+        current = self.get_current()
+        releases = self.list()
+        removed = []
+
+        for name in [name for name in releases if name != current][:max(0, len(releases) - self.keep)]:
+            self.remove(name)
+            removed.append(name)
+
+        if removed:
+            logger.info("Removed releases %s" % ', '.join(removed))
+
+        return removed
+
+    def rollback(self, name=None):
+        """Switch to the specified release, or to the release preceding the
+        current one. Returns the name of the activated release."""
+        releases = self.list()
+
+        if name is None:
+            current = self.get_current()
+
+            if current not in releases or releases.index(current) == 0:
+                raise ValueError("There is no release before %s" % current)
+
+            name = releases[releases.index(current) - 1]
+
+        self.activate(name)
+
+        return name
+
+    def get_status(self):
+        """Releases and the current release, used by the releases endpoint."""
+        # The URL is left out, since it may include credentials
+        return {
+            'path': self.repo_config.get('path'),
+            'release-link': self.link,
+            'release-dir': self.dir,
+            'current': self.get_current(),
+            'releases': self.list()
+        }
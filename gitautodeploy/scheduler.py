@@ -0,0 +1,195 @@
+class DeployScheduler(object):
+    """Limits the number of pull and deploy operations running at the same
+    time, globally, per repository and per group of repositories. Deploys
+    waiting for a slot are started in priority order (highest first, then in
+    order of arrival), although a deploy blocked by its repository or group
+    limit doesn't hold back deploys of other repositories.
+
+    A limit of 0 (or None) means unlimited. The time spent waiting for a
+    slot is recorded, so that the limits can be sized accordingly.
+
+    If a slot directory is specified, the limits also apply to the deploys
+    of other processes sharing the directory. Each limit then has as many
+    slot files as it allows deploys, and a deploy holds a lock (flock(2)) on
+    one slot file of each limit that applies to it. Priorities only apply
+    within each process."""
+
+    # Interval used when waiting for a slot held by another process
+    poll_interval = 0.01
+    max_poll_interval = 0.5
+
+    def __init__(self, max_deploys=0, group_limits=None, slot_dir=None):
+        import threading
+        import itertools
+
+        self.max_deploys = max_deploys or 0
+        self.group_limits = group_limits or {}
+        self.slot_dir = slot_dir
+
+        self._condition = threading.Condition(threading.Lock())
+        self._sequence = itertools.count()
+        self._waiting = []
+        self._running = {}
+        self.running_deploys = 0
+
+        # Waiting time statistics
+        self.deploys = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def get_limits(self, repo_config):
+        """Get the (key, limit) pairs of the limits that apply to a repository
+        config."""
+        try:
+            from gitautodeploy.parsers.common import get_repo_identity
+        except ImportError:
+            from parsers.common import get_repo_identity
+
+        limits = []
+
+        if self.max_deploys:
+            limits.append(('global', self.max_deploys))
+
+        if repo_config.get('max-concurrent-deploys'):
+            repo = get_repo_identity(repo_config.get('url')) or repo_config.get('url')
+            limits.append((('repo', repo), repo_config['max-concurrent-deploys']))
+
+        group = repo_config.get('deploy-group')
+        if group and self.group_limits.get(group):
+            limits.append((('group', group), self.group_limits[group]))
+
+        return tuple(limits)
+
+    def acquire(self, repo_config):
+        """Wait for a deploy slot. Returns a tuple of the entry to pass to
+        release() and the number of seconds waited (None if no limits apply
+        to the repository config)."""
+        import time
+
+        limits = self.get_limits(repo_config)
+        entry = (-int(repo_config.get('deploy-priority', 0)), next(self._sequence), limits, time.time(), [])
+
+        with self._condition:
+            self._waiting.append(entry)
+            self._waiting.sort()
+
+            while not self.can_start(entry):
+                self._condition.wait()
+
+            self._waiting.remove(entry)
+            self.running_deploys += 1
+
+            for key, limit in limits:
+                self._running[key] = self._running.get(key, 0) + 1
+
+        if self.slot_dir and limits:
+            self.acquire_slot_files(entry)
+
+        with self._condition:
+            wait_time = time.time() - entry[3]
+            self.deploys += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        if not limits:
+            return entry, None
+
+        return entry, wait_time
+
+    def can_start(self, entry):
+        """Check if a waiting entry gets a slot, given the currently running
+        deploys and the waiting entries ahead of it."""
+        running = dict(self._running)
+
+        for waiting in self._waiting:
+            limits = waiting[2]
+
+            if any(running.get(key, 0) >= limit for key, limit in limits):
+                continue
+
+            if waiting is entry:
+                return True
+
+            for key, limit in limits:
+                running[key] = running.get(key, 0) + 1
+
+        return False
+
+    def acquire_slot_files(self, entry):
+        """Wait until one slot file of each limit of an entry is locked,
+        which means that the deploys of other processes leave room for it.
+        The slot files are locked all at once, or not at all, so that
+        deploys waiting for each other's slots don't block each other."""
+        import os
+        import time
+        import errno
+        import fcntl
+        import hashlib
+
+        interval = self.poll_interval
+
+        while True:
+            for key, limit in entry[2]:
+                name = hashlib.sha1(repr(key)).hexdigest()
+
+                for i in range(limit):
+                    fd = os.open(os.path.join(self.slot_dir, '%s.%s.lock' % (name, i)), os.O_RDWR | os.O_CREAT, 0644)
+
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except IOError, e:
+                        os.close(fd)
+                        if e.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                        continue
+
+                    entry[4].append(fd)
+                    break
+
+                else:
+                    # All slots of this limit are taken
+                    break
+
+            else:
+                return
+
+            self.release_slot_files(entry)
+
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def release_slot_files(self, entry):
+        import os
+
+        # Closing the file releases the lock
+        while entry[4]:
+            os.close(entry[4].pop())
+
+    def release(self, entry):
+        """Free the slot of a finished deploy."""
+        self.release_slot_files(entry)
+
+        with self._condition:
+            self.running_deploys -= 1
+
+            for key, limit in entry[2]:
+                self._running[key] -= 1
+
+                if not self._running[key]:
+                    del self._running[key]
+
+            self._condition.notify_all()
+
+    def get_status(self):
+        """Scheduler status and waiting time statistics."""
+        with self._condition:
+            return {
+                'max_deploys': self.max_deploys,
+                'group_limits': self.group_limits,
+                'running': self.running_deploys,
+                'waiting': len(self._waiting),
+                'deploys': self.deploys,
+                'total_wait_time': self.total_wait_time,
+                'average_wait_time': (self.total_wait_time / self.deploys) if self.deploys else 0.0,
+                'max_wait_time': self.max_wait_time
+            }
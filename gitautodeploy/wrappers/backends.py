@@ -0,0 +1,206 @@
+class ShellGitBackend(object):
+    """Executes git operations using the git command line client, one
+    process per operation."""
+
+    name = 'shell'
+
+    @staticmethod
+    def get_env():
+        """Environment for git commands, making sure git uses the repository
+        in the working directory."""
+        import os
+
+        env = dict(os.environ)
+        env.pop('GIT_DIR', None)
+        env.pop('GIT_WORK_TREE', None)
+        return env
+
+    def resolve(self, path, ref):
+        """Gets the commit id of a ref in a local repository, or None."""
+        from process import ProcessWrapper
+
+        try:
+            res, stdout = ProcessWrapper.get_output(['git', 'rev-parse', '--verify', '-q', ref + '^{commit}'], cwd=path)
+        except OSError:
+            return None
+
+        if res != 0:
+            return None
+
+        return stdout.strip() or None
+
+    def fetch(self, path, remote, refspecs, depth=None):
+        """Fetches refspecs from a remote. Returns the exit code."""
+        import logging
+        from process import ProcessWrapper
+
+        logger = logging.getLogger()
+
+        command = ['git', 'fetch', '--no-tags', remote]
+
+        if depth:
+            command.append('--depth=%s' % int(depth))
+
+        command.extend(refspecs)
+        res = ProcessWrapper().call(command, cwd=path, env=self.get_env())
+
+        if res != 0:
+            logger.error("Command '%s' failed with exit code %s" % (' '.join(command), res))
+
+        return int(res)
+
+    def checkout(self, path, ref, branch=None):
+        """Checks out ref, discarding any local changes. If a branch is
+        specified it is (re)created at ref and checked out, otherwise HEAD is
+        detached. Returns the exit code."""
+        import logging
+        from process import ProcessWrapper
+
+        logger = logging.getLogger()
+
+        if branch:
+            command = ['git', 'checkout', '--force', '-B', branch, ref]
+        else:
+            command = ['git', 'checkout', '--force', '--detach', ref]
+
+        res = ProcessWrapper().call(command, cwd=path, env=self.get_env())
+
+        if res != 0:
+            logger.error("Command '%s' failed with exit code %s" % (' '.join(command), res))
+
+        return int(res)
+
+
+class DulwichGitBackend(ShellGitBackend):
+    """Executes fetches and ref lookups within the GitAutoDeploy process
+    using dulwich (https://www.dulwich.io), without forking any git
+    processes. Other operations, including checkouts, use the git command
+    line client, since dulwich doesn't remove the files deleted by a
+    checkout. Fetches within the process can't be interrupted, so with a
+    command or deploy timeout, fetches use the git command line client as
+    well."""
+
+    name = 'dulwich'
+
+    # Shallow fetches (depth) are supported since dulwich 0.19.7
+    min_version = (0, 19, 7)
+
+    def __init__(self):
+        # Raises ImportError if dulwich is not installed
+        import dulwich
+        import dulwich.repo
+
+        if tuple(dulwich.__version__) < self.min_version:
+            raise ImportError("dulwich %s or later is required" % '.'.join(str(n) for n in self.min_version))
+
+    def resolve(self, path, ref):
+        from dulwich.repo import Repo
+        from dulwich.objects import Commit, Tag
+        from dulwich.errors import NotGitRepository
+
+        try:
+            repo = Repo(path)
+        except NotGitRepository:
+            return None
+
+        try:
+            if ref == 'HEAD' or ref.startswith('refs/'):
+                obj = repo[repo.refs[ref]]
+            else:
+                obj = repo[ref]
+
+            # Peel annotated tags
+            while isinstance(obj, Tag):
+                obj = repo[obj.object[1]]
+
+        except (KeyError, ValueError):
+            return None
+
+        finally:
+            repo.close()
+
+        if not isinstance(obj, Commit):
+            return None
+
+        return obj.id
+
+    def fetch(self, path, remote, refspecs, depth=None):
+        import logging
+        from dulwich.repo import Repo
+        from dulwich.client import get_transport_and_path
+        from dulwich.errors import GitProtocolError, HangupException, NotGitRepository
+        from process import ProcessWrapper
+
+        logger = logging.getLogger()
+
+        # A hung fetch would keep the repository locked forever
+        limits = ProcessWrapper.get_limits()
+        if limits.get('command_timeout') is not None or limits.get('deadline') is not None:
+            return ShellGitBackend.fetch(self, path, remote, refspecs, depth)
+
+        try:
+            repo = Repo(path)
+        except NotGitRepository:
+            logger.error("%s is not a git repository" % path)
+            return 1
+
+        try:
+            url = repo.get_config().get(('remote', remote), 'url')
+            client, remote_path = get_transport_and_path(url)
+
+            # Map the remote refs to fetch to the local refs to update
+            targets = {}
+            for refspec in refspecs:
+                src, dst = refspec.lstrip('+').split(':', 1)
+                targets[src] = dst
+
+            def determine_wants(remote_refs):
+                return [remote_refs[src] for src in targets if src in remote_refs and remote_refs[src] not in repo.object_store]
+
+            result = client.fetch(remote_path, repo, determine_wants=determine_wants, depth=depth)
+            remote_refs = getattr(result, 'refs', result)
+
+            for src, dst in targets.items():
+                if src not in remote_refs:
+                    logger.error("Couldn't find remote ref %s" % src)
+                    return 1
+
+                repo.refs[dst] = remote_refs[src]
+
+        except (KeyError, GitProtocolError, HangupException, OSError, IOError), e:
+            logger.error("Unable to fetch from %s into %s: %s" % (remote, path, e))
+            return 1
+
+        finally:
+            repo.close()
+
+        return 0
+
+
+# Backend instances by name
+_backends = {}
+
+
+def get_git_backend(name=None):
+    """Gets the git backend with the specified name ('shell' or 'dulwich').
+    Falls back to the shell backend if the backend is not available."""
+    import logging
+    logger = logging.getLogger()
+
+    name = name or 'shell'
+
+    if name not in _backends:
+        classes = dict((backend.name, backend) for backend in [ShellGitBackend, DulwichGitBackend])
+
+        try:
+            _backends[name] = classes[name]()
+
+        except KeyError:
+            logger.error("Unknown git backend '%s', using the git command line client" % name)
+            _backends[name] = get_git_backend('shell')
+
+        except ImportError, e:
+            logger.error("Git backend '%s' is not available (%s), using the git command line client" % (name, e))
+            _backends[name] = get_git_backend('shell')
+
+    return _backends[name]
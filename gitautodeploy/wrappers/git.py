@@ -6,8 +6,12 @@ class GitWrapper():
         pass
 
     @staticmethod
-    def pull(repo_config):
-        """Pulls the latest version of the repo from the git server"""
+    def pull(repo_config, commit=None, fetch=True):
+        """Pulls the latest version of the repo from the git server. The
+        commit expected to be pulled, if known, lets a shared mirror skip
+        fetching when it already has it. With fetch set to False, the
+        repository is updated to the commits fetched previously (see
+        prefetch())."""
         import logging
         from process import ProcessWrapper
         import os
@@ -21,6 +25,15 @@ class GitWrapper():
             logger.info('No local repository path configured, no pull will occure')
             return 0
 
+        if 'mirror_path' in repo_config:
+            return GitWrapper.pull_worktree(repo_config, commit)
+
+        if repo_config.get('pull-mode') == 'minimal':
+            return GitWrapper.fetch_and_reset(repo_config, fetch)
+
+        # Commit checked out before the pull, used to detect changed submodules
+        before = GitWrapper.get_head(repo_config['path'])
+
         commands = []
 
         # On Windows, bash command needs to be run using bash.exe. This assumes bash.exe
@@ -31,13 +44,13 @@ class GitWrapper():
             commands.append('unset GIT_DIR')
 
         commands.append('git checkout -- .')
-        commands.append('git fetch ' + repo_config['remote'])
+        if fetch:
+            commands.append('git fetch ' + repo_config['remote'])
         commands.append('git checkout master')
         commands.append('git checkout ' + (repo_config['branch'] or repo_config['tag']))
 
         if repo_config['branch']:
             commands.append('git reset --hard ' + repo_config['remote'] + '/' + repo_config['branch'])
-        commands.append('git submodule update --init --recursive')
         #commands.append('git update-index --refresh')
 
         # All commands needs to success
@@ -48,6 +61,9 @@ class GitWrapper():
                 logger.error("Command '%s' failed with exit code %s" % (command, res))
                 break
 
+        if res == 0:
+            res = GitWrapper.update_submodules(repo_config, before)
+
         if res == 0 and os.path.isdir(repo_config['path']):
             logger.info("Repository %s successfully updated" % repo_config['path'])
         else:
@@ -55,6 +71,389 @@ class GitWrapper():
 
         return int(res)
 
+    @staticmethod
+    def fetch_and_reset(repo_config, fetch=True):
+        """Updates the repository by fetching only the configured branch (or
+        tag) and checking out the fetched commit, discarding any local
+        changes. Compared to pull(), this takes a single fetch and a single
+        checkout, executed without a shell (or within the GitAutoDeploy
+        process, depending on the configured git backend)."""
+        import logging
+        from backends import get_git_backend
+
+        logger = logging.getLogger()
+        backend = get_git_backend(repo_config.get('git-backend'))
+
+        remote = repo_config.get('remote') or 'origin'
+        refspec, ref, branch = GitWrapper.get_fetch_refspec(repo_config)
+
+        # Commit checked out before the pull, used to detect changed submodules
+        before = backend.resolve(repo_config['path'], 'HEAD')
+
+        res = 0
+
+        if fetch:
+            res = backend.fetch(repo_config['path'], remote, [refspec], repo_config.get('fetch-depth'))
+
+        if res == 0:
+            res = backend.checkout(repo_config['path'], ref, branch)
+
+        if res == 0:
+            res = GitWrapper.update_submodules(repo_config, before, backend.get_env())
+
+        if res == 0:
+            logger.info("Repository %s successfully updated" % repo_config['path'])
+        else:
+            logger.error("Unable to update repository %s" % repo_config['path'])
+
+        return int(res)
+
+    @staticmethod
+    def get_fetch_refspec(repo_config):
+        """The refspec fetching the configured branch (or tag), the local ref
+        it is fetched into, and the branch to check out (None for a tag)."""
+        remote = repo_config.get('remote') or 'origin'
+
+        if repo_config.get('branch') or not repo_config.get('tag'):
+            branch = repo_config.get('branch') or 'master'
+
+            # Update the remote tracking branch, and (re)create the local branch
+            # at the fetched commit
+            refspec = '+refs/heads/%s:refs/remotes/%s/%s' % (branch, remote, branch)
+            return refspec, 'refs/remotes/%s/%s' % (remote, branch), branch
+
+        tag = repo_config['tag']
+        return '+refs/tags/%s:refs/tags/%s' % (tag, tag), 'refs/tags/%s' % tag, None
+
+    @staticmethod
+    def prefetch(repo_config):
+        """Fetches the configured branch (or tag) without updating the
+        working tree, the same way pull() does. A later pull of a commit that
+        is already fetched can skip the fetch (see is_fetched()). Returns the
+        exit code."""
+        import logging
+        from process import ProcessWrapper
+        from backends import get_git_backend
+
+        logger = logging.getLogger()
+
+        if 'mirror_path' in repo_config:
+            return GitWrapper.update_mirror(repo_config)
+
+        backend = get_git_backend(repo_config.get('git-backend'))
+        remote = repo_config.get('remote') or 'origin'
+
+        if repo_config.get('pull-mode') == 'minimal':
+            refspec, ref, branch = GitWrapper.get_fetch_refspec(repo_config)
+            return backend.fetch(repo_config['path'], remote, [refspec], repo_config.get('fetch-depth'))
+
+        command = ['git', 'fetch', remote]
+        res = ProcessWrapper().call(command, cwd=repo_config['path'], env=backend.get_env())
+
+        if res != 0:
+            logger.error("Command '%s' failed with exit code %s" % (' '.join(command), res))
+
+        return int(res)
+
+    @staticmethod
+    def is_fetched(repo_config, commit):
+        """Checks if the configured branch (or tag) was already fetched at the
+        specified commit, in which case pull() doesn't need to fetch."""
+        if 'mirror_path' in repo_config:
+            path, ref = repo_config['mirror_path'], GitWrapper.get_target_ref(repo_config)
+        else:
+            path, ref = repo_config['path'], GitWrapper.get_fetch_refspec(repo_config)[1]
+
+        return bool(commit) and GitWrapper.resolve(path, ref, repo_config.get('git-backend')) == commit
+
+    @staticmethod
+    def get_target_ref(repo_config):
+        """The ref of the configured branch (or tag) in a shared mirror."""
+        if repo_config.get('branch') or not repo_config.get('tag'):
+            return 'refs/heads/%s' % (repo_config.get('branch') or 'master')
+
+        return 'refs/tags/%s' % repo_config['tag']
+
+    @staticmethod
+    def update_mirror(repo_config, commit=None):
+        """Creates or updates the bare mirror shared by all repository configs
+        with the same URL. Fetches all branches and tags, unless the expected
+        commit is already there (e.g. fetched for another config)."""
+        import logging
+        import os
+        from process import ProcessWrapper
+        from backends import ShellGitBackend
+
+        try:
+            from gitautodeploy.lock import Lock
+        except ImportError:
+            from lock import Lock
+
+        logger = logging.getLogger()
+        mirror = repo_config['mirror_path']
+
+        env = ShellGitBackend.get_env()
+
+        parent = os.path.dirname(mirror)
+
+        try:
+            os.makedirs(parent)
+        except OSError:
+            # Already created (possibly by another thread)
+            if not os.path.isdir(parent):
+                raise
+
+        # Serialize updates of the mirror
+        lock = Lock(mirror.rstrip('/') + '_fetch')
+        lock.obtain(blocking=True)
+
+        try:
+            commands = []
+
+            if not os.path.isdir(mirror):
+                logger.info("Creating mirror of %s in %s" % (repo_config['url'], mirror))
+                res = ProcessWrapper().call(['git', 'clone', '--bare', repo_config['url'], mirror], env=env)
+
+                if res != 0:
+                    logger.error("Unable to create mirror of %s" % repo_config['url'])
+                    return int(res)
+
+                # Keep branches as local branches, which worktrees check out
+                commands.append(['git', 'config', 'remote.origin.fetch', '+refs/heads/*:refs/heads/*'])
+                commands.append(['git', 'config', '--add', 'remote.origin.fetch', '+refs/tags/*:refs/tags/*'])
+
+            elif commit and GitWrapper.resolve(mirror, GitWrapper.get_target_ref(repo_config)) == commit:
+                logger.info("Mirror %s is up to date" % mirror)
+                return 0
+
+            commands.append(['git', 'fetch', '--prune', 'origin'])
+
+            for command in commands:
+                res = ProcessWrapper().call(command, cwd=mirror, env=env)
+
+                if res != 0:
+                    logger.error("Command '%s' failed with exit code %s" % (' '.join(command), res))
+                    return int(res)
+
+            return 0
+
+        finally:
+            lock.release()
+
+    @staticmethod
+    def pull_worktree(repo_config, commit=None):
+        """Updates a worktree of a shared mirror by updating the mirror, and
+        checking out the configured branch (detached, since the branch is
+        updated by fetching into the mirror)."""
+        import logging
+
+        logger = logging.getLogger()
+
+        res = GitWrapper.update_mirror(repo_config, commit)
+
+        if res == 0:
+            res = GitWrapper.checkout_worktree(repo_config)
+
+        if res == 0:
+            logger.info("Repository %s successfully updated" % repo_config['path'])
+        else:
+            logger.error("Unable to update repository %s" % repo_config['path'])
+
+        return int(res)
+
+    @staticmethod
+    def checkout_worktree(repo_config, create=False):
+        """Checks out the configured branch (or tag) of the shared mirror in
+        the repository path, discarding any local changes."""
+        import logging
+        from process import ProcessWrapper
+        from backends import ShellGitBackend
+
+        logger = logging.getLogger()
+
+        env = ShellGitBackend.get_env()
+
+        ref = GitWrapper.get_target_ref(repo_config)
+
+        if create:
+            before = None
+            command = ['git', 'worktree', 'add', '--force', '--detach', repo_config['path'], ref]
+            cwd = repo_config['mirror_path']
+        else:
+            before = GitWrapper.get_head(repo_config['path'])
+            command = ['git', 'checkout', '--force', '--detach', ref]
+            cwd = repo_config['path']
+
+        res = ProcessWrapper().call(command, cwd=cwd, env=env)
+
+        if res != 0:
+            logger.error("Command '%s' failed with exit code %s" % (' '.join(command), res))
+            return int(res)
+
+        return GitWrapper.update_submodules(repo_config, before, env)
+
+    @staticmethod
+    def clone_worktree(repo_config):
+        """Creates the repository path as a worktree of the shared mirror."""
+        res = GitWrapper.update_mirror(repo_config)
+
+        if res == 0:
+            res = GitWrapper.checkout_worktree(repo_config, create=True)
+
+        return int(res)
+
+    @staticmethod
+    def resolve(path, ref, backend=None):
+        """Gets the commit id of a ref in a local repository, or None."""
+        from backends import get_git_backend
+
+        return get_git_backend(backend).resolve(path, ref)
+
+    @staticmethod
+    def update_submodules(repo_config, before=None, env=None):
+        """Updates the submodules of a repository after its checked out
+        commit changed from before. Only submodules whose commit changed (or
+        that are not checked out) are updated, all of them if .gitmodules
+        changed or the previous commit is unknown. The submodules are updated
+        in parallel, by up to submodule-jobs (default 4) threads, and the time
+        each one took is logged."""
+        import logging
+        import os
+        import time
+        import threading
+        from process import ProcessWrapper
+        from backends import ShellGitBackend
+
+        logger = logging.getLogger()
+        path = repo_config['path']
+
+        if not os.path.exists(os.path.join(path, '.gitmodules')):
+            return 0
+
+        if env is None:
+            env = ShellGitBackend.get_env()
+
+        submodules = GitWrapper.get_submodule_paths(path)
+        changed = None
+
+        if before:
+            changed = GitWrapper.get_changed_submodules(path, before, GitWrapper.get_head(path))
+
+        if changed is None or '.gitmodules' in changed:
+            targets = submodules
+
+            # Submodule URLs might have changed
+            ProcessWrapper().call(['git', 'submodule', 'sync', '--recursive'], cwd=path, env=env)
+
+        else:
+            targets = [sub for sub in submodules if sub in changed or not os.path.exists(os.path.join(path, sub, '.git'))]
+
+        if not targets:
+            logger.info("Submodules of %s are up to date" % path)
+            return 0
+
+        # Register the submodules first, since that updates the repository config
+        res = ProcessWrapper().call(['git', 'submodule', 'init', '--'] + targets, cwd=path, env=env)
+
+        if res != 0:
+            logger.error("Unable to initialize the submodules of %s" % path)
+            return int(res)
+
+        results = []
+        queue = list(targets)
+        lock = threading.Lock()
+
+        # Apply the limits of this thread to the worker threads
+        limits = ProcessWrapper.get_limits()
+
+        def worker():
+            with ProcessWrapper.limits(**limits):
+                update()
+
+        def update():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    sub = queue.pop(0)
+
+                started = time.time()
+                command = ['git', 'submodule', 'update', '--init', '--recursive', '--', sub]
+                res = ProcessWrapper().call(command, cwd=path, env=env)
+                logger.info("Submodule %s updated in %.2f s with exit code %s" % (sub, time.time() - started, res))
+
+                with lock:
+                    results.append(res)
+
+        threads = []
+        for i in range(min(int(repo_config.get('submodule-jobs', 4)), len(targets))):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        failed = [res for res in results if res != 0]
+
+        if failed:
+            logger.error("Unable to update %s of the submodules of %s" % (len(failed), path))
+            return int(failed[0])
+
+        return 0
+
+    @staticmethod
+    def get_submodule_paths(path):
+        """Lists the submodule paths in the .gitmodules file of a
+        repository."""
+        import os
+        import re
+
+        try:
+            with open(os.path.join(path, '.gitmodules')) as f:
+                content = f.read()
+        except IOError:
+            return []
+
+        return re.findall(r'^\s*path\s*=\s*(.+?)\s*$', content, re.MULTILINE)
+
+    @staticmethod
+    def get_changed_submodules(path, before, after):
+        """Lists the submodules (gitlinks) changed between two commits, and
+        .gitmodules if it changed. Returns None if the changes can't be
+        determined."""
+        from process import ProcessWrapper
+
+        if not before or not after:
+            return None
+
+        if before == after:
+            return []
+
+        command = ['git', 'diff-tree', '-r', '-z', '--no-renames', before, after]
+
+        try:
+            res, stdout = ProcessWrapper.get_output(command, cwd=path)
+        except OSError:
+            return None
+
+        if res != 0:
+            return None
+
+        # Entries are ':<old mode> <new mode> <old id> <new id> <status>' and
+        # the path, separated by NUL characters
+        fields = stdout.split('\0')
+        changed = []
+
+        for i in range(0, len(fields) - 1, 2):
+            modes = fields[i].lstrip(':').split(' ')[:2]
+            name = fields[i + 1]
+
+            if '160000' in modes or name == '.gitmodules':
+                changed.append(name)
+
+        return changed
+
     @staticmethod
     def clone(url, branch, path):
         from process import ProcessWrapper
@@ -63,10 +462,51 @@ class GitWrapper():
         return int(res)
 
     @staticmethod
-    def deploy(repo_config):
-        """Executes any supplied post-pull deploy command"""
+    def get_head(path, backend=None):
+        """Gets the id of the commit checked out in a local repository, or
+        None if it can't be determined."""
+        return GitWrapper.resolve(path, 'HEAD', backend)
+
+    @staticmethod
+    def get_changed_files(path, before, after):
+        """Lists the files added, modified or removed between two commits in a
+        local repository. Returns None if the files can't be determined (for
+        example when the commits are not yet fetched)."""
+        import logging
         from process import ProcessWrapper
+        logger = logging.getLogger()
+
+        # Without rename detection, both the old and the new path of a moved
+        # file are listed, just like in the web hook payloads
+        command = ['git', 'diff', '--name-only', '--no-renames', '-z', before, after]
+
+        try:
+            res, stdout = ProcessWrapper.get_output(command, cwd=path)
+        except OSError, e:
+            logger.warning("Unable to list changed files in %s: %s" % (path, e))
+            return None
+
+        if res != 0:
+            logger.info("Unable to list changed files in %s" % path)
+            return None
+
+        return [name for name in stdout.split('\0') if name]
+
+    @staticmethod
+    def deploy(repo_config, before=None, after=None, changed_files=None, cwd=None, output=None, steps=None):
+        """Executes any supplied post-pull deploy command. The commit deployed
+        before, the commit being deployed and the files changed between them
+        (None if unknown) are passed to the commands as environment
+        variables. The commands are executed in the repository path, unless
+        another working directory (e.g. a release directory) is specified.
+        If a list is passed as output, the last deploy-output-size bytes of
+        the output of each command are appended to it. If the commands are
+        configured as deploy steps and a list is passed as steps, the result
+        and timing of each step are appended to it."""
+        from process import ProcessWrapper, OutputBuffer
         import logging
+        import os
+        import tempfile
         logger = logging.getLogger()
 
         if 'path' in repo_config:
@@ -79,12 +519,82 @@ class GitWrapper():
         logger.info('Executing %s deploy commands' % str(len(repo_config['deploy_commands'])))
 
         # Use repository path as default cwd when executing deploy commands
-        cwd = (repo_config['path'] if 'path' in repo_config else None)
+        if not cwd:
+            cwd = (repo_config['path'] if 'path' in repo_config else None)
+
+        env = dict(os.environ)
+        env['GAD_BEFORE'] = before or ''
+        env['GAD_AFTER'] = after or ''
+        env['GAD_REF'] = repo_config.get('branch') or repo_config.get('tag') or ''
+
+        # The changed files are listed in a file, one per line
+        changed_files_path = None
+        if changed_files is not None:
+            fd, changed_files_path = tempfile.mkstemp(prefix='gad-changed-files-')
+            with os.fdopen(fd, 'w') as f:
+                f.write(''.join(name + '\n' for name in changed_files))
+
+            env['GAD_CHANGED_FILES'] = changed_files_path
+            env['GAD_CHANGED_FILES_COUNT'] = str(len(changed_files))
+            logger.info('%s files changed since commit %s' % (len(changed_files), before))
+
+        try:
+            if repo_config.get('deploy_steps'):
+                res = GitWrapper.deploy_steps(repo_config, cwd, env, output, steps)
+
+            else:
+                res = []
+                for cmd in repo_config['deploy_commands']:
+                    buffer = None
+                    if output is not None and repo_config.get('deploy-output-size'):
+                        buffer = OutputBuffer(repo_config['deploy-output-size'])
 
-        res = []
-        for cmd in repo_config['deploy_commands']:
-            res.append(ProcessWrapper().call([cmd], cwd=cwd, shell=True))
+                    res.append(ProcessWrapper().call([cmd], cwd=cwd, shell=True, env=env, output=buffer))
+
+                    if buffer:
+                        output.append(buffer.getvalue())
+
+        finally:
+            if changed_files_path:
+                os.remove(changed_files_path)
 
         logger.info('%s commands executed with status; %s' % (str(len(res)), str(res)))
 
         return res
+
+    @staticmethod
+    def deploy_steps(repo_config, cwd, env, output=None, steps=None):
+        """Executes the deploy steps of a repository config in dependency
+        order, up to deploy-jobs steps at the same time. Returns the exit
+        codes of the steps, None for steps skipped because a step they
+        depend on failed."""
+        from process import ProcessWrapper, OutputBuffer
+        try:
+            from gitautodeploy.deploysteps import DeployStepsExecutor
+        except ImportError:
+            from deploysteps import DeployStepsExecutor
+
+        # The steps are executed in other threads, which need the limits of
+        # the current one
+        limits = ProcessWrapper.get_limits()
+        buffers = {}
+
+        def execute(step):
+            buffer = None
+            if output is not None and repo_config.get('deploy-output-size'):
+                buffer = buffers[step['name']] = OutputBuffer(repo_config['deploy-output-size'])
+
+            with ProcessWrapper.limits(**limits):
+                return ProcessWrapper().call([step['command']], cwd=cwd, shell=True, env=env, output=buffer)
+
+        jobs = repo_config.get('deploy-jobs')
+        results = DeployStepsExecutor(repo_config['deploy_steps'], 4 if jobs is None else jobs).run(execute)
+
+        for result in results:
+            if result['name'] in buffers:
+                output.append(buffers[result['name']].getvalue())
+
+        if steps is not None:
+            steps.extend(results)
+
+        return [result['exit_code'] for result in results]
@@ -1,31 +1,420 @@
+import threading
+
+
+class OutputBuffer(object):
+    """Keeps the last lines of the output of a process, up to a maximum
+    number of bytes."""
+
+    def __init__(self, max_size=16384):
+        from collections import deque
+
+        self.max_size = max_size
+        self._lines = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        """Add a line, dropping the oldest lines exceeding the maximum
+        size. Of a line longer than the maximum size, only its end is
+        kept."""
+        line = line + '\n'
+
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line)
+
+            while self._size > self.max_size and len(self._lines) > 1:
+                self._size -= len(self._lines.popleft())
+
+            if self._size > self.max_size:
+                self._lines[0] = self._lines[0][self._size - self.max_size:]
+                self._size = len(self._lines[0])
+
+    def getvalue(self):
+        with self._lock:
+            return ''.join(self._lines)
+
+
+# Limits applied to the processes started by each thread (see
+# ProcessWrapper.limits())
+_limits = threading.local()
+
+# Exit code reported for commands killed (or not started) because of a
+# timeout, like timeout(1) does
+TIMEOUT_EXIT_CODE = 124
+
+# ioprio_set(2) system call numbers
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+                       'armv7l': 314, 'armv6l': 314, 'ppc64le': 273, 's390x': 282}
+
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+class ProcessLimits(object):
+    """Sets the limits applied to the processes started by the current
+    thread, for the duration of a with block."""
+
+    def __init__(self, limits):
+        self.limits = limits
+
+    def __enter__(self):
+        self.previous = getattr(_limits, 'current', {})
+        _limits.current = self.limits
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _limits.current = self.previous
+        return False
+
+
 class ProcessWrapper():
     """Wraps the subprocess popen method and provides logging."""
 
+    # Lines longer than this are split, so that output without line breaks
+    # (e.g. progress indicators using \r) doesn't accumulate in memory
+    max_line_length = 65536
+
     def __init__(self):
         pass
 
+    @staticmethod
+    def limits(command_timeout=None, deadline=None, rlimits=None, nice=None, ionice=None):
+        """Limits applied to the processes started by the current thread
+        within the returned context (a with block):
+
+        command_timeout: Seconds after which a process is killed.
+        deadline: Time (as returned by time.time()) after which processes
+            are killed, and no new processes are started.
+        rlimits: Resource limits, a dict with the keys 'cpu' (seconds),
+            'address-space' (bytes) and 'open-files'.
+        nice: Niceness increment.
+        ionice: I/O scheduling class 'idle', 'best-effort' or 'realtime',
+            optionally followed by a priority level (e.g. 'best-effort:7').
+
+        Processes killed because of a timeout are killed along with all
+        processes in their process group, and report exit code 124."""
+        return ProcessLimits({'command_timeout': command_timeout, 'deadline': deadline,
+                              'rlimits': rlimits, 'nice': nice, 'ionice': ionice})
+
+    @staticmethod
+    def get_limits():
+        """The limits of the current thread, to pass on to other threads as
+        ProcessWrapper.limits(**limits)."""
+        return dict(getattr(_limits, 'current', {}))
+
+    @staticmethod
+    def get_repo_limits(repo_config):
+        """The limits configured for the pull and deploy of a repository
+        config, starting now."""
+        import time
+
+        deadline = None
+        if repo_config.get('deploy-timeout'):
+            deadline = time.time() + repo_config['deploy-timeout']
+
+        return ProcessWrapper.limits(command_timeout=repo_config.get('command-timeout'),
+                                     deadline=deadline,
+                                     rlimits=repo_config.get('deploy-limits'),
+                                     nice=repo_config.get('deploy-nice'),
+                                     ionice=repo_config.get('deploy-ionice'))
+
     @staticmethod
     def call(*popenargs, **kwargs):
         """Run command with arguments. Wait for command to complete. Sends
-        output to logging module. The arguments are the same as for the Popen
-        constructor."""
-        
+        output to logging module, line by line as it is produced. The
+        arguments are the same as for the Popen constructor, and an optional
+        OutputBuffer (output) receiving the output lines. The limits of the
+        current thread (see limits()) apply."""
+
         from subprocess import Popen, PIPE
+        import os
+        import time
         import logging
         logger = logging.getLogger()
 
+        output = kwargs.pop('output', None)
+        stdout_data = kwargs.pop('stdout_data', None)
+        limits = ProcessWrapper.get_limits()
+        command = popenargs[0] if popenargs else kwargs.get('args')
+
+        timeout = limits.get('command_timeout')
+
+        if limits.get('deadline') is not None:
+            remaining = limits['deadline'] - time.time()
+
+            if remaining <= 0:
+                logger.error("Deploy timeout exceeded, not executing %s" % command)
+                return TIMEOUT_EXIT_CODE
+
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        if os.name == 'posix':
+            preexec_fn = ProcessWrapper.get_preexec_fn(limits, new_group=timeout is not None)
+
+            if preexec_fn:
+                kwargs['preexec_fn'] = preexec_fn
+
         kwargs['stdout'] = PIPE
         kwargs['stderr'] = PIPE
 
         p = Popen(*popenargs, **kwargs)
-        stdout, stderr = p.communicate()
 
-        if stdout:
-            for line in stdout.strip().split("\n"):
-                logger.info(line)
+        # Read both pipes in separate threads, so that neither pipe fills up
+        readers = []
+        for pipe, log in [(p.stdout, logger.info), (p.stderr, logger.error)]:
+            if pipe is p.stdout and stdout_data is not None:
+                reader = threading.Thread(target=ProcessWrapper.collect, args=(pipe, stdout_data))
+            else:
+                reader = threading.Thread(target=ProcessWrapper.stream, args=(pipe, log, output))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+
+        killer = None
+        if timeout is not None:
+            killer = ProcessKiller(p, timeout)
+            killer.start()
+
+        p.wait()
+
+        if killer:
+            killer.cancel()
+
+        for reader in readers:
+
+            # Processes escaping the killed process group could keep the
+            # pipes open
+            reader.join(ProcessKiller.grace_period if killer and killer.killed else None)
+
+        if killer and killer.killed:
+            logger.error("Command %s timed out after %.1f seconds and was killed" % (command, timeout))
+            return TIMEOUT_EXIT_CODE
+
+        return p.returncode
+
+    @staticmethod
+    def get_output(*popenargs, **kwargs):
+        """Run command with arguments like call(), but collect the standard
+        output instead of logging it. Returns the exit code and the output,
+        as is."""
+        data = []
+        res = ProcessWrapper.call(*popenargs, stdout_data=data, **kwargs)
+        return res, ''.join(data)
+
+    @staticmethod
+    def get_preexec_fn(limits, new_group=False):
+        """Function setting up a child process according to the limits,
+        executed in the child process before the command. Returns None if
+        there's nothing to set up."""
+        import os
+        import logging
+        logger = logging.getLogger()
+
+        rlimits = []
+
+        if limits.get('rlimits'):
+            import resource
+
+            names = {'cpu': resource.RLIMIT_CPU, 'address-space': resource.RLIMIT_AS, 'open-files': resource.RLIMIT_NOFILE}
+
+            for name, value in limits['rlimits'].items():
+                if name not in names:
+                    logger.warning("Unknown resource limit '%s'" % name)
+                    continue
+
+                # Unprivileged processes can't raise their hard limit
+                soft, hard = resource.getrlimit(names[name])
+                value = int(value)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+
+                rlimits.append((names[name], (value, value)))
+
+        nice = int(limits.get('nice') or 0)
+        ioprio_set = ProcessWrapper.get_ioprio_set(limits.get('ionice')) if limits.get('ionice') else None
+
+        if not (new_group or rlimits or nice or ioprio_set):
+            return None
+
+        def preexec_fn():
+            import resource
+
+            # Let the whole process group be killed on timeout
+            if new_group:
+                os.setsid()
+
+            for resource_id, value in rlimits:
+                resource.setrlimit(resource_id, value)
+
+            if nice:
+                os.nice(nice)
+
+            if ioprio_set:
+                ioprio_set()
+
+        return preexec_fn
+
+    @staticmethod
+    def get_ioprio_set(ionice):
+        """Function setting the I/O scheduling class and priority of the
+        calling process, or None if not supported (Linux only) or invalid.
+        Failures are reported on the standard error of the process."""
+        import os
+        import ctypes
+        import ctypes.util
+        import platform
+        import logging
+        logger = logging.getLogger()
+
+        name, _, level = str(ionice).partition(':')
+
+        if name not in IOPRIO_CLASSES:
+            logger.warning("Unknown I/O scheduling class '%s'" % name)
+            return None
+
+        if level and (not level.isdigit() or int(level) > 7):
+            logger.warning("Invalid I/O priority level '%s', expected 0 to 7" % level)
+            return None
+
+        syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+
+        if platform.system() != 'Linux' or not syscall_number:
+            logger.warning("Setting the I/O scheduling class is not supported on this platform")
+            return None
+
+        # IOPRIO_PRIO_VALUE(class, level)
+        ioprio = (IOPRIO_CLASSES[name] << 13) | (int(level or 0) if name != 'idle' else 0)
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        def ioprio_set():
+            # IOPRIO_WHO_PROCESS, calling process
+            if libc.syscall(syscall_number, 1, 0, ioprio) == -1:
+
+                # Logging can't be used in the forked process, but its
+                # standard error is logged by the parent
+                os.write(2, "Unable to set the I/O scheduling class to %s: %s\n" % (ionice, os.strerror(ctypes.get_errno())))
+
+        return ioprio_set
+
+    @staticmethod
+    def stream(pipe, log, output=None):
+        """Log the lines read from a pipe until it is closed, and add them to
+        the output buffer."""
+        import os
+
+        def emit(line):
+            line = line.rstrip('\r')
+            log(line)
+
+            if output is not None:
+                output.write(line)
+
+        partial = ''
+
+        try:
+            while True:
+                data = os.read(pipe.fileno(), 65536)
+
+                if not data:
+                    break
+
+                lines = (partial + data).split('\n')
+                partial = lines.pop()
+
+                for line in lines:
+                    emit(line)
+
+                while len(partial) > ProcessWrapper.max_line_length:
+                    emit(partial[:ProcessWrapper.max_line_length])
+                    partial = partial[ProcessWrapper.max_line_length:]
+
+            if partial:
+                emit(partial)
+
+        finally:
+            pipe.close()
+
+
+    @staticmethod
+    def collect(pipe, data):
+        """Append the data read from a pipe to a list, until it is
+        closed."""
+        import os
+
+        try:
+            while True:
+                chunk = os.read(pipe.fileno(), 65536)
+
+                if not chunk:
+                    break
+
+                data.append(chunk)
+
+        finally:
+            pipe.close()
+
+
+class ProcessKiller(object):
+    """Kills a process and its process group after a timeout, first with
+    SIGTERM, and with SIGKILL if it didn't exit within a grace period."""
+
+    grace_period = 5
+
+    def __init__(self, process, timeout):
+        self.process = process
+        self.timeout = timeout
+        self.killed = False
+        self._cancelled = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._schedule(self.timeout, self.terminate)
+
+    def cancel(self):
+        """Stop the killer once the process has exited."""
+        with self._lock:
+            self._cancelled = True
+            timer = self._timer
+
+        timer.cancel()
+        timer.join()
+
+    def _schedule(self, delay, target):
+        with self._lock:
+            if self._cancelled:
+                return
+
+            self._timer = threading.Timer(delay, target)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def terminate(self):
+        import signal
+
+        if self.signal(signal.SIGTERM):
+            self.killed = True
+            self._schedule(self.grace_period, self.kill)
+
+    def kill(self):
+        import signal
+        self.signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    def signal(self, signum):
+        """Send a signal to the process group. Returns False if the process
+        has exited already."""
+        import os
+
+        if self.process.returncode is not None:
+            return False
+
+        try:
+            if os.name == 'posix':
+                os.killpg(self.process.pid, signum)
+            else:
+                self.process.terminate()
 
-        if stderr:
-            for line in stderr.strip().split("\n"):
-                logger.error(line)
+        except OSError:
+            return False
 
-        return p.returncode
\ No newline at end of file
+        return True
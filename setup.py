@@ -7,14 +7,14 @@ setup(name='git-auto-deploy',
       author_email='oliver@poignant.se',
       packages = find_packages(),
       package_data={'gitautodeploy': ['data/*']},
+      extras_require={
+          'dulwich': ['dulwich>=0.19.7']
+      },
       entry_points={
           'console_scripts': [
               'git-auto-deploy = gitautodeploy.__main__:main'
           ]
       },
-      install_requires=[
-            'lockfile'
-      ],
       description = "Deploy your GitHub, GitLab or Bitbucket projects automatically on Git push events or webhooks.",
       long_description = "GitAutoDeploy consists of a HTTP server that listens for Web hook requests sent from GitHub, GitLab or Bitbucket servers. This application allows you to continuously and automatically deploy you projects each time you push new commits to your repository."
 )
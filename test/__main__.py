@@ -1,4 +1,11 @@
 
 if __name__ == '__main__':
-    from test_parsers import main
-    main()
+    import os
+    import sys
+    import unittest
+
+    # Run all test modules (test_*.py) in this directory
+    suite = unittest.defaultTestLoader.discover(os.path.dirname(os.path.realpath(__file__)), pattern='test_*.py')
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+
+    sys.exit(0 if result.wasSuccessful() else 1)
@@ -0,0 +1,47 @@
+"""Measures the time it takes to evaluate changed-paths filters for a number
+of repository configs (e.g. one per service in a monorepo) against a push
+payload.
+
+Usage: python test/benchmarks/changed_paths.py [configs] [files] [rounds]
+"""
+import os
+import sys
+import json
+import timeit
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+if __name__ == '__main__':
+    from gitautodeploy.cli.config import get_config_defaults, init_config
+    from gitautodeploy.filters import get_compiled_filters
+    from gitautodeploy.models import WebhookRequest
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    # A push changing files in the last service only
+    commits = [{'added': [], 'modified': ['services/service-%s/src/file-%s.py' % (count - 1, i)], 'removed': []} for i in range(files)]
+    body = json.dumps({'ref': 'refs/heads/master', 'commits': commits})
+
+    config = get_config_defaults()
+    config['repositories'] = [{
+        'url': 'https://github.com/example/monorepo.git',
+        'path': '/srv/service-%s' % i,
+        'filters': [{'ref': 'refs/heads/master', 'changed-paths': ['services/service-%s/**' % i, 'shared/*.yml']}]
+    } for i in range(count)]
+    init_config(config)
+
+    def evaluate():
+        request = WebhookRequest({}, body)
+        return [get_compiled_filters(repo_config).match(request, '') for repo_config in config['repositories']]
+
+    assert evaluate().count(True) == 1
+
+    elapsed = min(timeit.repeat(evaluate, number=rounds, repeat=5))
+
+    print "configs:      %8s" % count
+    print "files:        %8s" % files
+    print "per request:  %8.1f us" % (elapsed / rounds * 1000000)
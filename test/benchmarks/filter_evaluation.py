@@ -0,0 +1,83 @@
+"""Measures the time it takes to evaluate the filters of a repository
+against a webhook payload, using the filters compiled by init_config,
+compared to interpreting the filter config on each request.
+
+Usage: python test/benchmarks/filter_evaluation.py [filters] [rounds]
+"""
+import os
+import sys
+import json
+import timeit
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def interpret(filters, data, action):
+    """Filter evaluation by interpreting the filter config."""
+    for filter in filters:
+        for filter_key, filter_value in filter.iteritems():
+            if filter_value == None:
+                continue
+            if filter_key == 'action' and filter_value == action:
+                continue
+            node_value = data
+            for node_key in filter_key.split('.'):
+                if not node_key in node_value:
+                    return False
+                node_value = node_value[node_key]
+            if filter_value == node_value:
+                continue
+            if filter_value == True:
+                continue
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    from gitautodeploy.cli.config import get_config_defaults, init_config
+    from gitautodeploy.filters import get_compiled_filters
+    from gitautodeploy.models import WebhookRequest
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with open(os.path.join(repo_root, 'test', 'samples', 'github-pr-close.positive.test-case.json')) as f:
+        test_case = json.load(f)
+
+    request = WebhookRequest(test_case['headers'], json.dumps(test_case['payload']))
+    payload = request.payload
+
+    # Collect paths and values of all scalar values in the payload
+    leaves = []
+    def collect(node, path):
+        for key, value in sorted(node.items()):
+            if isinstance(value, dict):
+                collect(value, path + [key])
+            elif value is not None and not isinstance(value, list):
+                leaves.append(('.'.join(path + [key]), value))
+    collect(payload, [])
+
+    # Filters that all match the payload (worst case, as all are evaluated)
+    filters = []
+    for i in range(count):
+        filter = {'action': 'closed', 'sender.type': None}
+        for n in range(5):
+            key, value = leaves[(i * 5 + n) % len(leaves)]
+            filter[key] = True if n == 0 else value
+        filters.append(filter)
+
+    config = get_config_defaults()
+    config['repositories'] = [{'url': 'https://github.com/olipo186/Git-Auto-Deploy.git', 'filters': filters}]
+    init_config(config)
+    repo_config = config['repositories'][0]
+
+    assert interpret(filters, payload, 'closed')
+    assert get_compiled_filters(repo_config).match(request, 'closed')
+
+    interpreted = min(timeit.repeat(lambda: interpret(filters, payload, 'closed'), number=rounds, repeat=5))
+    compiled = min(timeit.repeat(lambda: get_compiled_filters(repo_config).match(request, 'closed'), number=rounds, repeat=5))
+
+    print "filters:      %8s" % count
+    print "interpreted:  %8.1f us" % (interpreted / rounds * 1000000)
+    print "compiled:     %8.1f us" % (compiled / rounds * 1000000)
@@ -0,0 +1,93 @@
+"""Measures the per-deploy overhead of the git backends: the time it takes to
+update a repository using the minimal pull mode (fetch, checkout and HEAD
+lookups), with a local bare repository as remote. A new commit changing a few
+files is pushed to the remote before each update.
+
+Usage: python test/benchmarks/git_backends.py [rounds] [files]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def git(cwd, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='gad', GIT_AUTHOR_EMAIL='gad@localhost',
+               GIT_COMMITTER_NAME='gad', GIT_COMMITTER_EMAIL='gad@localhost')
+    subprocess.check_call(('git',) + args, cwd=cwd, env=env, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+
+
+if __name__ == '__main__':
+    from gitautodeploy.wrappers import GitWrapper
+    from gitautodeploy.wrappers.backends import get_git_backend
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    directory = tempfile.mkdtemp()
+
+    backends = ['shell']
+    if get_git_backend('dulwich').name == 'dulwich':
+        backends.append('dulwich')
+
+    try:
+        remote = os.path.join(directory, 'remote.git')
+        work = os.path.join(directory, 'work')
+
+        git(directory, 'init', '--bare', '-q', remote)
+        git(directory, 'clone', '-q', remote, work)
+        for i in range(files):
+            with open(os.path.join(work, 'file-%s.txt' % i), 'w') as f:
+                f.write('%s\n' % i)
+        git(work, 'add', '.')
+        git(work, 'commit', '-q', '-m', 'initial')
+        git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        results = {}
+
+        for backend in backends:
+            path = os.path.join(directory, backend)
+            git(directory, 'clone', '-q', remote, path)
+
+            repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': 'master', 'tag': None,
+                           'pull-mode': 'minimal', 'git-backend': backend}
+            times = []
+
+            for i in range(rounds):
+                for j in range(3):
+                    with open(os.path.join(work, 'file-%s.txt' % ((i * 3 + j) % files)), 'a') as f:
+                        f.write('%s %s\n' % (backend, i))
+                git(work, 'commit', '-q', '-a', '-m', '%s %s' % (backend, i))
+                git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+                # A deploy looks up HEAD before and after the pull
+                started = time.time()
+                GitWrapper.get_head(path, backend)
+                assert GitWrapper.pull(repo_config) == 0
+                GitWrapper.get_head(path, backend)
+                times.append(time.time() - started)
+
+            # The result must be identical to a checkout by git itself
+            head = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path)
+            assert head == subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=work)
+            assert subprocess.check_output(['git', 'status', '--porcelain'], cwd=path) == ''
+            assert subprocess.check_output(['git', 'symbolic-ref', 'HEAD'], cwd=path).strip() == 'refs/heads/master'
+
+            times.sort()
+            results[backend] = times
+
+        print "rounds:   %8s" % rounds
+        print "files:    %8s" % files
+        for backend in backends:
+            times = results[backend]
+            print "%-8s  median: %7.1f ms  mean: %7.1f ms" % (backend, times[len(times) / 2] * 1000, sum(times) / len(times) * 1000)
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,80 @@
+"""Measures the time between releasing a repository lock and a waiting
+thread (in the same process) or process obtaining it.
+
+Usage: python test/benchmarks/lock_handoff.py [rounds]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def thread_handoff(path, timeout):
+    from gitautodeploy.lock import Lock
+
+    a = Lock(path)
+    b = Lock(path)
+    obtained = []
+
+    a.obtain()
+
+    def wait():
+        b.obtain(blocking=True, timeout=timeout)
+        obtained.append(time.time())
+        b.release()
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.01)
+
+    released = time.time()
+    a.release()
+    thread.join()
+
+    return obtained[0] - released
+
+
+def process_handoff(path, timeout):
+    from gitautodeploy.lock import Lock
+
+    a = Lock(path)
+    a.obtain()
+
+    r, w = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        b = Lock(path)
+        b.obtain(blocking=True, timeout=timeout)
+        os.write(w, repr(time.time()))
+        os._exit(0)
+
+    time.sleep(0.01)
+
+    released = time.time()
+    a.release()
+    obtained = float(os.read(r, 64))
+    os.waitpid(pid, 0)
+    os.close(r)
+    os.close(w)
+
+    return obtained - released
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'status_running')
+
+    try:
+        for name, handoff in [('thread', thread_handoff), ('process', process_handoff)]:
+            for timeout in [None, 60]:
+                times = sorted(handoff(path, timeout) for i in range(rounds))
+                print "%-8s timeout=%-5s median: %7.3f ms  max: %7.3f ms" % (name, timeout, times[len(times) / 2] * 1000, times[-1] * 1000)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,65 @@
+"""Measures the time it takes to identify the service and the matching
+repositories of a large GitHub push webhook, compared to decoding the
+request body with json.loads.
+
+Usage: python test/benchmarks/payload_parsing.py [commits] [rounds]
+"""
+import os
+import sys
+import json
+import copy
+import timeit
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def create_request_body(commits):
+    """Create a push payload based on the GitHub push sample, with the
+    specified number of commits."""
+    with open(os.path.join(repo_root, 'test', 'samples', 'github-push.test-case.json')) as f:
+        test_case = json.load(f)
+
+    payload = test_case['payload']
+    commit = payload['commits'][0]
+    payload['commits'] = []
+
+    for i in range(commits):
+        item = copy.deepcopy(commit)
+        item['id'] = '%040x' % i
+        item['modified'] = ['src/module%s/file%s.py' % (i % 50, n) for n in range(10)]
+        payload['commits'].append(item)
+
+    return test_case['headers'], json.dumps(payload)
+
+
+def handle(headers, body, config):
+    from gitautodeploy.httpserver import WebhookRequestHandler
+    from gitautodeploy.models import WebhookRequest
+
+    request = WebhookRequest(headers, body)
+    parser = WebhookRequestHandler.figure_out_service_from_request(request)
+    return parser(config).get_repo_params_from_request(request)
+
+
+if __name__ == '__main__':
+    import logging
+    from gitautodeploy.cli.config import get_config_defaults, init_config
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    config = get_config_defaults()
+    config['repositories'] = [{'url': 'https://github.com/olipo186/Git-Auto-Deploy.git'}]
+    init_config(config)
+
+    headers, body = create_request_body(commits)
+
+    decode = min(timeit.repeat(lambda: json.loads(body), number=1, repeat=rounds))
+    pipeline = min(timeit.repeat(lambda: handle(headers, body, config), number=1, repeat=rounds))
+
+    print "payload size:            %8.2f MB" % (len(body) / 1024.0 / 1024.0)
+    print "json.loads:              %8.1f ms" % (decode * 1000)
+    print "service + repo matching: %8.1f ms (%.1fx json.loads)" % (pipeline * 1000, pipeline / decode)
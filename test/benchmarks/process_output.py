@@ -0,0 +1,81 @@
+"""Measures the peak memory usage (maximum resident set size) of a process
+running a synthetic noisy command through ProcessWrapper.call, compared to
+collecting the whole output with Popen.communicate() before logging it. Each
+variant runs in a separate Python process. The output is logged to a handler
+discarding it.
+
+Usage: python test/benchmarks/process_output.py [megabytes]
+"""
+import os
+import sys
+import subprocess
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+# Prints the given number of megabytes of 100 byte lines, half of them to stderr
+NOISY_COMMAND = [sys.executable, '-c', 'import sys\n'
+                 'line = "x" * 99 + "\\n"\n'
+                 'for i in range(int(sys.argv[1]) * 10000):\n'
+                 '    (sys.stdout if i % 2 else sys.stderr).write(line)\n']
+
+
+def communicate(command):
+    """Previous implementation of ProcessWrapper.call."""
+    from subprocess import Popen, PIPE
+    import logging
+    logger = logging.getLogger()
+
+    p = Popen(command, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = p.communicate()
+
+    if stdout:
+        for line in stdout.strip().split("\n"):
+            logger.info(line)
+
+    if stderr:
+        for line in stderr.strip().split("\n"):
+            logger.error(line)
+
+    return p.returncode
+
+
+def run(variant, megabytes):
+    import time
+    import logging
+    import resource
+    from gitautodeploy.wrappers import ProcessWrapper, OutputBuffer
+
+    logger = logging.getLogger()
+    logger.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+    logger.setLevel(logging.INFO)
+
+    command = NOISY_COMMAND + [str(megabytes)]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.time()
+    if variant == 'communicate':
+        assert communicate(command) == 0
+    else:
+        output = OutputBuffer(16384)
+        assert ProcessWrapper.call(command, output=output) == 0
+        assert len(output.getvalue()) <= 16384
+
+    duration = time.time() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux
+    print "%-12s  peak RSS: %8.1f MB  (+%7.1f MB)  time: %6.2f s" % (variant, peak / 1024.0, (peak - baseline) / 1024.0, duration)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print "output:    %6s MB" % megabytes
+    for variant in ['communicate', 'stream']:
+        sys.stdout.flush()
+        subprocess.check_call([sys.executable, os.path.realpath(__file__), '--run', variant, str(megabytes)])
@@ -0,0 +1,86 @@
+"""Measures the time it takes to update a repository using the default pull
+mode and the minimal pull mode (fetching only the configured branch), with a
+local bare repository as remote. A new commit is pushed to the remote before
+each update.
+
+Usage: python test/benchmarks/pull_modes.py [rounds] [branches]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def git(cwd, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='gad', GIT_AUTHOR_EMAIL='gad@localhost',
+               GIT_COMMITTER_NAME='gad', GIT_COMMITTER_EMAIL='gad@localhost')
+    subprocess.check_call(('git',) + args, cwd=cwd, env=env, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+
+
+if __name__ == '__main__':
+    from gitautodeploy.wrappers import GitWrapper
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    branches = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    directory = tempfile.mkdtemp()
+
+    try:
+        remote = os.path.join(directory, 'remote.git')
+        work = os.path.join(directory, 'work')
+
+        git(directory, 'init', '--bare', '-q', remote)
+        git(directory, 'clone', '-q', remote, work)
+        for i in range(100):
+            with open(os.path.join(work, 'file-%s.txt' % i), 'w') as f:
+                f.write('%s\n' % i)
+        git(work, 'add', '.')
+        git(work, 'commit', '-q', '-m', 'initial')
+        git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        # Other branches, which the default pull mode fetches as well
+        for i in range(branches):
+            git(work, 'commit', '-q', '--allow-empty', '-m', 'branch %s' % i)
+            git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/feature-%s' % i)
+            git(work, 'reset', '-q', '--hard', 'HEAD~1')
+
+        results = {}
+
+        for mode in ['full', 'minimal']:
+            path = os.path.join(directory, mode)
+            git(directory, 'clone', '-q', remote, path)
+
+            repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': 'master', 'tag': None, 'pull-mode': mode}
+            times = []
+
+            for i in range(rounds):
+                git(work, 'commit', '-q', '--allow-empty', '-m', '%s %s' % (mode, i))
+                git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+                # Also update a feature branch
+                git(work, 'push', '-q', '--force', 'origin', 'HEAD:refs/heads/feature-%s' % (i % branches))
+
+                started = time.time()
+                assert GitWrapper.pull(repo_config) == 0
+                times.append(time.time() - started)
+
+            head = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path)
+            assert head == subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=work)
+
+            times.sort()
+            results[mode] = times
+
+        print "rounds:   %8s" % rounds
+        for mode in ['full', 'minimal']:
+            times = results[mode]
+            print "%-8s  median: %7.1f ms  mean: %7.1f ms" % (mode, times[len(times) / 2] * 1000, sum(times) / len(times) * 1000)
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,61 @@
+"""Measures the time it takes to find the repository configs matching the
+URLs of a webhook, using the URL index built by init_config, compared to
+scanning all configured repositories for each URL.
+
+Usage: python test/benchmarks/repository_matching.py [repositories] [rounds]
+"""
+import os
+import sys
+import timeit
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def linear_scan(config, urls):
+    """Repository matching by scanning all configured repositories."""
+    configs = []
+    for url in urls:
+        for repo_config in config['repositories']:
+            if repo_config in configs:
+                continue
+            if repo_config['url'] == url:
+                configs.append(repo_config)
+
+    return configs
+
+
+if __name__ == '__main__':
+    from gitautodeploy.cli.config import get_config_defaults, init_config
+    from gitautodeploy.parsers.common import WebhookRequestParser
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    config = get_config_defaults()
+    config['repositories'] = []
+
+    for i in range(count):
+        config['repositories'].append({
+            'url': 'https://github.com/org%s/repo%s.git' % (i % 100, i),
+            'path': '/srv/repo%s' % i
+        })
+
+    init_config(config)
+
+    # A GitHub push webhook lists the repository URL for several protocols
+    n = count - 1
+    urls = ['https://github.com/org%s/repo%s' % (n % 100, n),
+            'git://github.com/org%s/repo%s.git' % (n % 100, n),
+            'https://github.com/org%s/repo%s.git' % (n % 100, n),
+            'git@github.com:org%s/repo%s.git' % (n % 100, n)]
+
+    parser = WebhookRequestParser(config)
+    assert parser.get_matching_repo_configs(urls) == linear_scan(config, urls)
+
+    scan = min(timeit.repeat(lambda: linear_scan(config, urls), number=1, repeat=rounds))
+    index = min(timeit.repeat(lambda: parser.get_matching_repo_configs(urls), number=1, repeat=rounds))
+
+    print "repositories:  %8s" % count
+    print "linear scan:   %8.3f ms" % (scan * 1000)
+    print "url index:     %8.3f ms" % (index * 1000)
@@ -0,0 +1,76 @@
+"""Measures the response time of webhooks for a fast deploying repository
+while another repository is running a long deploy command.
+
+Usage: python test/benchmarks/webhook_latency.py [deploy seconds] [requests]
+"""
+import os
+import sys
+import json
+import time
+import threading
+import urllib2
+
+repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+sys.path.insert(1, repo_root)
+
+
+def start_gad(workers, slow_seconds):
+    from gitautodeploy import GitAutoDeploy
+    from gitautodeploy.cli.config import get_config_defaults, init_config
+
+    config = get_config_defaults()
+    config.update({
+        'port': 0,
+        'intercept-stdout': False,
+        'log-level': 'CRITICAL',
+        'server-workers': workers,
+        'repositories': [
+            {'url': 'https://github.com/bench/slow.git', 'deploy': 'sleep %s' % slow_seconds},
+            {'url': 'https://github.com/bench/fast.git', 'deploy': 'true'}
+        ]
+    })
+    init_config(config)
+
+    app = GitAutoDeploy()
+    app.setup(config)
+
+    thread = threading.Thread(target=app.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return app
+
+
+def post(port, name):
+    payload = json.dumps({'ref': 'refs/heads/master',
+                          'repository': {'url': 'https://github.com/bench/%s.git' % name}})
+    request = urllib2.Request('http://localhost:%s/' % port, payload,
+                              {'Content-Type': 'application/json', 'X-GitHub-Event': 'push'})
+    started = time.time()
+    urllib2.urlopen(request).read()
+    return time.time() - started
+
+
+def run(workers, slow_seconds, count):
+    app = start_gad(workers, slow_seconds)
+
+    # Start a long running deploy and give it a moment to be accepted
+    slow = threading.Thread(target=post, args=(app._port, 'slow'))
+    slow.start()
+    time.sleep(0.2)
+
+    latencies = sorted(post(app._port, 'fast') for i in range(count))
+    slow.join()
+    app._server.shutdown()
+    app.stop()
+
+    print "server-workers=%-2s median %7.1f ms  max %7.1f ms" % (
+        workers, latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000)
+
+
+if __name__ == '__main__':
+    slow_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for workers in [0, 4]:
+        run(workers, slow_seconds, count)
@@ -14,3 +14,33 @@ class GitWrapper(object):
     def deploy(*args, **kwargs):
         """Fake deploy"""
         return 0
+
+    @staticmethod
+    def get_changed_files(*args, **kwargs):
+        """Fake git diff"""
+        return None
+
+    @staticmethod
+    def get_head(*args, **kwargs):
+        """Fake git rev-parse"""
+        return None
+
+    @staticmethod
+    def clone_worktree(*args, **kwargs):
+        """Fake git worktree add"""
+        return 0
+
+    @staticmethod
+    def is_fetched(*args, **kwargs):
+        """Fake git rev-parse"""
+        return False
+
+    @staticmethod
+    def prefetch(*args, **kwargs):
+        """Fake git fetch"""
+        return 0
+
+    @staticmethod
+    def resolve(*args, **kwargs):
+        """Fake git rev-parse"""
+        return None
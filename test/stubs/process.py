@@ -4,3 +4,17 @@ class ProcessWrapper():
     def call(*args, **kwargs):
         """Fake process call"""
         return 0
+
+    @staticmethod
+    def get_repo_limits(*args, **kwargs):
+        """Fake process limits"""
+        return ProcessLimits()
+
+
+class ProcessLimits(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
@@ -0,0 +1,142 @@
+import unittest
+
+
+class AsyncWebhookServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def start_server(self, workers):
+        """Start a server whose POST requests to /slow block until
+        self.release is set."""
+        import threading
+        from BaseHTTPServer import BaseHTTPRequestHandler
+        from gitautodeploy.asyncserver import AsyncWebhookServer
+
+        release = self.release = threading.Event()
+        started = self.started = threading.Event()
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.getheader('content-length')))
+
+                if self.path == '/slow':
+                    started.set()
+                    release.wait()
+
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = AsyncWebhookServer(('127.0.0.1', 0), Handler, backlog=50, workers=workers)
+        self.port = self.server.socket.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        if getattr(self, 'server', None):
+            self.release.set()
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+
+    def connect(self):
+        import socket
+
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        sock.settimeout(5)
+        return sock
+
+    def post(self, sock, path, body):
+        sock.sendall('POST %s HTTP/1.0\r\nContent-Length: %s\r\n\r\n%s' % (path, len(body), body))
+
+    def read_response(self, sock):
+        data = ''
+
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        sock.close()
+        return data
+
+    def test_concurrent_connections(self):
+        self.start_server(workers=2)
+
+        # A slow request keeps one worker busy
+        slow = self.connect()
+        self.post(slow, '/slow', 'slow')
+        self.assertTrue(self.started.wait(5))
+
+        # Many connections are open at the same time, some of them idle with
+        # a partially sent request
+        idle = [self.connect() for i in range(20)]
+        for sock in idle:
+            sock.sendall('POST /fast HTTP/1.0\r\nContent-Le')
+
+        fast = []
+        for i in range(20):
+            sock = self.connect()
+            self.post(sock, '/fast', 'fast %s' % i)
+            fast.append(sock)
+
+        # The other requests are answered while the slow one is still running
+        for i, sock in enumerate(fast):
+            self.assertTrue(self.read_response(sock).endswith('\r\n\r\nfast %s' % i))
+
+        self.assertFalse(self.release.is_set())
+
+        for i, sock in enumerate(idle):
+            sock.sendall('ngth: 4\r\n\r\nidle')
+            self.assertTrue(self.read_response(sock).endswith('\r\n\r\nidle'))
+
+        self.release.set()
+        self.assertTrue(self.read_response(slow).endswith('\r\n\r\nslow'))
+
+    def test_inline(self):
+        self.start_server(workers=0)
+
+        # Without workers, requests are handled on the event loop thread
+        sock = self.connect()
+        self.post(sock, '/fast', 'fast')
+        self.assertTrue(self.read_response(sock).endswith('\r\n\r\nfast'))
+
+    def test_detailed_response_requires_workers(self):
+        import logging
+        from gitautodeploy.gitautodeploy import GitAutoDeploy
+
+        app = GitAutoDeploy()
+        config = {'host': '127.0.0.1', 'server-engine': 'event', 'server-backlog': 5,
+                  'server-workers': 0, 'detailed-response': True}
+
+        app._config = config
+        logging.disable(logging.CRITICAL)
+        try:
+            self.assertRaises(SystemExit, app.create_server, 0)
+
+            config['server-workers'] = 1
+            server = app.create_server(0)
+            server.server_close()
+
+        finally:
+            logging.disable(logging.NOTSET)
+            del app._config
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+
+class RepositoryClonerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def test_clone(self):
+        import time
+        import threading
+        from gitautodeploy.cloner import RepositoryCloner
+
+        lock = threading.Lock()
+        running = [0, 0]
+        release = threading.Event()
+
+        def clone(repo_config):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            release.wait()
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return repo_config['url'] != 'broken'
+
+        repo_configs = [{'url': 'repo-%s' % i, 'path': '/srv/%s' % i} for i in range(5)]
+        repo_configs.append({'url': 'broken', 'path': '/srv/broken'})
+
+        cloner = RepositoryCloner(clone, workers=2)
+        cloner.start(repo_configs)
+
+        status = cloner.get_status()
+        self.assertFalse(status['ready'])
+        self.assertEqual(status['total'], 6)
+        self.assertEqual(status['cloning'] + status['queued'], 6)
+
+        # URLs may include credentials, so they are not reported
+        self.assertEqual(status['repositories'][0]['path'], '/srv/0')
+        self.assertNotIn('url', status['repositories'][0])
+
+        # Not cloned yet
+        self.assertFalse(cloner.wait(repo_configs[-1], timeout=0.05))
+
+        release.set()
+
+        self.assertTrue(cloner.wait(repo_configs[-2]))
+        self.assertFalse(cloner.wait(repo_configs[-1]))
+        self.assertTrue(cloner.wait({'url': 'other', 'path': '/srv/other'}))
+
+        cloner.join()
+
+        status = cloner.get_status()
+        self.assertTrue(status['ready'])
+        self.assertEqual((status['cloned'], status['failed']), (5, 1))
+        self.assertEqual(running[1], 2)
+
+    def test_shared_state(self):
+        import shutil
+        import tempfile
+        import threading
+        from gitautodeploy.cloner import RepositoryCloner
+
+        release = threading.Event()
+        cloned = []
+
+        def clone(repo_config):
+            release.wait()
+            cloned.append(repo_config['url'])
+            return repo_config['url'] != 'broken'
+
+        repo_configs = [{'url': 'repo', 'path': '/srv/repo'}, {'url': 'broken', 'path': '/srv/broken'}]
+        state_dir = tempfile.mkdtemp()
+
+        try:
+            # The clones are queued before forking the worker processes, and
+            # started by one of them
+            cloner = RepositoryCloner(clone, workers=2, state_dir=state_dir)
+            cloner.add(repo_configs)
+
+            other = RepositoryCloner(clone, state_dir=state_dir)
+            other.add(repo_configs)
+            other.poll_interval = 0.01
+
+            cloner.start_workers()
+
+            self.assertFalse(other.wait(repo_configs[0], timeout=0.05))
+            self.assertEqual(other.get_status()['cloning'], 2)
+
+            release.set()
+
+            self.assertTrue(other.wait(repo_configs[0]))
+            self.assertFalse(other.wait(repo_configs[1]))
+            self.assertTrue(other.is_ready())
+
+            # A restarted process doesn't clone the repositories again
+            restarted = RepositoryCloner(clone, state_dir=state_dir)
+            restarted.add(repo_configs)
+            restarted.start_workers()
+
+            self.assertTrue(restarted.wait(repo_configs[0]))
+            self.assertEqual(sorted(cloned), ['broken', 'repo'])
+
+        finally:
+            release.set()
+            shutil.rmtree(state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+
+class DeployQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def test_single(self):
+        from gitautodeploy.deployqueue import DeployQueue
+
+        queue = DeployQueue()
+        self.assertEqual(queue.run('key', lambda x: x * 2, 21), (42, 0))
+        self.assertEqual(queue._states, {})
+
+    def test_burst(self):
+        import time
+        import threading
+        from gitautodeploy.deployqueue import DeployQueue
+
+        queue = DeployQueue()
+        started = threading.Event()
+        release = threading.Event()
+        deployed = []
+        results = {}
+
+        def deploy(n):
+            deployed.append(n)
+            started.set()
+            release.wait()
+            return n
+
+        def push(n):
+            results[n] = queue.run('key', deploy, n)
+
+        threads = []
+        for n in range(20):
+            thread = threading.Thread(target=push, args=(n,))
+            thread.start()
+            threads.append(thread)
+
+            # Wait for the first deploy to start, and let each push arrive in order
+            if n == 0:
+                started.wait()
+            else:
+                time.sleep(0.01)
+
+        release.set()
+
+        for thread in threads:
+            thread.join()
+
+        # The first push and the newest push are deployed
+        self.assertEqual(deployed, [0, 19])
+        self.assertEqual(results[0], (0, 0))
+        self.assertEqual(results[19], (19, 18))
+
+        for n in range(1, 19):
+            self.assertEqual(results[n], (None, None))
+
+        self.assertEqual(queue._states, {})
+
+    def test_independent_keys(self):
+        import threading
+        from gitautodeploy.deployqueue import DeployQueue
+
+        queue = DeployQueue()
+        started = threading.Event()
+        release = threading.Event()
+
+        def deploy():
+            started.set()
+            release.wait()
+            return 'a'
+
+        thread = threading.Thread(target=queue.run, args=('a', deploy))
+        thread.start()
+        started.wait()
+
+        # Deploys for other keys are not blocked
+        self.assertEqual(queue.run('b', lambda: 'b'), ('b', 0))
+
+        release.set()
+        thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
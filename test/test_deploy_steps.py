@@ -0,0 +1,151 @@
+import unittest
+
+
+class DeployStepsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def test_parse(self):
+        from gitautodeploy.deploysteps import parse_deploy_steps
+
+        steps = parse_deploy_steps([{'name': 'install', 'command': 'npm ci'},
+                                    {'command': 'make', 'depends': 'install'}],
+                                   'pre.sh', 'post.sh')
+
+        self.assertEqual([step['name'] for step in steps], ['global pre-deploy', 'install', 'make', 'global post-deploy'])
+        self.assertEqual(steps[1]['depends'], ['global pre-deploy'])
+        self.assertEqual(steps[2]['depends'], ['global pre-deploy', 'install'])
+        self.assertEqual(steps[3]['depends'], ['global pre-deploy', 'install', 'make'])
+
+    def test_invalid_steps(self):
+        from gitautodeploy.deploysteps import parse_deploy_steps
+
+        for steps_config in [[{'name': 'a'}],
+                             [{'command': 'a'}, {'command': 'a'}],
+                             [{'command': 'a', 'depends': ['b']}],
+                             [{'command': 'a', 'depends': ['b']}, {'command': 'b', 'depends': ['a']}]]:
+            self.assertRaises(ValueError, parse_deploy_steps, steps_config)
+
+        # The names of the global pre- and post-deploy steps are reserved,
+        # even if there are no global deploy commands
+        for name in ['global pre-deploy', 'global post-deploy']:
+            self.assertRaises(ValueError, parse_deploy_steps, [{'name': name, 'command': 'a'}])
+            self.assertRaises(ValueError, parse_deploy_steps, [{'name': name, 'command': 'a'}], 'pre.sh', 'post.sh')
+
+    def test_init_config(self):
+        from gitautodeploy.cli.config import init_config
+
+        config = {'global_deploy': ['pre.sh', ''],
+                  'repositories': [{'url': 'https://github.com/olipo186/Git-Auto-Deploy.git',
+                                    'deploy': [{'command': 'a'}, {'command': 'b', 'depends': ['a']}]}]}
+        repo_config = init_config(config)['repositories'][0]
+
+        self.assertEqual(repo_config['deploy_commands'], ['pre.sh', 'a', 'b'])
+        self.assertEqual([step['name'] for step in repo_config['deploy_steps']], ['global pre-deploy', 'a', 'b'])
+
+    def test_invalid_deploy_jobs(self):
+        from gitautodeploy.cli.config import init_config, get_config_defaults
+
+        for global_jobs, jobs in [(0, None), (4, 0), (4, -1), (4, '2')]:
+            config = get_config_defaults()
+            config['deploy-jobs'] = global_jobs
+            repo_config = {'url': 'https://github.com/olipo186/Git-Auto-Deploy.git'}
+            if jobs is not None:
+                repo_config['deploy-jobs'] = jobs
+            config['repositories'] = [repo_config]
+            self.assertRaises(ValueError, init_config, config)
+
+        config = get_config_defaults()
+        config['repositories'] = [{'url': 'https://github.com/olipo186/Git-Auto-Deploy.git', 'deploy-jobs': 1}]
+        self.assertEqual(init_config(config)['repositories'][0]['deploy-jobs'], 1)
+
+    def test_parallel_execution(self):
+        import time
+        import threading
+        from gitautodeploy.deploysteps import parse_deploy_steps, DeployStepsExecutor
+
+        steps = parse_deploy_steps([{'command': 'a'}, {'command': 'b'}, {'command': 'c'},
+                                    {'command': 'd', 'depends': ['a', 'b', 'c']}])
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def execute(step):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+            return 0
+
+        results = DeployStepsExecutor(steps, jobs=2).run(execute)
+
+        # At most two steps ran at the same time, and d started after the others
+        self.assertEqual(running[1], 2)
+        self.assertEqual([result['status'] for result in results], ['succeeded'] * 4)
+        self.assertEqual([result['exit_code'] for result in results], [0] * 4)
+        self.assertTrue(results[3]['started'] >= max(result['started'] + result['duration'] for result in results[:3]) - 0.01)
+
+        for result in results:
+            self.assertTrue(result['duration'] >= 0.09)
+
+    def test_failed_step(self):
+        from gitautodeploy.deploysteps import parse_deploy_steps, DeployStepsExecutor
+
+        steps = parse_deploy_steps([{'command': 'a'}, {'command': 'b', 'depends': ['a']},
+                                    {'command': 'c', 'depends': ['b']}, {'command': 'd'}],
+                                   None, 'post')
+        executed = []
+
+        def execute(step):
+            executed.append(step['name'])
+            return 1 if step['name'] == 'a' else 0
+
+        results = DeployStepsExecutor(steps).run(execute)
+
+        # The steps depending on a (directly or indirectly) are skipped
+        self.assertEqual(sorted(executed), ['a', 'd'])
+        self.assertEqual([result['status'] for result in results], ['failed', 'skipped', 'skipped', 'succeeded', 'skipped'])
+        self.assertEqual([result['exit_code'] for result in results], [1, None, None, 0, None])
+        self.assertEqual(results[1]['started'], None)
+
+    def test_deploy(self):
+        import os
+        import shutil
+        import tempfile
+        from gitautodeploy.deploysteps import parse_deploy_steps
+        from gitautodeploy.wrappers.git import GitWrapper
+
+        directory = tempfile.mkdtemp()
+
+        try:
+            steps = parse_deploy_steps([{'name': 'a', 'command': 'echo a > a'},
+                                        {'name': 'b', 'command': 'cat a; exit 3', 'depends': ['a']},
+                                        {'name': 'c', 'command': 'echo c', 'depends': ['b']}])
+            repo_config = {'path': directory, 'deploy_commands': [step['command'] for step in steps],
+                           'deploy_steps': steps, 'deploy-jobs': 2, 'deploy-output-size': 1024}
+            output = []
+            results = []
+
+            res = GitWrapper.deploy(repo_config, output=output, steps=results)
+
+            self.assertEqual(res, [0, 3, None])
+            self.assertEqual(output, ['', 'a\n'])
+            self.assertEqual([result['status'] for result in results], ['succeeded', 'failed', 'skipped'])
+            self.assertTrue(os.path.isfile(os.path.join(directory, 'a')))
+
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
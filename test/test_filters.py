@@ -0,0 +1,125 @@
+import unittest
+
+
+class FiltersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def create_request(self, payload):
+        import json
+        from gitautodeploy.models import WebhookRequest
+
+        return WebhookRequest({'Content-Type': 'application/json'}, json.dumps(payload))
+
+    def test_match_semantics(self):
+        from gitautodeploy.filters import CompiledFilters
+
+        request = self.create_request({
+            'action': 'opened',
+            'ref': 'refs/heads/master',
+            'pull_request': {'base': {'ref': 'master'}, 'merged': False}
+        })
+
+        def match(*filters):
+            return CompiledFilters(filters).match(request, 'closed')
+
+        # Literal values
+        self.assertTrue(match({'ref': 'refs/heads/master'}))
+        self.assertFalse(match({'ref': 'refs/heads/develop'}))
+        self.assertTrue(match({'pull_request.base.ref': 'master'}))
+        self.assertTrue(match({'pull_request.merged': False}))
+
+        # None is ignored, True only requires the path to exist
+        self.assertTrue(match({'ref': None, 'missing': None}))
+        self.assertTrue(match({'pull_request': True}))
+        self.assertFalse(match({'missing': True}))
+
+        # Invalid paths
+        self.assertFalse(match({'pull_request.head.ref': 'master'}))
+        self.assertFalse(match({'ref.name': 'master'}))
+
+        # The action filter also matches the action reported by the parser
+        self.assertTrue(match({'action': 'closed'}))
+        self.assertTrue(match({'action': 'opened'}))
+        self.assertFalse(match({'action': 'merged'}))
+
+        # All filters must match
+        self.assertTrue(match({'ref': 'refs/heads/master'}, {'pull_request': True}))
+        self.assertFalse(match({'ref': 'refs/heads/master'}, {'missing': True}))
+
+    def test_explain(self):
+        from gitautodeploy.filters import CompiledFilters
+
+        request = self.create_request({'ref': 'refs/heads/master'})
+        filters = CompiledFilters([{'ref': 'refs/heads/develop'}])
+
+        self.assertEqual(filters.explain(request, ''), "Filter 'ref' does not match ('refs/heads/develop' != 'refs/heads/master')")
+
+    def test_duplicate_conditions(self):
+        from gitautodeploy.filters import CompiledFilters
+
+        filters = CompiledFilters([{'ref': 'refs/heads/master', 'pull_request': True},
+                                   {'ref': 'refs/heads/master', 'commits': [1, 2]}])
+
+        self.assertEqual([c[0] for c in filters.conditions].count('ref'), 1)
+        self.assertEqual(len(filters.conditions), 3)
+
+    def test_globs(self):
+        from gitautodeploy.filters import compile_globs
+
+        regex = compile_globs(['services/api/', 'docs/*.md', '**/Dockerfile', 'lib/**/*.py', 'v?.[ch]'])
+
+        for name in ['services/api/main.py', 'services/api/a/b/c', 'docs/index.md', 'Dockerfile',
+                     'services/web/Dockerfile', 'lib/x.py', 'lib/a/b/x.py', 'v1.c', 'v2.h']:
+            self.assertTrue(regex.match(name), name)
+
+        for name in ['services/apis/main.py', 'docs/a/index.md', 'docs/index.mdx', 'Dockerfile.dev',
+                     'src/lib/x.py', 'v10.c', 'v1.o']:
+            self.assertFalse(regex.match(name), name)
+
+    def test_changed_paths(self):
+        from gitautodeploy.filters import CompiledFilters
+
+        request = self.create_request({
+            'ref': 'refs/heads/master',
+            'commits': [
+                {'added': ['services/api/new.py'], 'modified': [], 'removed': []},
+                {'added': [], 'modified': ['README.md'], 'removed': ['services/old/main.py']}
+            ]
+        })
+
+        def match(*filters):
+            return CompiledFilters(filters).match(request, '')
+
+        self.assertEqual(request.get_changed_files(), set(['services/api/new.py', 'README.md', 'services/old/main.py']))
+
+        self.assertTrue(match({'changed-paths': ['services/api/**']}))
+        self.assertTrue(match({'changed-paths': 'services/old/'}))
+        self.assertTrue(match({'changed-paths': ['services/web/**', '*.md']}))
+        self.assertFalse(match({'changed-paths': ['services/web/**']}))
+        self.assertFalse(match({'ref': 'refs/heads/master', 'changed-paths': ['services/web/**']}))
+        self.assertFalse(match({'changed-paths': ['services/api/**']}, {'changed-paths': ['services/web/**']}))
+
+        # Let the filter pass when the payload doesn't list all changed files
+        truncated = self.create_request({'total_commits_count': 21, 'commits': [
+            {'added': [], 'modified': ['README.md'], 'removed': []}
+        ]})
+
+        self.assertEqual(truncated.get_changed_files(), None)
+        self.assertTrue(CompiledFilters([{'changed-paths': ['services/web/**']}]).match(truncated, ''))
+
+        # ... or doesn't list any commits
+        empty = self.create_request({'commits': []})
+
+        self.assertEqual(empty.get_changed_files(), None)
+        self.assertTrue(CompiledFilters([{'changed-paths': ['services/web/**']}]).match(empty, ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
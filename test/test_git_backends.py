@@ -0,0 +1,127 @@
+import unittest
+from utils import GitTestCaseBase
+
+
+class GitBackendsTestCase(GitTestCaseBase):
+
+    def get_backends(self):
+        from gitautodeploy.wrappers.backends import get_git_backend
+
+        backends = ['shell']
+
+        # The in-process backend is optional
+        if get_git_backend('dulwich').name == 'dulwich':
+            backends.append('dulwich')
+
+        return backends
+
+    def test_unknown_backend(self):
+        from gitautodeploy.wrappers.backends import get_git_backend
+
+        self.assertEqual(get_git_backend('unknown').name, 'shell')
+        self.assertEqual(get_git_backend(None).name, 'shell')
+
+    def test_dulwich_version(self):
+        from gitautodeploy.wrappers import backends
+
+        # Versions without shallow fetches are not used
+        min_version = backends.DulwichGitBackend.min_version
+        cached = backends._backends.pop('dulwich', None)
+        backends.DulwichGitBackend.min_version = (999,)
+
+        try:
+            self.assertEqual(backends.get_git_backend('dulwich').name, 'shell')
+
+        finally:
+            backends.DulwichGitBackend.min_version = min_version
+            backends._backends.pop('dulwich', None)
+
+            if cached:
+                backends._backends['dulwich'] = cached
+
+    def test_dulwich_timeout(self):
+        from gitautodeploy.wrappers import ProcessWrapper
+        from gitautodeploy.wrappers import backends
+
+        if 'dulwich' not in self.get_backends():
+            return
+
+        fetches = []
+        fetch = backends.ShellGitBackend.fetch
+        backends.ShellGitBackend.fetch = lambda backend, *args: fetches.append(args) or 0
+
+        # Fetches within the process can't be interrupted, so the command
+        # line client is used when a timeout applies
+        try:
+            with ProcessWrapper.limits(command_timeout=10):
+                self.assertEqual(backends.get_git_backend('dulwich').fetch('/srv/a', 'origin', ['a:b']), 0)
+
+        finally:
+            backends.ShellGitBackend.fetch = fetch
+
+        self.assertEqual(fetches, [('/srv/a', 'origin', ['a:b'], None)])
+
+    def test_minimal_pull(self):
+        import os
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(files={'kept.txt': 'kept\n', 'changed.txt': 'old\n',
+                                                 'removed.txt': 'removed\n'})
+
+        paths = {}
+        for backend in self.get_backends():
+            paths[backend] = os.path.join(self.dir, backend)
+            self.git(self.dir, 'clone', '-q', remote, paths[backend])
+
+        self.git(work, 'rm', '-q', 'removed.txt')
+        commit = self.push(work, 'update', {'changed.txt': 'new\n', 'sub/added.txt': 'added\n'})
+
+        for backend, path in paths.items():
+            repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': 'master', 'tag': None,
+                           'pull-mode': 'minimal', 'git-backend': backend}
+
+            # Local modifications are discarded
+            self.write(os.path.join(path, 'kept.txt'), 'modified locally\n')
+
+            self.assertEqual(GitWrapper.pull(repo_config), 0)
+            self.assertEqual(GitWrapper.get_head(path, backend), commit)
+            self.assertEqual(self.git(path, 'symbolic-ref', 'HEAD'), 'refs/heads/master')
+            self.assertEqual(self.git(path, 'status', '--porcelain'), '')
+            self.assertEqual(open(os.path.join(path, 'kept.txt')).read(), 'kept\n')
+            self.assertEqual(open(os.path.join(path, 'changed.txt')).read(), 'new\n')
+            self.assertEqual(open(os.path.join(path, 'sub', 'added.txt')).read(), 'added\n')
+            self.assertFalse(os.path.exists(os.path.join(path, 'removed.txt')))
+
+    def test_tag(self):
+        import os
+        import time
+        from gitautodeploy.wrappers import GitWrapper, ProcessWrapper
+
+        remote, work = self.create_remote()
+
+        paths = {}
+        for backend in self.get_backends():
+            paths[backend] = os.path.join(self.dir, backend)
+            self.git(self.dir, 'clone', '-q', remote, paths[backend])
+
+        self.git(work, 'commit', '-q', '--allow-empty', '-m', 'release')
+        self.git(work, 'tag', '-a', '-m', 'v1', 'v1')
+        self.git(work, 'push', '-q', 'origin', 'refs/tags/v1')
+        commit = self.git(work, 'rev-parse', 'HEAD')
+
+        for backend, path in paths.items():
+            repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': None, 'tag': 'v1',
+                           'pull-mode': 'minimal', 'git-backend': backend}
+
+            self.assertEqual(GitWrapper.pull(repo_config), 0)
+            self.assertEqual(GitWrapper.get_head(path, backend), commit)
+            self.assertEqual(GitWrapper.resolve(path, 'refs/tags/v1', backend), commit)
+            self.assertEqual(self.git(path, 'rev-parse', '--symbolic-full-name', 'HEAD'), 'HEAD')
+
+        # Commands looking up commits are subject to the limits as well
+        with ProcessWrapper.limits(deadline=time.time() - 1):
+            self.assertEqual(GitWrapper.resolve(paths['shell'], 'refs/tags/v1', 'shell'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import unittest
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def wait_for(self, job):
+        import time
+
+        deadline = time.time() + 5
+        while not job.is_done():
+            self.assertTrue(time.time() < deadline, 'Timed out')
+            time.sleep(0.01)
+
+    def test_job_status(self):
+        import threading
+        from gitautodeploy.jobs import JobQueue
+
+        queue = JobQueue(workers=1)
+        release = threading.Event()
+
+        def target(value):
+            release.wait()
+            return [{'deploy': [value]}]
+
+        def fail():
+            raise Exception('broken')
+
+        try:
+            first = queue.submit(target, 0)
+            second = queue.submit(fail)
+
+            # The second job waits for the only worker
+            self.assertEqual(queue.get_status(second.id)['state'], 'queued')
+            self.assertEqual(queue.get_status(second.id)['wait_time'], None)
+
+            release.set()
+            self.wait_for(first)
+            self.wait_for(second)
+
+            status = queue.get_status(first.id)
+            self.assertEqual(status['state'], 'finished')
+            self.assertEqual(status['result'], [{'deploy': [0]}])
+            self.assertTrue(status['run_time'] >= 0 and status['wait_time'] >= 0)
+
+            status = queue.get_status(second.id)
+            self.assertEqual(status['state'], 'failed')
+            self.assertEqual(status['error'], 'broken')
+
+            self.assertEqual(queue.get_status('0' * 32), None)
+
+        finally:
+            queue.stop_workers()
+
+    def test_history(self):
+        from gitautodeploy.jobs import JobQueue
+
+        queue = JobQueue(workers=1, history=2)
+
+        try:
+            jobs = [queue.submit(lambda: None) for i in range(3)]
+
+            for job in jobs:
+                self.wait_for(job)
+
+            queue.submit(lambda: None)
+
+            # The oldest finished jobs are forgotten
+            self.assertEqual(queue.get_status(jobs[0].id), None)
+            self.assertEqual(queue.get_status(jobs[2].id)['state'], 'finished')
+
+        finally:
+            queue.stop_workers()
+
+    def test_shared_state(self):
+        import time
+        import shutil
+        import tempfile
+        from gitautodeploy.jobs import JobQueue
+
+        state_dir = tempfile.mkdtemp()
+        queue = JobQueue(workers=1, state_dir=state_dir)
+
+        try:
+            job = queue.submit(lambda: 42)
+
+            # Another process sharing the state directory sees the status
+            other = JobQueue(state_dir=state_dir)
+            self.assertTrue(other.get_status(job.id)['state'] in ['queued', 'running', 'finished'])
+
+            deadline = time.time() + 5
+            while other.get_status(job.id)['state'] != 'finished':
+                self.assertTrue(time.time() < deadline, 'Timed out')
+                time.sleep(0.01)
+
+            self.assertEqual(other.get_status(job.id)['result'], 42)
+
+        finally:
+            queue.stop_workers()
+            shutil.rmtree(state_dir)
+
+    def test_coalesced(self):
+        import threading
+        from gitautodeploy.jobs import JobQueue
+
+        queue = JobQueue(workers=1)
+        release = threading.Event()
+        started = []
+
+        def target(name):
+            started.append(name)
+            release.wait()
+
+        try:
+            running = queue.submit_coalesced([('/srv/a', 'master')], target, 'running')
+            while not started:
+                release.wait(0.01)
+
+            a = queue.submit_coalesced([('/srv/a', 'master')], target, 'a')
+            b = queue.submit_coalesced([('/srv/b', 'master')], target, 'b')
+            other = queue.submit(target, 'other')
+            ab = queue.submit_coalesced([('/srv/a', 'master'), ('/srv/b', 'master')], target, 'ab')
+
+            # Queued jobs deploying a subset of the keys are superseded, the
+            # running one and jobs without keys are not
+            self.assertEqual(queue.get_status(a.id)['state'], 'superseded')
+            self.assertEqual(queue.get_status(a.id)['superseded_by'], ab.id)
+            self.assertEqual(queue.get_status(b.id)['state'], 'superseded')
+            self.assertEqual(queue.get_status(other.id)['state'], 'queued')
+            self.assertEqual(queue.get_status(ab.id)['coalesced'], 2)
+
+            release.set()
+            self.wait_for(ab)
+
+            self.assertEqual(started, ['running', 'other', 'ab'])
+
+        finally:
+            release.set()
+            queue.stop_workers()
+
+    def test_request_burst(self):
+        import json
+        import threading
+        import mimetools
+        from StringIO import StringIO
+        from gitautodeploy.httpserver import WebhookRequestHandler
+        from gitautodeploy.jobs import JobQueue
+        from gitautodeploy.deployqueue import DeployQueue
+        from gitautodeploy.scheduler import DeployScheduler
+
+        url = 'https://github.com/olipo186/Git-Auto-Deploy.git'
+        config = {'detailed-response': False, 'repositories': [{'url': url, 'path': '/srv/a', 'branch': 'master'}]}
+        release = threading.Event()
+        deploys = []
+
+        class Handler(WebhookRequestHandler):
+            _config = config
+            _job_queue = JobQueue(workers=1)
+            _deploy_queue = DeployQueue()
+            _scheduler = DeployScheduler()
+
+            def __init__(self):
+                pass
+
+            def pull_and_deploy(self, repo_config, request):
+                deploys.append(request.get_target_commit())
+                release.wait()
+                return {'deploy': [0]}
+
+        def post(after):
+            body = json.dumps({'ref': 'refs/heads/master', 'after': after, 'repository': {'clone_url': url}})
+
+            handler = Handler()
+            handler.path = '/'
+            handler.client_address = ('127.0.0.1', 0)
+            handler.request_version = 'HTTP/1.0'
+            handler.requestline = 'POST / HTTP/1.0'
+            handler.headers = mimetools.Message(StringIO('X-GitHub-Event: push\r\nContent-Length: %s\r\n\r\n' % len(body)))
+            handler.rfile = StringIO(body)
+            handler.wfile = StringIO()
+            handler.wfile.close = lambda: None
+            handler.do_POST()
+
+            return json.loads(handler.wfile.getvalue().split('\r\n\r\n', 1)[1])['job']
+
+        try:
+            first = post('1' * 40)
+            while not deploys:
+                release.wait(0.01)
+
+            # Requests arriving while the first one is deployed wait for the
+            # only job worker, and are collapsed into the last one
+            jobs = [post(str(i) * 40) for i in range(2, 7)]
+
+            release.set()
+            self.wait_for(Handler._job_queue.get(jobs[-1]))
+
+            self.assertEqual(deploys, ['1' * 40, '6' * 40])
+            self.assertEqual(Handler._job_queue.get_status(first)['state'], 'finished')
+            self.assertEqual([Handler._job_queue.get_status(job)['state'] for job in jobs[:-1]], ['superseded'] * 4)
+            self.assertEqual(Handler._job_queue.get_status(jobs[-1])['coalesced'], 4)
+
+        finally:
+            release.set()
+            Handler._job_queue.stop_workers()
+
+    def test_request_burst_configs(self):
+        import json
+        import threading
+        import mimetools
+        from StringIO import StringIO
+        from gitautodeploy.httpserver import WebhookRequestHandler
+        from gitautodeploy.jobs import JobQueue
+        from gitautodeploy.deployqueue import DeployQueue
+        from gitautodeploy.scheduler import DeployScheduler
+
+        # Two configs deploying the same path and branch differently
+        url = 'https://github.com/olipo186/Git-Auto-Deploy.git'
+        config = {'detailed-response': False,
+                  'repositories': [{'url': url, 'path': '/srv/a', 'branch': 'master', 'deploy_commands': [name],
+                                    'filters': [{'pusher.name': name}]} for name in ['a', 'b']]}
+        release = threading.Event()
+        deploys = []
+
+        class Handler(WebhookRequestHandler):
+            _config = config
+            _job_queue = JobQueue(workers=1)
+            _deploy_queue = DeployQueue()
+            _scheduler = DeployScheduler()
+
+            def __init__(self):
+                pass
+
+            def pull_and_deploy(self, repo_config, request):
+                deploys.append((repo_config['deploy_commands'][0], request.get_target_commit()))
+                release.wait()
+                return {'deploy': [0]}
+
+        def post(name, after):
+            body = json.dumps({'ref': 'refs/heads/master', 'after': after, 'pusher': {'name': name},
+                               'repository': {'clone_url': url}})
+
+            handler = Handler()
+            handler.path = '/'
+            handler.client_address = ('127.0.0.1', 0)
+            handler.request_version = 'HTTP/1.0'
+            handler.requestline = 'POST / HTTP/1.0'
+            handler.headers = mimetools.Message(StringIO('X-GitHub-Event: push\r\nContent-Length: %s\r\n\r\n' % len(body)))
+            handler.rfile = StringIO(body)
+            handler.wfile = StringIO()
+            handler.wfile.close = lambda: None
+            handler.do_POST()
+
+            return json.loads(handler.wfile.getvalue().split('\r\n\r\n', 1)[1])['job']
+
+        try:
+            post('a', '1' * 40)
+            while not deploys:
+                release.wait(0.01)
+
+            # Jobs of one config only replace the jobs of the same config
+            jobs = [post(name, str(i) * 40) for i, name in [(2, 'a'), (3, 'b'), (4, 'a'), (5, 'b')]]
+
+            release.set()
+            self.wait_for(Handler._job_queue.get(jobs[-1]))
+
+            self.assertEqual(deploys, [('a', '1' * 40), ('a', '4' * 40), ('b', '5' * 40)])
+            self.assertEqual([Handler._job_queue.get_status(job)['state'] for job in jobs],
+                             ['superseded', 'superseded', 'finished', 'finished'])
+
+        finally:
+            release.set()
+            Handler._job_queue.stop_workers()
+
+
+if __name__ == '__main__':
+    unittest.main()
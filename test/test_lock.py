@@ -0,0 +1,108 @@
+import unittest
+
+
+class LockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import tempfile
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'status_running')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def test_obtain_release(self):
+        from gitautodeploy.lock import Lock
+
+        a = Lock(self.path)
+        b = Lock(self.path)
+
+        self.assertTrue(a.obtain())
+        self.assertTrue(a.has_lock())
+        self.assertFalse(b.obtain())
+        self.assertFalse(b.has_lock())
+        self.assertRaises(Exception, b.release)
+
+        a.release()
+        self.assertFalse(a.has_lock())
+        self.assertTrue(b.obtain())
+        b.release()
+
+    def test_timeout(self):
+        import time
+        from gitautodeploy.lock import Lock
+
+        a = Lock(self.path)
+        b = Lock(self.path)
+        self.assertTrue(a.obtain())
+
+        started = time.time()
+        self.assertFalse(b.obtain(blocking=True, timeout=0.2))
+        self.assertTrue(time.time() - started >= 0.2)
+
+        a.release()
+
+    def test_thread_handoff(self):
+        import time
+        import threading
+        from gitautodeploy.lock import Lock
+
+        a = Lock(self.path)
+        b = Lock(self.path)
+        obtained = []
+
+        self.assertTrue(a.obtain())
+
+        def wait():
+            b.obtain(blocking=True)
+            obtained.append(time.time())
+            b.release()
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual(obtained, [])
+
+        released = time.time()
+        a.release()
+        thread.join(5)
+
+        self.assertEqual(len(obtained), 1)
+        self.assertTrue(obtained[0] - released < 0.1)
+
+    def test_process_handoff(self):
+        import os
+        import time
+        from gitautodeploy.lock import Lock
+
+        a = Lock(self.path)
+        self.assertTrue(a.obtain())
+
+        pid = os.fork()
+
+        if pid == 0:
+            b = Lock(self.path)
+            code = 0 if b.obtain(blocking=True, timeout=5) else 1
+            os._exit(code)
+
+        time.sleep(0.1)
+        a.release()
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+        # The lock is released by the kernel when the owning process exits
+        self.assertTrue(a.obtain())
+        a.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
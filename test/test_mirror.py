@@ -0,0 +1,45 @@
+import unittest
+from utils import GitTestCaseBase
+
+
+class MirrorTestCase(GitTestCaseBase):
+
+    def test_worktrees(self):
+        import os
+        from gitautodeploy.cli.config import get_config_defaults, init_config
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(os.path.join(self.dir, 'remote', 'project.git'))
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/develop')
+
+        config = get_config_defaults()
+        config['mirror-dir'] = os.path.join(self.dir, 'mirrors')
+        config['repositories'] = [
+            {'url': remote, 'branch': 'master', 'path': os.path.join(self.dir, 'master')},
+            {'url': remote, 'branch': 'develop', 'path': os.path.join(self.dir, 'develop')}
+        ]
+        init_config(config)
+
+        master, develop = config['repositories']
+        self.assertEqual(master['mirror_path'], develop['mirror_path'])
+
+        for repo_config in config['repositories']:
+            self.assertEqual(GitWrapper.clone_worktree(repo_config), 0)
+            self.assertTrue(os.path.isfile(os.path.join(repo_config['path'], '.git')))
+
+        # A single fetch updates the objects for both worktrees
+        self.git(work, 'commit', '-q', '--allow-empty', '-m', 'update')
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master', 'HEAD:refs/heads/develop')
+        head = self.git(work, 'rev-parse', 'HEAD')
+
+        self.assertEqual(GitWrapper.pull(master), 0)
+        self.assertEqual(GitWrapper.get_head(master['path']), head)
+
+        # The mirror already has the pushed commit, so it is not fetched again
+        os.rename(remote, remote + '.moved')
+        self.assertEqual(GitWrapper.pull(develop, commit=head), 0)
+        self.assertEqual(GitWrapper.get_head(develop['path']), head)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -71,6 +71,11 @@ def suite():
 
     return suite
 
+def load_tests(loader, tests, pattern):
+    """Load the test cases from the samples dir when the tests are
+    discovered (see __main__.py)."""
+    return suite()
+
 def main():
     from unittest import TestResult
     #result = TestResult()
@@ -0,0 +1,90 @@
+import unittest
+from utils import GitTestCaseBase
+
+
+class RepositoryPrefetcherTestCase(GitTestCaseBase):
+
+    def test_schedule(self):
+        import time
+        import threading
+        from gitautodeploy.prefetcher import RepositoryPrefetcher
+
+        lock = threading.Lock()
+        running = [0, 0]
+        fetched = {}
+
+        def fetch(repo_config):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+                fetched[repo_config['path']] = fetched.get(repo_config['path'], 0) + 1
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            if repo_config['url'] == 'busy':
+                return None
+            return 0 if repo_config['url'] != 'broken' else 128
+
+        repo_configs = [{'url': 'repo-%s' % i, 'path': '/srv/%s' % i} for i in range(4)]
+        repo_configs.append({'url': 'broken', 'path': '/srv/broken'})
+        repo_configs.append({'url': 'busy', 'path': '/srv/busy'})
+        repo_configs.append({'url': 'disabled', 'path': '/srv/disabled', 'prefetch-interval': 0})
+
+        prefetcher = RepositoryPrefetcher(fetch, interval=0.05, jitter=0.5, workers=2)
+        prefetcher.start(repo_configs)
+        time.sleep(0.5)
+        prefetcher.stop()
+        time.sleep(0.05)
+
+        status = prefetcher.get_status()
+        repositories = dict((repo['path'], repo) for repo in status['repositories'])
+
+        # At most two fetches at a time, others are skipped
+        self.assertEqual(running[1], 2)
+        self.assertTrue(status['skipped'] > 0)
+        self.assertNotIn('/srv/disabled', fetched)
+        self.assertNotIn('/srv/disabled', repositories)
+        self.assertNotIn('url', repositories['/srv/0'])
+
+        self.assertTrue(repositories['/srv/0']['fetches'] > 0)
+        self.assertTrue(repositories['/srv/0']['freshness'] < 0.5)
+        self.assertEqual(repositories['/srv/broken']['failed'], repositories['/srv/broken']['fetches'])
+        self.assertEqual(repositories['/srv/broken']['freshness'], None)
+        self.assertEqual(repositories['/srv/busy']['fetches'], 0)
+        self.assertTrue(repositories['/srv/busy']['skipped'] > 0)
+
+        prefetcher.record_skipped_fetch(repo_configs[0])
+        self.assertEqual(prefetcher.get_status()['skipped_fetches'], 1)
+
+    def test_pull_prefetched(self):
+        import os
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(files={'README': 'initial\n'})
+
+        for mode in ['full', 'minimal']:
+            path = os.path.join(self.dir, mode)
+            self.git(self.dir, 'clone', '-q', remote, path)
+            repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': 'master', 'tag': None, 'pull-mode': mode}
+
+            commit = self.push(work, mode)
+
+            self.assertFalse(GitWrapper.is_fetched(repo_config, commit))
+            self.assertEqual(GitWrapper.prefetch(repo_config), 0)
+            self.assertTrue(GitWrapper.is_fetched(repo_config, commit))
+
+            # The working tree is only updated by the pull
+            self.assertNotEqual(GitWrapper.get_head(path), commit)
+
+            # Make the remote unavailable, the pull doesn't need it
+            os.rename(remote, remote + '.moved')
+
+            try:
+                self.assertEqual(GitWrapper.pull(repo_config, commit, fetch=False), 0)
+                self.assertEqual(GitWrapper.get_head(path), commit)
+            finally:
+                os.rename(remote + '.moved', remote)
+
+
+if __name__ == '__main__':
+    unittest.main()
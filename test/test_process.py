@@ -0,0 +1,182 @@
+import unittest
+
+
+class ProcessWrapperTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        class Handler(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.records = []
+
+            def emit(self, record):
+                import time
+                self.records.append((time.time(), record.levelname, record.getMessage()))
+
+        self.logger = logging.getLogger()
+        self.level = self.logger.level
+        self.handler = Handler()
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+    def test_stream(self):
+        from gitautodeploy.wrappers import ProcessWrapper
+
+        res = ProcessWrapper().call('echo first; sleep 0.3; echo error >&2; echo second; exit 3', shell=True)
+        self.assertEqual(res, 3)
+
+        messages = [(level, message) for when, level, message in self.handler.records]
+        self.assertIn(('INFO', 'first'), messages)
+        self.assertIn(('ERROR', 'error'), messages)
+        self.assertIn(('INFO', 'second'), messages)
+
+        # Lines are logged as they are produced
+        times = dict((message, when) for when, level, message in self.handler.records)
+        self.assertTrue(times['second'] - times['first'] > 0.2)
+
+    def test_output_buffer(self):
+        from gitautodeploy.wrappers import ProcessWrapper, OutputBuffer
+
+        output = OutputBuffer(100)
+        res = ProcessWrapper().call(['python', '-c', 'for i in range(1000): print("line %s" % i)'], output=output)
+        self.assertEqual(res, 0)
+
+        # Only the last lines are kept
+        self.assertEqual(output.getvalue(), ''.join('line %s\n' % i for i in range(989, 1000)))
+        self.assertEqual(len(self.handler.records), 1000)
+
+        # Of a line longer than the maximum size, the end is kept
+        output = OutputBuffer(100)
+        output.write('short')
+        output.write('x' * 149 + 'y')
+        self.assertEqual(output.getvalue(), 'x' * 98 + 'y\n')
+
+    def test_long_lines(self):
+        from gitautodeploy.wrappers import ProcessWrapper, OutputBuffer
+
+        output = OutputBuffer(10 * ProcessWrapper.max_line_length)
+        res = ProcessWrapper().call(['python', '-c', 'import sys; sys.stdout.write("x" * %s)' % (ProcessWrapper.max_line_length * 2 + 10)], output=output)
+        self.assertEqual(res, 0)
+
+        lengths = [len(message) for when, level, message in self.handler.records]
+        self.assertEqual(lengths, [ProcessWrapper.max_line_length, ProcessWrapper.max_line_length, 10])
+
+    def test_get_output(self):
+        from gitautodeploy.wrappers import ProcessWrapper
+
+        res, stdout = ProcessWrapper.get_output('printf "a\\0b\\nc"; echo error >&2; exit 2', shell=True)
+        self.assertEqual(res, 2)
+
+        # The output is returned as is, only stderr is logged
+        self.assertEqual(stdout, 'a\0b\nc')
+        self.assertEqual([(level, message) for when, level, message in self.handler.records], [('ERROR', 'error')])
+
+    def is_running(self, pid):
+        """Check if a process is running (and not a zombie waiting to be
+        reaped)."""
+        import os
+
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+
+        try:
+            return open('/proc/%s/stat' % pid).read().split(')')[-1].split()[0] != 'Z'
+        except IOError:
+            return True
+
+    def test_timeout(self):
+        import os
+        import time
+        import tempfile
+        from gitautodeploy.wrappers import ProcessWrapper
+
+        pid_file = tempfile.mktemp()
+
+        # The background process is killed along with the shell
+        started = time.time()
+        with ProcessWrapper.limits(command_timeout=0.3):
+            res = ProcessWrapper().call('sleep 30 & echo $! > %s; sleep 30; wait' % pid_file, shell=True)
+
+        self.assertEqual(res, 124)
+        self.assertTrue(time.time() - started < 5)
+
+        pid = int(open(pid_file).read())
+        os.remove(pid_file)
+        time.sleep(0.1)
+        self.assertFalse(self.is_running(pid))
+
+        # Processes finishing in time are not affected
+        with ProcessWrapper.limits(command_timeout=5):
+            self.assertEqual(ProcessWrapper().call('exit 3', shell=True), 3)
+
+    def test_deadline(self):
+        import time
+        from gitautodeploy.wrappers import ProcessWrapper
+
+        with ProcessWrapper.limits(deadline=time.time() + 0.3):
+            self.assertEqual(ProcessWrapper().call('true', shell=True), 0)
+            self.assertEqual(ProcessWrapper().call('sleep 30', shell=True), 124)
+
+            # No commands are started after the deadline
+            self.assertEqual(ProcessWrapper().call('true', shell=True), 124)
+
+        # The limits only apply within the with block
+        self.assertEqual(ProcessWrapper().call('true', shell=True), 0)
+
+    def test_limits(self):
+        import os
+        from gitautodeploy.wrappers import ProcessWrapper, OutputBuffer
+
+        output = OutputBuffer()
+        command = ['python', '-c', 'import os, resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0]); print(os.nice(0))']
+
+        with ProcessWrapper.limits(rlimits={'open-files': 64}, nice=5):
+            self.assertEqual(ProcessWrapper().call(command, output=output), 0)
+
+        self.assertEqual(output.getvalue().split(), ['64', str(os.nice(0) + 5)])
+
+    def test_ionice(self):
+        from gitautodeploy.wrappers import ProcessWrapper, OutputBuffer
+        from gitautodeploy.wrappers import process
+
+        output = OutputBuffer()
+
+        with ProcessWrapper.limits(ionice='best-effort:7'):
+            self.assertEqual(ProcessWrapper().call(['sh', '-c', 'ionice -p $$'], output=output), 0)
+
+        self.assertEqual(output.getvalue().strip(), 'best-effort: prio 7')
+
+        # Invalid levels are ignored
+        self.assertEqual(ProcessWrapper.get_ioprio_set('best-effort:8'), None)
+        self.assertEqual(ProcessWrapper.get_ioprio_set('best-effort:high'), None)
+
+        # The command runs anyway if the class can't be set, and the error
+        # is logged
+        process.IOPRIO_CLASSES['invalid'] = 7
+        try:
+            with ProcessWrapper.limits(ionice='invalid'):
+                self.assertEqual(ProcessWrapper().call('true', shell=True), 0)
+
+        finally:
+            del process.IOPRIO_CLASSES['invalid']
+
+        self.assertIn(('ERROR', 'Unable to set the I/O scheduling class to invalid: Invalid argument'),
+                      [(level, message) for when, level, message in self.handler.records])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+from utils import GitTestCaseBase
+
+
+class ProcessRepositoriesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def create_handler(self, config):
+        import time
+        import threading
+        from gitautodeploy.httpserver import WebhookRequestHandler
+
+        class Handler(WebhookRequestHandler):
+            _config = config
+
+            def __init__(self):
+                self.started = []
+                self.lock = threading.Lock()
+
+            def process_repository(self, repo_config, ref, request):
+                with self.lock:
+                    self.started.append((repo_config['name'], time.time()))
+                time.sleep(0.1)
+                return {'name': repo_config['name']}
+
+        return Handler()
+
+    def process(self, config):
+        import time
+        from gitautodeploy.models import WebhookRequest
+
+        repo_configs = [{'name': 'a1', 'path': '/srv/a'},
+                        {'name': 'b', 'path': '/srv/b'},
+                        {'name': 'a2', 'path': '/srv/a'},
+                        {'name': 'c'},
+                        {'name': 'd', 'filters': [{'ref': 'refs/heads/develop'}]}]
+
+        handler = self.create_handler(config)
+        request = WebhookRequest({}, '{"ref": "refs/heads/master"}')
+
+        started = time.time()
+        result = handler.process_repositories(repo_configs, 'refs/heads/master', '', request)
+        elapsed = time.time() - started
+
+        # Results are in config order, without the config not matching the filters
+        self.assertEqual([r['name'] for r in result], ['a1', 'b', 'a2', 'c'])
+
+        return handler.started, elapsed
+
+    def test_parallel(self):
+        started, elapsed = self.process({'parallel-repositories': True})
+
+        # Configs with the same path are processed in order
+        names = [name for name, t in started]
+        self.assertTrue(names.index('a1') < names.index('a2'))
+
+        self.assertTrue(elapsed < 0.3)
+
+    def test_sequential(self):
+        started, elapsed = self.process({'parallel-repositories': False})
+
+        self.assertEqual([name for name, t in started], ['a1', 'b', 'a2', 'c'])
+        self.assertTrue(elapsed >= 0.4)
+
+
+class DeployTestCase(GitTestCaseBase):
+
+    def create_repo_config(self, deploy_commands):
+        """Create a remote repository with a clone to deploy, and a repository
+        config for it."""
+        import os
+
+        self.remote, self.work = self.create_remote()
+        path = os.path.join(self.dir, 'deployed')
+        self.git(self.dir, 'clone', '-q', self.remote, path)
+
+        return {'url': self.remote, 'path': path, 'remote': 'origin', 'branch': 'master',
+                'pull-mode': 'minimal', 'deploy_commands': deploy_commands}
+
+    def process(self, repo_config, after, path='/', before=None):
+        """Process a push of a commit to master."""
+        import json
+        from gitautodeploy.models import WebhookRequest
+
+        request = WebhookRequest({}, json.dumps({'ref': 'refs/heads/master', 'before': before, 'after': after}), path)
+        return self.create_handler().process_repository(repo_config, 'refs/heads/master', request)
+
+    def test_up_to_date(self):
+        from gitautodeploy.deployed import DeployedCommit
+
+        repo_config = self.create_repo_config(['true'])
+        head = self.git(self.work, 'rev-parse', 'HEAD')
+
+        self.assertEqual(self.process(repo_config, head), {'git pull': 0, 'deploy': [0]})
+        self.assertEqual(DeployedCommit(repo_config).get(), head)
+
+        # Same commit again, before and after fetching
+        self.assertEqual(self.process(repo_config, head), {'up_to_date': True})
+        self.assertEqual(self.process(repo_config, '0' * 40), {'git pull': 0, 'up_to_date': True})
+
+        # The deployed commit is kept after a restart, but each repository
+        # config using the path has its own
+        self.assertEqual(self.process(dict(repo_config), head), {'up_to_date': True})
+        self.assertEqual(self.process(dict(repo_config, deploy_commands=['true', 'true']), head),
+                         {'git pull': 0, 'deploy': [0, 0]})
+
+        # Forced
+        self.assertEqual(self.process(repo_config, head, '/?force=1'), {'git pull': 0, 'deploy': [0]})
+
+    def test_clone_timeout(self):
+        import json
+        import threading
+        from gitautodeploy.cloner import RepositoryCloner
+        from gitautodeploy.models import WebhookRequest
+
+        repo_config = self.create_repo_config(['true'])
+        release = threading.Event()
+
+        handler = self.create_handler({'lock-timeout': 0.1})
+        handler._cloner = RepositoryCloner(lambda repo_config: release.wait() or True)
+        handler._cloner.start([repo_config])
+
+        request = WebhookRequest({}, json.dumps({'ref': 'refs/heads/master'}))
+
+        # Requests wait for the clone at most lock-timeout seconds
+        try:
+            self.assertEqual(handler.process_repository(repo_config, 'refs/heads/master', request),
+                             {'git clone': 1})
+        finally:
+            release.set()
+
+        handler._cloner.join()
+        self.assertEqual(handler.process_repository(repo_config, 'refs/heads/master', request),
+                         {'git pull': 0, 'deploy': [0]})
+
+    def test_deploy_environment(self):
+        import os
+
+        output = os.path.join(self.dir, 'output')
+        command = ('(echo "$GAD_BEFORE $GAD_AFTER $GAD_REF $GAD_CHANGED_FILES_COUNT"; '
+                   'test -z "$GAD_CHANGED_FILES" || cat "$GAD_CHANGED_FILES") > %s' % output)
+        repo_config = self.create_repo_config([command])
+
+        before = self.git(self.work, 'rev-parse', 'HEAD')
+        after = self.push(self.work, 'update', {'README': 'README\n', 'src/main.c': 'src/main.c\n'})
+
+        self.assertEqual(self.process(repo_config, after), {'git pull': 0, 'deploy': [0]})
+        self.assertEqual(open(output).read().splitlines(),
+                         ['%s %s master 2' % (before, after), 'README', 'src/main.c'])
+
+        # A forced deploy doesn't list changed files
+        self.assertEqual(self.process(repo_config, after, '/?force=1'), {'git pull': 0, 'deploy': [0]})
+        self.assertEqual(open(output).read().splitlines(), ['%s %s master ' % (after, after)])
+
+    def test_changed_paths(self):
+        repo_config = self.create_repo_config(['true'])
+        repo_config['filters'] = [{'changed-paths': ['src/']}]
+
+        # The payload doesn't list the changed files, so they are looked up
+        # once the pushed commits are fetched
+        before = self.git(self.work, 'rev-parse', 'HEAD')
+        after = self.push(self.work, 'docs', {'README': 'README\n'})
+        self.assertEqual(self.process(repo_config, after, before=before), {'git pull': 0, 'filtered': True})
+
+        before, after = after, self.push(self.work, 'update', {'src/main.c': 'src/main.c\n'})
+        self.assertEqual(self.process(repo_config, after, before=before), {'git pull': 0, 'deploy': [0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from utils import GitTestCaseBase
+
+
+class PullModesTestCase(GitTestCaseBase):
+
+    def clone(self, remote):
+        import os
+
+        path = os.path.join(self.dir, 'deployed')
+        self.git(self.dir, 'clone', '-q', remote, path)
+        return path
+
+    def create_repo_config(self, path, **kwargs):
+        repo_config = {'path': path, 'remote': 'origin', 'branch': 'master', 'tag': None}
+        repo_config.update(kwargs)
+        return repo_config
+
+    def test_minimal(self):
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(files={'file.txt': 'old\n'})
+        path = self.clone(remote)
+
+        # Only the configured branch is fetched
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/other')
+        commit = self.push(work, 'update', {'file.txt': 'new\n'})
+
+        repo_config = self.create_repo_config(path, **{'pull-mode': 'minimal'})
+
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertEqual(GitWrapper.get_head(path), commit)
+        self.assertEqual(self.git(path, 'for-each-ref', '--format=%(refname)', 'refs/remotes/origin/other'), '')
+
+    def test_fetch_depth(self):
+        import os
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(files={'file.txt': 'old\n'})
+        for i in range(3):
+            self.push(work, 'commit %s' % i)
+
+        # A shallow clone, holding only the last commit
+        path = os.path.join(self.dir, 'deployed')
+        self.git(self.dir, 'clone', '-q', '--depth', '1', 'file://' + remote, path)
+        self.assertEqual(self.git(path, 'rev-list', '--count', 'HEAD'), '1')
+
+        commit = self.push(work, 'update', {'file.txt': 'new\n'})
+        repo_config = self.create_repo_config(path, **{'pull-mode': 'minimal', 'fetch-depth': 1})
+
+        # The history of the fetched commit is not fetched
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertEqual(GitWrapper.get_head(path), commit)
+        self.assertEqual(self.git(path, 'rev-parse', '--is-shallow-repository'), 'true')
+        self.assertEqual(self.git(path, 'rev-list', '--count', 'HEAD'), '1')
+        self.assertEqual(open(os.path.join(path, 'file.txt')).read(), 'new\n')
+
+    def test_full(self):
+        from gitautodeploy.wrappers import GitWrapper
+
+        remote, work = self.create_remote(files={'file.txt': 'old\n'})
+        path = self.clone(remote)
+
+        # All branches are fetched
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/other')
+        commit = self.push(work, 'update', {'file.txt': 'new\n'})
+
+        repo_config = self.create_repo_config(path)
+
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertEqual(GitWrapper.get_head(path), commit)
+        self.assertNotEqual(self.git(path, 'for-each-ref', '--format=%(refname)', 'refs/remotes/origin/other'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
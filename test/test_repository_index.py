@@ -0,0 +1,57 @@
+import unittest
+
+
+class RepositoryIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def test_build_index(self):
+        from gitautodeploy.parsers.common import build_repository_index
+
+        a = {'url': 'https://github.com/owner/a.git', 'path': '/srv/a'}
+        a_staging = {'url': 'git@github.com:owner/a.git', 'path': '/srv/a-staging'}
+        b = {'url': 'https://github.com/owner/b.git'}
+
+        index = build_repository_index([a, {'path': '/srv/no-url'}, b, a_staging])
+
+        # Configs without a URL are left out, configs of the same repository
+        # share a key and keep their configured order
+        self.assertEqual(index, {('github.com', 'owner', 'a'): [a, a_staging],
+                                 ('github.com', 'owner', 'b'): [b]})
+
+    def test_init_config(self):
+        from gitautodeploy.cli.config import init_config
+        from gitautodeploy.parsers.common import WebhookRequestParser
+
+        config = init_config({'repositories': [{'url': 'https://github.com/owner/repo-%s.git' % i}
+                                               for i in range(10000)]})
+
+        self.assertEqual(len(config['repository_index']), 10000)
+
+        # Lookups use the index built when the config was initialized
+        del config['repositories'][:]
+        parser = WebhookRequestParser(config)
+
+        configs = parser.get_matching_repo_configs(['https://github.com/owner/repo-9999',
+                                                    'git@github.com:owner/repo-9999.git',
+                                                    'https://github.com/owner/unknown.git'])
+
+        self.assertEqual([c['url'] for c in configs], ['https://github.com/owner/repo-9999.git'])
+
+    def test_no_match(self):
+        from gitautodeploy.parsers.common import WebhookRequestParser
+
+        parser = WebhookRequestParser({'repositories': [{'url': 'https://github.com/owner/a.git'}]})
+
+        self.assertEqual(parser.get_matching_repo_configs([]), [])
+        self.assertEqual(parser.get_matching_repo_configs(['https://gitlab.com/owner/a.git']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
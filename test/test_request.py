@@ -0,0 +1,80 @@
+import unittest
+
+
+class WebhookRequestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def test_headers(self):
+        from gitautodeploy.models import WebhookRequest
+
+        request = WebhookRequest({'X-GitHub-Event': 'push', 'Content-Type': 'application/json'}, '{}')
+
+        self.assertEqual(request.headers, {'x-github-event': 'push', 'content-type': 'application/json'})
+
+    def test_payload_decoded_once(self):
+        import json
+        from gitautodeploy.models import WebhookRequest
+        from gitautodeploy.httpserver import WebhookRequestHandler
+        from gitautodeploy.parsers import GitHubRequestParser
+
+        calls = []
+        loads = json.loads
+
+        def counting_loads(*args, **kwargs):
+            calls.append(args)
+            return loads(*args, **kwargs)
+
+        config = {'repositories': [{'url': 'https://github.com/olipo186/Git-Auto-Deploy.git'}]}
+        body = json.dumps({'ref': 'refs/heads/master',
+                           'repository': {'clone_url': 'https://github.com/olipo186/Git-Auto-Deploy.git'}})
+        request = WebhookRequest({'X-GitHub-Event': 'push'}, body)
+
+        json.loads = counting_loads
+        try:
+            # Service detection, parsing and filters share the payload
+            self.assertEqual(WebhookRequestHandler.figure_out_service_from_request(request), GitHubRequestParser)
+            repo_configs, ref, action, urls = GitHubRequestParser(config).get_repo_params_from_request(request)
+            self.assertEqual(request.payload['ref'], 'refs/heads/master')
+
+        finally:
+            json.loads = loads
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(repo_configs), 1)
+        self.assertEqual(ref, 'refs/heads/master')
+
+    def test_invalid_payload(self):
+        from gitautodeploy.models import WebhookRequest
+
+        request = WebhookRequest({}, 'not json')
+
+        self.assertRaises(ValueError, lambda: request.payload)
+        self.assertEqual(request.get_target_commit(), None)
+
+    def test_params(self):
+        from gitautodeploy.models import WebhookRequest
+
+        self.assertFalse(WebhookRequest({}, '{}', '/').is_forced())
+        self.assertFalse(WebhookRequest({}, '{}', '/?force=0').is_forced())
+        self.assertTrue(WebhookRequest({}, '{}', '/?force=1').is_forced())
+        self.assertTrue(WebhookRequest({}, '{}', '/?force').is_forced())
+
+    def test_target_commit(self):
+        from gitautodeploy.models import WebhookRequest
+
+        self.assertEqual(WebhookRequest({}, '{"after": "%s"}' % ('a' * 40)).get_target_commit(), 'a' * 40)
+
+        # Deleted branches and payloads without a commit id
+        self.assertEqual(WebhookRequest({}, '{"after": "%s"}' % ('0' * 40)).get_target_commit(), None)
+        self.assertEqual(WebhookRequest({}, '{}').get_target_commit(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
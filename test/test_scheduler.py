@@ -0,0 +1,132 @@
+import unittest
+
+
+class DeploySchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+    def start(self, scheduler, repo_config, started):
+        import threading
+
+        def run():
+            slot, wait_time = scheduler.acquire(repo_config)
+            started.append(repo_config['url'])
+            scheduler.release(slot)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def await_waiting(self, scheduler, count):
+        import time
+
+        while len(scheduler._waiting) < count:
+            time.sleep(0.001)
+
+    def test_unlimited(self):
+        from gitautodeploy.scheduler import DeployScheduler
+
+        scheduler = DeployScheduler()
+        slot, wait_time = scheduler.acquire({'url': 'a'})
+        self.assertEqual(wait_time, None)
+        scheduler.release(slot)
+
+    def test_priority(self):
+        from gitautodeploy.scheduler import DeployScheduler
+
+        scheduler = DeployScheduler(max_deploys=1)
+        started = []
+
+        slot, wait_time = scheduler.acquire({'url': 'first'})
+        self.assertTrue(wait_time >= 0)
+
+        threads = []
+        for n, priority in enumerate([0, 5, 0, 10]):
+            threads.append(self.start(scheduler, {'url': 'repo-%s' % n, 'deploy-priority': priority}, started))
+            self.await_waiting(scheduler, n + 1)
+
+        self.assertEqual(scheduler.get_status()['waiting'], 4)
+        scheduler.release(slot)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(started, ['repo-3', 'repo-1', 'repo-0', 'repo-2'])
+
+        status = scheduler.get_status()
+        self.assertEqual(status['deploys'], 5)
+        self.assertEqual(status['running'], 0)
+        self.assertTrue(status['max_wait_time'] > 0)
+
+    def test_group_and_repo_limits(self):
+        from gitautodeploy.scheduler import DeployScheduler
+
+        scheduler = DeployScheduler(max_deploys=3, group_limits={'heavy': 1})
+        started = []
+
+        heavy, _ = scheduler.acquire({'url': 'a', 'deploy-group': 'heavy'})
+        repo, _ = scheduler.acquire({'url': 'git@github.com:o/b.git', 'max-concurrent-deploys': 1})
+
+        # Blocked by the group and repository limits, with higher priority
+        threads = [self.start(scheduler, {'url': 'c', 'deploy-group': 'heavy', 'deploy-priority': 1}, started),
+                   self.start(scheduler, {'url': 'https://github.com/o/b', 'max-concurrent-deploys': 1, 'deploy-priority': 1}, started)]
+        self.await_waiting(scheduler, 2)
+
+        # Doesn't have to wait for the blocked deploys
+        other, wait_time = scheduler.acquire({'url': 'd'})
+        self.assertEqual(started, [])
+
+        scheduler.release(other)
+        scheduler.release(heavy)
+        scheduler.release(repo)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(started), ['c', 'https://github.com/o/b'])
+
+    def test_slot_dir(self):
+        import time
+        import shutil
+        import tempfile
+        from gitautodeploy.scheduler import DeployScheduler
+
+        slot_dir = tempfile.mkdtemp()
+
+        try:
+            # Schedulers of different processes sharing the slot directory
+            first = DeployScheduler(group_limits={'heavy': 2}, slot_dir=slot_dir)
+            second = DeployScheduler(group_limits={'heavy': 2}, slot_dir=slot_dir)
+            started = []
+
+            slots = [first.acquire({'url': 'a', 'deploy-group': 'heavy'})[0],
+                     first.acquire({'url': 'b', 'deploy-group': 'heavy'})[0]]
+
+            # Deploys without limits don't wait
+            other, wait_time = second.acquire({'url': 'c'})
+            second.release(other)
+
+            thread = self.start(second, {'url': 'd', 'deploy-group': 'heavy'}, started)
+            time.sleep(0.1)
+            self.assertEqual(started, [])
+
+            first.release(slots[0])
+            thread.join()
+
+            self.assertEqual(started, ['d'])
+            self.assertTrue(second.get_status()['max_wait_time'] >= 0.1)
+
+            first.release(slots[1])
+
+        finally:
+            shutil.rmtree(slot_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def create_handler_class(self, release):
+        """Request handler answering POST requests once release is set."""
+        from BaseHTTPServer import BaseHTTPRequestHandler
+
+        class Handler(BaseHTTPRequestHandler):
+            started = []
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.getheader('content-length')))
+                Handler.started.append(self.path)
+                release.wait()
+
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(self.path)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def post(self, port, path):
+        """Send a request without waiting for the response."""
+        import socket
+
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall('POST %s HTTP/1.0\r\nContent-Length: 2\r\n\r\n{}' % path)
+        return sock
+
+    def read_response(self, sock):
+        data = ''
+
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        sock.close()
+        return data
+
+    def wait_for(self, condition):
+        import time
+
+        deadline = time.time() + 5
+        while not condition():
+            self.assertTrue(time.time() < deadline, 'Timed out')
+            time.sleep(0.01)
+
+    def test_thread_pool_backlog(self):
+        import threading
+        from gitautodeploy.httpserver import ThreadPoolHTTPServer
+
+        release = threading.Event()
+        Handler = self.create_handler_class(release)
+        server = ThreadPoolHTTPServer(('127.0.0.1', 0), Handler, backlog=1, workers=1)
+        port = server.socket.getsockname()[1]
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        try:
+            # The first request keeps the only worker busy, the second one is
+            # queued
+            running = self.post(port, '/running')
+            self.wait_for(lambda: Handler.started == ['/running'])
+
+            queued = self.post(port, '/queued')
+            self.wait_for(lambda: server._queue.qsize() == 1)
+
+            # The backlog is full, so the third request is rejected right away
+            rejected = self.read_response(self.post(port, '/rejected'))
+            self.assertTrue(rejected.startswith('HTTP/1.0 503 '))
+
+            release.set()
+
+            self.assertTrue(self.read_response(running).endswith('/running'))
+            self.assertTrue(self.read_response(queued).endswith('/queued'))
+            self.assertEqual(Handler.started, ['/running', '/queued'])
+
+        finally:
+            release.set()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_reuse_port(self):
+        import socket
+        from BaseHTTPServer import BaseHTTPRequestHandler
+        from gitautodeploy.httpserver import WebhookHTTPServer
+
+        first = WebhookHTTPServer(('127.0.0.1', 0), BaseHTTPRequestHandler, reuse_port=True)
+        port = first.socket.getsockname()[1]
+
+        try:
+            # Other sockets can be bound to the same port only if they allow it
+            self.assertRaises(socket.error, WebhookHTTPServer, ('127.0.0.1', port), BaseHTTPRequestHandler)
+
+            second = WebhookHTTPServer(('127.0.0.1', port), BaseHTTPRequestHandler, reuse_port=True)
+            self.assertEqual(second.socket.getsockname()[1], port)
+            self.assertEqual(second.socket.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT), 1)
+            second.server_close()
+
+        finally:
+            first.server_close()
+
+    def create_app(self, processes):
+        """Create a GitAutoDeploy instance (not the singleton) using
+        multiple server processes."""
+        from gitautodeploy.cli.config import get_config_defaults
+        from gitautodeploy.gitautodeploy import GitAutoDeploy
+
+        class App(GitAutoDeploy):
+            _instance = None
+            _workers = {}
+            worker_restart_delay = 0.01
+            max_worker_restarts = 3
+
+        config = get_config_defaults()
+        config.update({'host': '127.0.0.1', 'server-processes': processes, 'pidfilepath': None, 'intercept-stdout': False,
+                       'repositories': []})
+
+        app = App()
+        app._config = config
+        app._server = app.create_server(0, reuse_port=True)
+        app._port = app._server.socket.getsockname()[1]
+
+        return app
+
+    def test_prefork(self):
+        import os
+        import json
+        import signal
+        import urllib2
+        import threading
+
+        app = self.create_app(2)
+        thread = threading.Thread(target=app.serve_forever_prefork)
+        thread.start()
+
+        try:
+            self.wait_for(lambda: len(app._workers) == 2)
+
+            # The worker processes answer requests on the shared port
+            for i in range(10):
+                response = urllib2.urlopen('http://127.0.0.1:%s/ready' % app._port, timeout=5)
+                self.assertEqual(json.loads(response.read()), {'ready': True})
+
+            # A worker that exits is restarted
+            pid = app._workers.keys()[0]
+            os.kill(pid, signal.SIGKILL)
+            self.wait_for(lambda: pid not in app._workers and len(app._workers) == 2)
+
+            response = urllib2.urlopen('http://127.0.0.1:%s/ready' % app._port, timeout=5)
+            self.assertEqual(response.getcode(), 200)
+
+        finally:
+            app.stop()
+            thread.join()
+
+        self.assertEqual(app._workers, {})
+
+    def test_prefork_restart_limit(self):
+        import os
+        import time
+
+        app = self.create_app(2)
+        starts = []
+
+        def start_worker_process(worker_id, inherit_server=False):
+            starts.append((worker_id, time.time()))
+            pid = os.fork()
+
+            # Workers exiting right away
+            if pid == 0:
+                os._exit(1)
+
+            app._workers[pid] = worker_id
+            return pid
+
+        app.start_worker_process = start_worker_process
+
+        self.assertRaises(SystemExit, app.serve_forever_prefork)
+
+        # A worker is restarted at most 3 times in a row, with an increasing
+        # delay
+        counts = [len([t for i, t in starts if i == worker_id]) for worker_id in range(2)]
+        self.assertEqual(max(counts), 4)
+
+        times = [t for i, t in starts if i == counts.index(4)]
+        delays = [b - a for a, b in zip(times, times[1:])]
+        self.assertTrue(delays[0] >= 0.01 and delays[1] >= 0.02 and delays[2] >= 0.04)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+
+class SubmodulesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import sys
+        import os
+        import tempfile
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+        self.dir = tempfile.mkdtemp()
+
+        # Allow submodules with local URLs
+        self.environ = dict(os.environ)
+        os.environ.update({'GIT_CONFIG_COUNT': '1',
+                           'GIT_CONFIG_KEY_0': 'protocol.file.allow',
+                           'GIT_CONFIG_VALUE_0': 'always'})
+
+    def tearDown(self):
+        import os
+        import shutil
+
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir)
+
+    def git(self, cwd, *args):
+        import os
+        import subprocess
+
+        env = dict(os.environ, GIT_AUTHOR_NAME='gad', GIT_AUTHOR_EMAIL='gad@localhost',
+                   GIT_COMMITTER_NAME='gad', GIT_COMMITTER_EMAIL='gad@localhost')
+        return subprocess.check_output(('git',) + args, cwd=cwd, env=env, stderr=subprocess.STDOUT).strip()
+
+    def create_repo(self, name):
+        import os
+
+        remote = os.path.join(self.dir, name + '.git')
+        work = os.path.join(self.dir, name)
+        self.git(self.dir, 'init', '-q', '--bare', remote)
+        self.git(self.dir, 'clone', '-q', remote, work)
+        self.git(work, 'commit', '-q', '--allow-empty', '-m', 'initial')
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+        return remote, work
+
+    def test_update(self):
+        import os
+        import time
+        from gitautodeploy.wrappers import GitWrapper, ProcessWrapper
+
+        sub_remote, sub_work = self.create_repo('sub')
+        remote, work = self.create_repo('super')
+
+        self.git(work, 'submodule', '-q', 'add', sub_remote, 'libs/a')
+        self.git(work, 'submodule', '-q', 'add', sub_remote, 'libs/b')
+        self.git(work, 'commit', '-q', '-m', 'submodules')
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        path = os.path.join(self.dir, 'deploy')
+        self.git(self.dir, 'clone', '-q', remote, path)
+        repo_config = {'url': remote, 'path': path, 'remote': 'origin', 'branch': 'master', 'pull-mode': 'minimal'}
+
+        # Not checked out yet
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertTrue(os.path.exists(os.path.join(path, 'libs', 'a', '.git')))
+        self.assertTrue(os.path.exists(os.path.join(path, 'libs', 'b', '.git')))
+        self.assertEqual(GitWrapper.get_submodule_paths(path), ['libs/a', 'libs/b'])
+
+        # A change not touching the submodules
+        before = GitWrapper.get_head(path)
+        with open(os.path.join(work, 'README'), 'w') as f:
+            f.write('readme\n')
+        self.git(work, 'add', 'README')
+        self.git(work, 'commit', '-q', '-m', 'readme')
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertEqual(GitWrapper.get_changed_submodules(path, before, GitWrapper.get_head(path)), [])
+
+        # Move one submodule
+        self.git(sub_work, 'commit', '-q', '--allow-empty', '-m', 'update')
+        self.git(sub_work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+        sub_head = self.git(sub_work, 'rev-parse', 'HEAD')
+
+        self.git(os.path.join(work, 'libs', 'b'), 'pull', '-q', 'origin', 'master')
+        self.git(work, 'commit', '-q', '-am', 'update b')
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        before = GitWrapper.get_head(path)
+        self.assertEqual(GitWrapper.pull(repo_config), 0)
+        self.assertEqual(GitWrapper.get_changed_submodules(path, before, GitWrapper.get_head(path)), ['libs/b'])
+
+        # The limits apply to the lookup as well
+        after = GitWrapper.get_head(path)
+        with ProcessWrapper.limits(deadline=time.time() - 1):
+            self.assertEqual(GitWrapper.get_changed_submodules(path, before, after), None)
+        self.assertEqual(GitWrapper.get_head(os.path.join(path, 'libs', 'b')), sub_head)
+        self.assertNotEqual(GitWrapper.get_head(os.path.join(path, 'libs', 'a')), sub_head)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,9 +7,17 @@ class WebhookTestCaseBase(unittest.TestCase):
     def setUp(self):
         import sys
 
+        # Modules imported by other test cases (run in the same process) are
+        # put aside, so that GAD is imported again, using the stub modules
+        self.modules = {}
+        for name in list(sys.modules):
+            if is_gad_module(name):
+                self.modules[name] = sys.modules.pop(name)
+
         # Use our custom importer to replace certain modules with stub modules to
         # enable testing of other parts of GAD
-        sys.meta_path.append(StubImporter())
+        self.importer = StubImporter()
+        sys.meta_path.append(self.importer)
 
     def start_gad(self, test_config):
         import sys
@@ -52,7 +60,106 @@ class WebhookTestCaseBase(unittest.TestCase):
             current_thread.join()
 
     def tearDown(self):
-        pass
+        import sys
+
+        # Restore the modules imported by other test cases
+        sys.meta_path.remove(self.importer)
+
+        for name in list(sys.modules):
+            if is_gad_module(name):
+                del sys.modules[name]
+
+        sys.modules.update(self.modules)
+
+
+def is_gad_module(name):
+    """Check if a module is (part of) GAD, or one of the stub modules
+    replacing its wrappers."""
+    return name == 'gitautodeploy' or name.startswith('gitautodeploy.') or name in ['git', 'process']
+
+
+class GitTestCaseBase(unittest.TestCase):
+    """Base class of test cases working with real git repositories, created
+    in a temporary directory (self.dir) that is removed afterwards."""
+
+    def setUp(self):
+        import sys
+        import os
+        import tempfile
+        import logging
+
+        # Add repo root to sys path
+        repo_root = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+        sys.path.insert(1, repo_root)
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def git(self, cwd, *args):
+        """Run a git command and return its output."""
+        import os
+        import subprocess
+
+        env = dict(os.environ, GIT_AUTHOR_NAME='gad', GIT_AUTHOR_EMAIL='gad@localhost',
+                   GIT_COMMITTER_NAME='gad', GIT_COMMITTER_EMAIL='gad@localhost')
+        return subprocess.check_output(('git',) + args, cwd=cwd, env=env, stderr=subprocess.STDOUT).strip()
+
+    def write(self, path, data):
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def create_remote(self, remote=None, files=None):
+        """Create a bare repository (remote.git unless specified) and a clone
+        of it (work), and push an initial commit adding the files (a dict of
+        names and contents) to master. Returns the paths of both."""
+        import os
+
+        remote = remote or os.path.join(self.dir, 'remote.git')
+        work = os.path.join(self.dir, 'work')
+
+        self.git(self.dir, 'init', '-q', '--bare', remote)
+        self.git(self.dir, 'clone', '-q', remote, work)
+        self.push(work, 'initial', files)
+
+        return remote, work
+
+    def push(self, work, message, files=None):
+        """Commit the files (a dict of names and contents) in a clone and push
+        the commit to master. Returns the commit id."""
+        import os
+
+        for name, data in (files or {}).items():
+            if not os.path.isdir(os.path.dirname(os.path.join(work, name))):
+                os.makedirs(os.path.dirname(os.path.join(work, name)))
+
+            self.write(os.path.join(work, name), data)
+            self.git(work, 'add', name)
+
+        self.git(work, 'commit', '-q', '--allow-empty', '-m', message)
+        self.git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/master')
+
+        return self.git(work, 'rev-parse', 'HEAD')
+
+    def create_handler(self, config=None):
+        """Create a request handler processing repositories without an HTTP
+        connection."""
+        from gitautodeploy.httpserver import WebhookRequestHandler
+        from gitautodeploy.deployqueue import DeployQueue
+        from gitautodeploy.scheduler import DeployScheduler
+
+        class Handler(WebhookRequestHandler):
+            _config = config or {}
+            _deploy_queue = DeployQueue()
+            _scheduler = DeployScheduler()
+
+            def __init__(self):
+                pass
+
+        return Handler()
 
 
 class StubImporter(object):